@@ -0,0 +1,69 @@
+"""Compare building a collection with another version of the module.
+
+Run from the project root, giving the module to compare with, such as the
+one of an earlier revision::
+
+    git show REVISION:collection_json.py > /tmp/collection_json_base.py
+    python -m benchmarks.bench_build --baseline /tmp/collection_json_base.py
+
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+import argparse
+import json
+import timeit
+
+import collection_json
+
+from .generators import make_json
+
+
+def load_module(path):
+    """Return the module in the file at path, under another name."""
+    try:
+        from importlib.util import module_from_spec, spec_from_file_location
+    except ImportError:
+        import imp
+        return imp.load_source('collection_json_baseline', path)
+    spec = spec_from_file_location('collection_json_baseline', path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def best(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def timings(module, text, repeat):
+    """Return the build and from_json seconds, and the Data microseconds."""
+    Collection = module.Collection
+    Data = module.Data
+    members = json.loads(text)['collection']
+    return [
+        best(lambda: Collection(**members), repeat),
+        best(lambda: Collection.from_json(text), repeat),
+        best(lambda: [Data('name', 'value') for _ in range(10000)],
+             repeat) * 100,
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--baseline', required=True,
+                        help='path of the collection_json.py to compare with')
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    text = make_json(args.items)
+    print('%d items, %d bytes' % (args.items, len(text)))
+    print('%-10s %10s %10s %10s' % ('module', 'build', 'from_json',
+                                    'Data (us)'))
+    for name, module in (('baseline', load_module(args.baseline)),
+                         ('current', collection_json)):
+        print('%-10s %9.3fs %9.3fs %10.2f' % tuple(
+            [name] + timings(module, text, args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Compare the available JSON codecs on a large collection.
+
+Run from the project root::
+
+    python -m benchmarks.bench_codecs --items 100000
+
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+import argparse
+import timeit
+
+from collection_json import Collection, available_codecs
+
+from .generators import make_json
+
+
+def best(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    text = make_json(args.items)
+    data = text.encode('utf-8')
+    collection = Collection.from_json(text)
+    print('%d items, %d bytes' % (args.items, len(data)))
+    print('%-12s %10s %10s %10s %10s' % (
+        'codec', 'loads str', 'loads b', 'dumps str', 'dumps b'))
+    for name in available_codecs():
+        timings = [
+            best(lambda: Collection.from_json(text, codec=name), args.repeat),
+            best(lambda: Collection.from_json(data, codec=name), args.repeat),
+            best(lambda: collection.to_json(codec=name), args.repeat),
+            best(lambda: collection.to_json_bytes(codec=name), args.repeat),
+        ]
+        print('%-12s %9.3fs %9.3fs %9.3fs %9.3fs' % tuple([name] + timings))
+
+
+if __name__ == '__main__':
+    main()
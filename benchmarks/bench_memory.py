@@ -0,0 +1,64 @@
+"""Measure the memory retained by parsed collections.
+
+Run from the project root::
+
+    python -m benchmarks.bench_memory --items 100000
+
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+import argparse
+import gc
+import tracemalloc
+
+from collection_json import Array, Collection, Item
+
+from .generators import BASE_URL, make_document, make_json, make_rows
+
+
+def retained(func):
+    """Return the bytes allocated by func that are still alive after it."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--data', type=int, default=10)
+    parser.add_argument('--links', type=int, default=1)
+    args = parser.parse_args()
+
+    items = make_document(args.items, args.data, args.links)[
+        'collection']['items']
+    text = make_json(args.items, args.data, args.links)
+    columns, rows = make_rows(args.items, args.data)
+    decoded = retained(lambda: make_document(args.items, args.data,
+                                             args.links))
+    built = retained(lambda: Array(Item, 'items', items))
+    parsed = retained(lambda: Collection.from_json(text))
+    compact = retained(lambda: Collection.from_json(text, compact=True))
+    from_rows = retained(lambda: Collection.from_rows(BASE_URL, columns, rows))
+    compact_rows = retained(lambda: Collection.from_rows(
+        BASE_URL, columns, rows, compact=True))
+    print('%d items, %d data and %d links per item' % (
+        args.items, args.data, args.links))
+    print('%-24s %12s %12s' % ('', 'total', 'per item'))
+    for name, size in [('decoded dicts', decoded), ('Item objects', built),
+                       ('from_json', parsed),
+                       ('from_json compact', compact),
+                       ('from_rows', from_rows),
+                       ('from_rows compact', compact_rows)]:
+        print('%-24s %10.1fMB %10.0f B' % (
+            name, size / 1e6, size / float(args.items)))
+
+
+if __name__ == '__main__':
+    main()
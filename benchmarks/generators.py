@@ -0,0 +1,65 @@
+"""Synthetic Collection+JSON documents for benchmarks."""
+from __future__ import absolute_import, unicode_literals
+import json
+
+from collection_json import Collection
+
+
+BASE_URL = 'http://example.org/items/'
+
+
+def make_item(index, data=10, links=1):
+    """Return the dictionary of an item with the given number of fields."""
+    href = '%s%d' % (BASE_URL, index)
+    return {
+        'href': href,
+        'data': [
+            {'name': 'field%d' % j, 'value': 'value %d.%d' % (index, j),
+             'prompt': 'Field %d' % j}
+            for j in range(data)
+        ],
+        'links': [
+            {'href': '%s/link%d' % (href, j), 'rel': 'rel%d' % j}
+            for j in range(links)
+        ],
+    }
+
+
+def make_rows(items, data=10):
+    """Return the column names and value rows of the items' data."""
+    columns = ['field%d' % j for j in range(data)]
+    rows = [tuple('value %d.%d' % (i, j) for j in range(data))
+            for i in range(items)]
+    return columns, rows
+
+
+def make_document(items, data=10, links=1):
+    """Return the dictionary of a collection with the given shape."""
+    return {
+        'collection': {
+            'version': '1.0',
+            'href': BASE_URL,
+            'links': [
+                {'href': BASE_URL + '?page=2', 'rel': 'next'},
+            ],
+            'items': [make_item(i, data, links) for i in range(items)],
+            'queries': [
+                {'href': BASE_URL + 'search', 'rel': 'search',
+                 'data': [{'name': 'q', 'value': ''}]},
+            ],
+            'template': {
+                'data': [{'name': 'field%d' % j, 'value': ''}
+                         for j in range(data)],
+            },
+        }
+    }
+
+
+def make_json(items, data=10, links=1):
+    """Return the json text of a collection with the given shape."""
+    return json.dumps(make_document(items, data, links))
+
+
+def make_collection(items, data=10, links=1):
+    """Return a Collection with the given shape."""
+    return Collection.from_json(make_json(items, data, links))
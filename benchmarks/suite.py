@@ -0,0 +1,373 @@
+"""Benchmarks for parsing, building, lookups, comparison and serialization.
+
+Every case runs on synthetic collections of the requested shapes. Run from the
+project root::
+
+    python -m benchmarks --sizes 10,1000,100000 --output results.json
+
+Larger runs are possible, e.g. ``--sizes 1000000 --data 2,10 --links 0,5``.
+
+Saved results can be used as a baseline, failing the run when any case got
+slower than the threshold allows::
+
+    python -m benchmarks --compare results.json --threshold 0.25
+
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+import argparse
+import copy
+import itertools
+import json
+import platform
+import sys
+import time
+import timeit
+
+import collection_json
+import collection_json_diff
+from collection_json import (Array, Collection, Item, TemplateFiller,
+                             fingerprint)
+
+from .generators import (
+    BASE_URL,
+    make_collection,
+    make_document,
+    make_json,
+    make_rows,
+)
+
+
+CASES = []
+
+
+def case(func):
+    """Register a benchmark case.
+
+    A case takes the (items, data, links) shape of the collection and returns
+    the function to be timed.
+
+    """
+    CASES.append(func)
+    return func
+
+
+def _lookup_name(shape):
+    items, data, links = shape
+    return 'field%d' % (data - 1) if data else 'missing'
+
+
+@case
+def from_json(shape):
+    text = make_json(*shape)
+    return lambda: Collection.from_json(text)
+
+
+@case
+def from_json_lazy(shape):
+    text = make_json(*shape)
+    # an untouched view shares its source, a plain to_dict would copy it
+    return lambda: Collection.from_json(text, lazy=True).to_dict(cache=True)
+
+
+@case
+def from_json_strict(shape):
+    text = make_json(*shape)
+    return lambda: Collection.from_json(text, strict=True)
+
+
+@case
+def build_items(shape):
+    items = make_document(*shape)['collection']['items']
+    return lambda: Array(Item, 'items', items)
+
+
+@case
+def from_row_dicts(shape):
+    items, data, links = shape
+    columns, rows = make_rows(items, data)
+    link_rels = ['rel%d' % j for j in range(links)]
+
+    def run():
+        items = []
+        for index, row in enumerate(rows):
+            href = '%s%d' % (BASE_URL, index)
+            items.append({
+                'href': href,
+                'data': [{'name': name, 'value': value}
+                         for name, value in zip(columns, row)],
+                'links': [{'href': href + '/' + rel, 'rel': rel}
+                          for rel in link_rels],
+            })
+        return Collection(BASE_URL, items=items)
+    return run
+
+
+@case
+def from_rows(shape):
+    items, data, links = shape
+    columns, rows = make_rows(items, data)
+    columns.append('id')
+    rows = [row + (index,) for index, row in enumerate(rows)]
+    href = BASE_URL + '{id}'
+    item_links = [{'href': href + '/rel%d' % j, 'rel': 'rel%d' % j}
+                  for j in range(links)]
+    return lambda: Collection.from_rows(BASE_URL, columns, rows, href,
+                                        item_links)
+
+
+@case
+def to_dict(shape):
+    return make_collection(*shape).to_dict
+
+
+@case
+def to_str(shape):
+    collection = make_collection(*shape)
+    return lambda: str(collection)
+
+
+@case
+def to_json_cached(shape):
+    collection = make_collection(*shape)
+    collection.to_json(cache=True)
+    item = collection.items[len(collection.items) // 2]
+    hrefs = itertools.cycle([item.href + '/a', item.href + '/b'])
+
+    def run():
+        # change one item, then encode the whole document again
+        item.href = next(hrefs)
+        return collection.to_json(cache=True)
+    return run
+
+
+@case
+def iter_json_chunks(shape):
+    collection = make_collection(*shape)
+
+    def run():
+        for chunk in collection.iter_json_chunks():
+            pass
+    return run
+
+
+@case
+def items_get(shape):
+    items = make_collection(*shape).items
+    step = max(1, len(items) // 100)
+    hrefs = [item.href for item in items[::step]]
+
+    def run():
+        for href in hrefs:
+            items.get(href=href)
+    return run
+
+
+@case
+def data_find(shape):
+    items = make_collection(*shape).items
+    name = _lookup_name(shape)
+
+    def run():
+        for item in items:
+            item.data.find(name=name)
+    return run
+
+
+def _where_setup(shape, indexed):
+    items = make_collection(*shape).items
+    name = _lookup_name(shape)
+    value = 'value %d.%d' % (shape[0] // 2, shape[1] - 1)
+    if indexed:
+        items.create_index(name, ordered=True)
+    return lambda: (items.where(**{name: value}),
+                    items.where(**{name + '__lt': 'value 1'}))
+
+
+@case
+def where_scan(shape):
+    return _where_setup(shape, False)
+
+
+@case
+def where_indexed(shape):
+    return _where_setup(shape, True)
+
+
+@case
+def item_attribute(shape):
+    items = make_collection(*shape).items
+    name = _lookup_name(shape)
+
+    def run():
+        for item in items:
+            getattr(item, name, None)
+    return run
+
+
+@case
+def to_columns(shape):
+    return make_collection(*shape).items.to_columns
+
+
+@case
+def template_fill(shape):
+    items, data, links = shape
+    template = make_collection(0, data, 0).template
+    columns, rows = make_rows(min(items, 1000), data)
+
+    def run():
+        for row in rows:
+            filled = copy.deepcopy(template)
+            for name, value in zip(columns, row):
+                filled.data.get(name=name).value = value
+            filled.to_dict()
+    return run
+
+
+@case
+def template_compiled(shape):
+    items, data, links = shape
+    filler = TemplateFiller(make_collection(0, data, 0).template)
+    columns, rows = make_rows(min(items, 1000), data)
+
+    def run():
+        for payload in filler.iter_dicts(rows):
+            pass
+    return run
+
+
+@case
+def query_build_url(shape):
+    query = make_collection(0, *shape[1:]).queries[0]
+    terms = ['term %d' % i for i in range(1000)]
+
+    def run():
+        for term in terms:
+            query.build_url(q=term)
+    return run
+
+
+@case
+def equality(shape):
+    collection = make_collection(*shape)
+    other = make_collection(*shape)
+    return lambda: collection == other
+
+
+@case
+def fingerprint_changed(shape):
+    collection = make_collection(*shape)
+    fingerprint(collection)
+    item = collection.items[len(collection.items) // 2]
+    hrefs = itertools.cycle([item.href + '/a', item.href + '/b'])
+
+    def run():
+        # change one item, then digest the whole document again
+        item.href = next(hrefs)
+        return fingerprint(collection)
+    return run
+
+
+@case
+def diff(shape):
+    old = make_collection(*shape)
+    new = make_collection(*shape)
+    new.items[len(new.items) // 2].href += '/changed'
+    return lambda: collection_json_diff.diff(old, new)
+
+
+def measure(func, repeat=3, min_time=0.2):
+    """Return the best time per call of func, in seconds.
+
+    The number of calls per measurement grows until it takes min_time.
+    Garbage collection stays enabled, as it is part of the cost.
+
+    """
+    timer = timeit.Timer(func, 'gc.enable()')
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1000000:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    timings = [elapsed] + timer.repeat(repeat - 1, number)
+    return min(timings) / number
+
+
+def run(sizes, data, links, cases=None, repeat=3, min_time=0.2):
+    """Run the selected cases on every shape, return the results dict."""
+    results = {}
+    selected = [func for func in CASES
+                if cases is None or func.__name__ in cases]
+    for shape in itertools.product(sizes, data, links):
+        for func in selected:
+            name = '%s[items=%d,data=%d,links=%d]' % (
+                (func.__name__,) + shape)
+            results[name] = measure(func(shape), repeat, min_time)
+            print('%-50s %12.6fs' % (name, results[name]))
+            sys.stdout.flush()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the change against a baseline, return the regressed cases."""
+    regressions = []
+    print()
+    print('%-50s %12s %12s %8s' % ('case', 'baseline', 'current', 'ratio'))
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = results[name] / baseline[name]
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = ' REGRESSION'
+        print('%-50s %11.6fs %11.6fs %7.2fx%s' % (
+            name, baseline[name], results[name], ratio, flag))
+    return regressions
+
+
+def _int_list(value):
+    return [int(part) for part in value.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=_int_list, default=[10, 1000, 100000],
+                        help='comma separated numbers of items')
+    parser.add_argument('--data', type=_int_list, default=[10],
+                        help='comma separated numbers of data per item')
+    parser.add_argument('--links', type=_int_list, default=[1],
+                        help='comma separated numbers of links per item')
+    parser.add_argument('--cases', type=lambda value: value.split(','),
+                        help='comma separated case names, from: %s' % (
+                            ', '.join(func.__name__ for func in CASES)))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='minimum seconds per measurement')
+    parser.add_argument('--output', help='save the results to this file')
+    parser.add_argument('--compare', help='results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown against the baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.data, args.links, args.cases,
+                  args.repeat, args.min_time)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({
+                'version': collection_json.__version__,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'timestamp': time.time(),
+                'results': results,
+            }, fp, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('%d case(s) slower than the %d%% threshold.' % (
+                len(regressions), args.threshold * 100))
+            return 1
+    return 0
@@ -1,10 +1,434 @@
 """Classes for representing a Collection+JSON document."""
 from __future__ import absolute_import, unicode_literals
+import bisect
+import codecs
+import copy
+import hashlib
+import heapq
 import json
+import marshal
+import mmap
+import numbers
+import operator
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+try:
+    from urllib.parse import quote_plus
+except ImportError:  # Python 2
+    from urllib import quote_plus
 
 
 __version__ = '0.1.1'
 
+MEDIA_TYPE = 'application/vnd.collection+json'
+
+
+_MISSING = object()
+# get attributes bypassing __getattr__ overrides
+_getattribute = object.__getattribute__
+# produces the same output as json.dumps with default arguments
+_encode = json.JSONEncoder().encode
+_encode_string = getattr(json.encoder, 'c_encode_basestring_ascii',
+                         None) or json.encoder.encode_basestring_ascii
+_text_type = type('')
+
+
+def _canonical(value):
+    """Return a canonical JSON-like text of value, the same for equal values.
+
+    Numbers that compare equal, like 1, 1.0 and True, get the same text, and
+    dictionaries are written with sorted members.
+
+    """
+    kind = type(value)
+    if kind is _text_type:
+        return _encode_string(value)
+    if value is None:
+        return 'null'
+    if kind is int or isinstance(value, numbers.Integral):
+        return '%d' % value
+    if isinstance(value, numbers.Number):
+        try:
+            number = float(value)
+        except (TypeError, ValueError, OverflowError):
+            return repr(value)
+        if number != value:
+            return repr(value)
+        if number.is_integer():
+            return '%d' % number
+        return repr(number)
+    if kind is list or isinstance(value, list):
+        return '[' + ','.join([_canonical(item) for item in value]) + ']'
+    if isinstance(value, tuple):
+        return '(' + ','.join([_canonical(item) for item in value]) + ')'
+    if isinstance(value, dict):
+        return '{' + ','.join(sorted(
+            [_canonical(key) + ':' + _canonical(item)
+             for key, item in value.items()])) + '}'
+    try:
+        return _encode(value)
+    except TypeError:
+        return repr(value)
+
+
+def _sha1(text):
+    """Return the hexadecimal SHA-1 digest of text."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class JSONCodec(object):
+
+    """A JSON backend used for parsing and serializing documents.
+
+    :param name str: name the codec is registered with
+    :param loads: function decoding a str or bytes document, raising
+        ValueError on invalid input
+    :param dumps: function encoding an object into a str
+    :param dumps_bytes: function encoding an object into UTF-8 bytes,
+        defaults to encoding the output of dumps
+    :param buffers bool: whether loads also decodes a memoryview without
+        copying it
+
+    """
+
+    def __init__(self, name, loads, dumps, dumps_bytes=None, buffers=False):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+        self.buffers = buffers
+        if dumps_bytes is None:
+            def dumps_bytes(obj):
+                return dumps(obj).encode('utf-8')
+        self.dumps_bytes = dumps_bytes
+
+    def __repr__(self):
+        return "<JSONCodec: name='%s'>" % self.name
+
+
+def _detect_encoding(data):
+    """Return the encoding of a JSON document given as bytes.
+
+    UTF-8, UTF-16 and UTF-32 are told apart by their byte order mark, or
+    by the null bytes around the ASCII characters a document starts with.
+
+    """
+    if data.startswith((codecs.BOM_UTF32_BE, codecs.BOM_UTF32_LE)):
+        return 'utf-32'
+    if data.startswith((codecs.BOM_UTF16_BE, codecs.BOM_UTF16_LE)):
+        return 'utf-16'
+    if data.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    head = bytearray(data[:4])
+    if len(head) == 4:
+        if not head[0]:
+            return 'utf-16-be' if head[1] else 'utf-32-be'
+        if not head[1]:
+            return 'utf-16-le' if head[2] or head[3] else 'utf-32-le'
+    elif len(head) == 2:
+        if not head[0]:
+            return 'utf-16-be'
+        if not head[1]:
+            return 'utf-16-le'
+    return 'utf-8'
+
+
+def _stdlib_loads(data):
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    if isinstance(data, (bytes, bytearray)):
+        # json.loads only takes str before Python 3.6
+        data = bytes(data)
+        data = data.decode(_detect_encoding(data))
+    return json.loads(data)
+
+
+def _orjson_codec():
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+    return JSONCodec('orjson', orjson.loads, dumps, orjson.dumps,
+                     buffers=True)
+
+
+def _ujson_codec():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, escape_forward_slashes=False)
+    return JSONCodec('ujson', ujson.loads, dumps)
+
+
+def _simplejson_codec():
+    import simplejson
+    return JSONCodec('simplejson', simplejson.loads, simplejson.dumps)
+
+
+def _rapidjson_codec():
+    import rapidjson
+    return JSONCodec('rapidjson', rapidjson.loads, rapidjson.dumps)
+
+
+_stdlib_codec = JSONCodec('json', _stdlib_loads, json.dumps)
+_codecs = {
+    'json': _stdlib_codec,
+}
+# third party backends, registered on first use when installed
+_optional_codecs = {
+    'orjson': _orjson_codec,
+    'ujson': _ujson_codec,
+    'simplejson': _simplejson_codec,
+    'rapidjson': _rapidjson_codec,
+}
+_default_codec = _codecs['json']
+
+
+def register_codec(codec):
+    """Register a JSONCodec, replacing any codec with the same name."""
+    _codecs[codec.name] = codec
+
+
+def get_codec(codec=None):
+    """Return a JSONCodec.
+
+    The codec can be given by name or as a JSONCodec instance. When None is
+    given, returns the default codec.
+
+    Raises `ValueError` when the codec is unknown or not installed.
+
+    """
+    if codec is None:
+        return _default_codec
+    elif isinstance(codec, JSONCodec):
+        return codec
+    if codec not in _codecs and codec in _optional_codecs:
+        try:
+            register_codec(_optional_codecs[codec]())
+        except ImportError:
+            pass
+    try:
+        return _codecs[codec]
+    except KeyError:
+        raise ValueError('Unknown or unavailable JSON codec: %s' % codec)
+
+
+def available_codecs():
+    """Return the names of the codecs that can be used."""
+    names = set(_codecs)
+    for name in _optional_codecs:
+        try:
+            get_codec(name)
+        except ValueError:
+            continue
+        names.add(name)
+    return sorted(names)
+
+
+def set_default_codec(*names):
+    """Set the codec used when no codec is given explicitly.
+
+    The first available codec among names is chosen, so that a faster
+    backend can be preferred with the standard library as a fallback::
+
+        set_default_codec('orjson', 'ujson', 'json')
+
+    Returns the chosen codec. Raises `ValueError` when none is available.
+
+    """
+    global _default_codec
+    for name in names:
+        try:
+            codec = get_codec(name)
+        except ValueError:
+            continue
+        _default_codec = codec
+        return codec
+    raise ValueError('None of the JSON codecs is available: %s' % (
+        ', '.join(str(name) for name in names)))
+
+
+_clock = getattr(time, 'perf_counter', time.time)
+_metrics_sink = None
+
+
+def set_metrics_sink(sink):
+    """Set the callable receiving measurements of the work done.
+
+    The sink is called with the name of a phase and a dictionary of
+    measurements, where seconds is the time spent in the phase:
+
+    - 'parse': decoding a document in `Collection.from_json` and
+      `Collection.from_file`, with the size of the input in bytes, or
+      characters for str, and the codec name. With the default codec,
+      from_file decodes the file incrementally and builds the items as
+      they are decoded, which is reported as parse.
+    - 'build': building the Collection from the decoded document, with the
+      number of items and of objects built, not counting arrays. Lazy
+      collections build a single object.
+    - 'to_dict' and 'encode': building the dictionary representation and
+      encoding it in `Collection.to_json` and `Collection.to_json_bytes`,
+      with the number of items, and the size of the output and the codec
+      name. Encoding from kept JSON text skips to_dict.
+    - 'scan': a search of an Array that wasn't served by its index, with
+      the collection name of the array, its size, and the number of
+      elements walked, without seconds.
+
+    Pass None to remove the sink; when no sink is set, measuring costs a
+    single check per call. Returns the previous sink.
+
+    """
+    global _metrics_sink
+    previous = _metrics_sink
+    _metrics_sink = sink
+    return previous
+
+
+class MetricsRecorder(object):
+
+    """A metrics sink keeping totals of the measurements of each phase.
+
+    totals maps each phase to a dictionary with the number of calls and the
+    sum of every numeric measurement. Used as a context manager, the
+    recorder is set as the metrics sink inside the block::
+
+        with MetricsRecorder() as metrics:
+            Collection.from_json(data).to_json()
+        print(metrics.totals['parse']['seconds'])
+
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self._lock = threading.Lock()
+        self._previous = []
+
+    def __call__(self, phase, measurements):
+        with self._lock:
+            totals = self.totals.get(phase)
+            if totals is None:
+                totals = self.totals[phase] = {'calls': 0}
+            totals['calls'] += 1
+            for name, value in measurements.items():
+                if (isinstance(value, numbers.Number) and
+                        not isinstance(value, bool)):
+                    totals[name] = totals.get(name, 0) + value
+
+    def __enter__(self):
+        self._previous.append(set_metrics_sink(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        set_metrics_sink(self._previous.pop())
+
+    def reset(self):
+        """Forget the measurements recorded so far."""
+        with self._lock:
+            self.totals = {}
+
+
+class _CountingIterator(object):
+
+    """Iterates over an iterable, counting the elements taken."""
+
+    __slots__ = ('iterator', 'count')
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        element = next(self.iterator)
+        self.count += 1
+        return element
+
+    next = __next__  # Python 2
+
+
+def _source_of(obj):
+    """Return the decoded dictionary a view wraps, or None."""
+    meta = getattr(obj, '_meta', None)
+    return None if meta is None else meta.source
+
+
+def _count_objects(collection):
+    """Return the number of objects built for a collection, without arrays.
+
+    Parts of a lazy collection that weren't accessed aren't counted.
+
+    """
+    if _source_of(collection) is not None:
+        return 1
+    count = 1 + len(collection.links) + len(collection.queries)
+    for query in collection.queries:
+        count += len(query.data)
+    if collection.template is not None:
+        count += 1 + len(collection.template.data)
+    if collection.error is not None:
+        count += 1
+    for item in collection.items:
+        count += 1
+        if _source_of(item) is not None:
+            continue
+        if item._values is None:
+            count += len(item.data)
+        count += len(item.links)
+    return count
+
+
+def _count_items(collection):
+    """Return the number of items of a collection, without building them."""
+    source = _source_of(collection)
+    if source is not None:
+        items = source.get('items')
+        return len(items) if isinstance(items, list) else 0
+    return len(collection.items)
+
+
+def _to_arrays(columns):
+    """Convert the lists in the columns dict to NumPy arrays, if installed.
+
+    The dtype is inferred from the values, except for strings and nested
+    values, which are kept as Python objects.
+
+    """
+    try:
+        import numpy
+    except ImportError:
+        return columns
+    for name, values in columns.items():
+        try:
+            array = numpy.array(values)
+        except ValueError:
+            # nested sequences of different lengths
+            array = None
+        if array is None or array.ndim != 1 or array.dtype.kind in 'SU':
+            array = numpy.empty(len(values), dtype=object)
+            for i, value in enumerate(values):
+                array[i] = value
+        columns[name] = array
+    return columns
+
+
+class Columns(OrderedDict):
+
+    """The columns of data values returned by `Array.to_columns`.
+
+    absent maps a name to the positions of the items without a data of that
+    name, whose value in the column is None.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(Columns, self).__init__(*args, **kwargs)
+        self.absent = {}
+
 
 class ArrayProperty(object):
 
@@ -18,19 +442,57 @@ class ArrayProperty(object):
         """
         self.cls = cls
         self.name = name
+        self.attr = '_' + name
 
     def __get__(self, instance, owner):
-        target = instance
-        if target is None:
-            target = owner
-        if self.name in target.__dict__:
-            return target.__dict__[self.name]
-        raise AttributeError
+        if instance is None:
+            return self
+        try:
+            return _getattribute(instance, self.attr)
+        except AttributeError:
+            source = _source_of(instance)
+            if source is None:
+                raise AttributeError(self.name)
+        # first access on a view, wrap the decoded list
+        array = Array._view(self.cls, self.name, source.get(self.name))
+        _store(instance, self.attr, array)
+        return array
 
     def __set__(self, instance, value):
         if value is None:
             value = []
-        instance.__dict__[self.name] = Array(self.cls, self.name, value)
+        _store(instance, self.attr, Array(self.cls, self.name, value))
+        if getattr(instance, '_meta', None) is not None:
+            instance._changed(self.name)
+
+
+class _DataProperty(ArrayProperty):
+
+    """An ArrayProperty that is also built from the values of packed items.
+
+    Packed items keep a `_Schema` and a tuple of values in `_values` instead
+    of Data objects, which are built on first access.
+
+    """
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        try:
+            return _getattribute(instance, self.attr)
+        except AttributeError:
+            packed = getattr(instance, '_values', None)
+            if packed is None:
+                return super(_DataProperty, self).__get__(instance, owner)
+        schema, values = packed
+        array = Array._new(self.cls, self.name, schema.build(values))
+        _store(instance, self.attr, array)
+        instance._values = None
+        return array
+
+    def __set__(self, instance, value):
+        super(_DataProperty, self).__set__(instance, value)
+        instance._values = None
 
 
 class TypedProperty(object):
@@ -48,53 +510,461 @@ class TypedProperty(object):
         """
         self.cls = cls
         self.name = name
+        self.attr = '_' + name
 
     def __get__(self, instance, owner):
-        target = instance
-        if target is None:
-            target = owner
-        if self.name in target.__dict__:
-            return target.__dict__[self.name]
-        raise AttributeError
+        if instance is None:
+            return self
+        try:
+            return _getattribute(instance, self.attr)
+        except AttributeError:
+            source = _source_of(instance)
+            if source is None:
+                raise AttributeError(self.name)
+        # first access on a view, wrap the decoded dictionary
+        value = source.get(self.name)
+        if isinstance(value, dict):
+            value = self.cls._view(value)
+        _store(instance, self.attr, self._convert(value))
+        return _getattribute(instance, self.attr)
 
     def __set__(self, instance, value):
+        _store(instance, self.attr, self._convert(value))
+        if getattr(instance, '_meta', None) is not None:
+            instance._changed(self.name)
+
+    def _convert(self, value):
         if value is None or isinstance(value, self.cls):
-            instance.__dict__[self.name] = value
+            return value
         elif isinstance(value, dict):
-            instance.__dict__[self.name] = self.cls(**value)
-        else:
-            raise TypeError("Invalid value '%s', "
-                            "expected dict or '%s'" % (value,
-                                                       self.cls.__name__))
+            return self.cls(**value)
+        raise TypeError("Invalid value '%s', "
+                        "expected dict or '%s'" % (value, self.cls.__name__))
+
+
+class _FieldProperty(property):
+
+    """A descriptor for a plain attribute telling containers of changes.
+
+    The value is stored in the attribute named after the property with a
+    leading underscore, which is read without calling Python code.
+
+    """
+
+    def __init__(self, name):
+        attr = '_' + name
+
+        def set_value(instance, value):
+            setattr(instance, attr, value)
+            if instance._meta is not None:
+                instance._changed(name)
+        super(_FieldProperty, self).__init__(operator.attrgetter(attr),
+                                             set_value)
+        self.name = name
+        self.attr = attr
+
+
+def _store(instance, attr, value):
+    """Set the attribute holding a property value, keeping containers.
+
+    A tracked instance is recorded as the container of the new value in
+    place of the previous one, see `ComparableObject`.
+
+    """
+    if getattr(instance, '_meta', None) is not None:
+        try:
+            current = _getattribute(instance, attr)
+        except AttributeError:
+            current = None
+        if isinstance(current, ComparableObject):
+            current._detach(instance)
+        if isinstance(value, ComparableObject):
+            value._attach(weakref.ref(instance))
+    setattr(instance, attr, value)
+
+
+# attributes left out when comparing objects without _fields
+_BOOKKEEPING = frozenset(['_meta', '__weakref__'])
+# the attributes holding property values by class, see _property_attrs
+_PROPERTY_ATTRS = {}
+# the readers of _fields by class, see _field_getter
+_FIELD_GETTERS = {}
+
+
+def _property_attrs(cls):
+    """Return the attributes of the ArrayProperty and TypedProperty of cls."""
+    attrs = _PROPERTY_ATTRS.get(cls)
+    if attrs is None:
+        attrs = _PROPERTY_ATTRS[cls] = tuple(
+            prop.attr for prop in [getattr(cls, name, None)
+                                   for name in cls._fields]
+            if isinstance(prop, (ArrayProperty, TypedProperty)))
+    return attrs
+
+
+def _field_getter(cls):
+    """Return a function reading the _fields of a cls instance.
+
+    The values are returned as a tuple, or as is for a single field. Plain
+    fields are read from their attribute, without the property.
+
+    """
+    getter = _FIELD_GETTERS.get(cls)
+    if getter is None:
+        names = []
+        for name in cls._fields:
+            prop = getattr(cls, name, None)
+            names.append(prop.attr if isinstance(prop, _FieldProperty)
+                         else name)
+        getter = _FIELD_GETTERS[cls] = operator.attrgetter(*names)
+    return getter
+
+
+def _containers(meta):
+    """Return the arrays and objects containing an object, still alive.
+
+    meta.parent holds a weak reference to the container, or a tuple of them
+    when the object is contained more than once.
+
+    """
+    parent = meta.parent
+    if parent is None:
+        return ()
+    if type(parent) is not tuple:
+        container = parent()
+        return () if container is None else (container,)
+    containers = []
+    for ref in parent:
+        container = ref()
+        if container is not None:
+            containers.append(container)
+    return containers
+
+
+def _not_data_name(cls, name):
+    """Return whether __getattr__ must not look up name by data name.
+
+    Special method names, and the slots and properties of cls, which only
+    reach __getattr__ when unset or failing, are never data names.
+
+    """
+    return (name.startswith('__') or
+            getattr(cls, name, _MISSING) is not _MISSING)
+
+
+def _copy_decoded(value):
+    """Return a deep copy of a decoded JSON document."""
+    try:
+        return marshal.loads(marshal.dumps(value))
+    except ValueError:
+        # types marshal doesn't handle, such as OrderedDict from a codec
+        return copy.deepcopy(value)
+
+
+def _rebuild(cls, kwargs):
+    """Return a new instance of cls, used for pickling and copying."""
+    return cls(**kwargs)
+
+
+class _Meta(object):
+
+    """The bookkeeping of a tracked object.
+
+    Objects get tracked once something is derived from them: a view of a
+    decoded dictionary, a kept dictionary or JSON text, a fingerprint or an
+    index. Changing them drops what was derived from them and from their
+    containers.
+
+    """
+
+    __slots__ = ('parent', 'source', 'dict', 'json', 'digest')
+
+    def __init__(self, source=None):
+        self.parent = None
+        self.source = source
+        self.dict = None
+        self.json = None
+        self.digest = None
 
 
 class ComparableObject(object):
 
     """Abstract base class for objects implementing equality comparison.
 
-    This class provides default __eq__ and __ne__ implementations.
+    This class provides default __eq__ and __ne__ implementations, which
+    compare the attributes named in `_fields`. `_meta` holds a `_Meta` once
+    the object is tracked, and None before.
 
     """
 
+    __slots__ = ()
+
+    _fields = ()
+    _meta = None
+    # whether arrays use the fingerprint of the object or its text
+    _digested = True
+
+    @classmethod
+    def _view(cls, source):
+        """Return an instance wrapping the decoded dictionary source."""
+        obj = cls.__new__(cls)
+        obj._meta = _Meta(source)
+        for name in cls._fields:
+            prop = getattr(cls, name, None)
+            if isinstance(prop, _FieldProperty):
+                setattr(obj, prop.attr, source.get(name))
+        return obj
+
     def __eq__(self, other):
-        """Return True if both instances are equivalent."""
-        return (type(self) == type(other) and
-                self.__dict__ == other.__dict__)
+        """Return True if both instances are equivalent.
+
+        Objects whose fingerprints are both known and differ are unequal,
+        without comparing their fields.
+
+        """
+        if type(self) is not type(other):
+            return False
+        meta = self._meta
+        other_meta = other._meta
+        if (meta is not None and other_meta is not None and
+                meta.digest is not None and other_meta.digest is not None and
+                meta.digest != other_meta.digest):
+            return False
+        if not self._fields:
+            return self._state() == other._state()
+        get_fields = _field_getter(type(self))
+        return get_fields(self) == get_fields(other)
 
     def __ne__(self, other):
         """Return True if both instances are not equivalent."""
-        return (type(self) != type(other) or
-                self.__dict__ != other.__dict__)
+        return not self.__eq__(other)
+
+    # mutable, use the fingerprint as a key instead
+    __hash__ = None
+
+    def _fingerprint(self):
+        """Return the digest of the object, see `fingerprint`."""
+        meta = self._meta
+        if meta is None or meta.digest is None:
+            meta = self._track()
+            meta.digest = _sha1(self._canonical_text())
+        return meta.digest
+
+    def _state(self):
+        """Return the attributes of an object whose class has no _fields."""
+        state = dict(getattr(self, '__dict__', ()))
+        for cls in type(self).__mro__:
+            slots = cls.__dict__.get('__slots__', ())
+            if isinstance(slots, (_text_type, str)):
+                slots = (slots,)
+            for name in slots:
+                if name not in state and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        for name in _BOOKKEEPING:
+            state.pop(name, None)
+        return state
+
+    def _canonical_text(self):
+        """Return the text the fingerprint is a digest of."""
+        parts = [type(self).__name__]
+        if not self._fields:
+            parts.extend(_canonical(key) + ':' + _canonical(value)
+                         for key, value in sorted(self._state().items()))
+        for name in self._fields:
+            value = getattr(self, name)
+            if isinstance(value, ComparableObject):
+                parts.append(value._fingerprint())
+            else:
+                parts.append(_canonical(value))
+        return '\0'.join(parts)
+
+    def __reduce__(self):
+        if not self._fields:
+            return object.__reduce__(self)
+        # rebuild from the public attributes, leaving out containers
+        kwargs = {}
+        for name in self._fields:
+            value = getattr(self, name)
+            if isinstance(value, Array):
+                value = list(value)
+            kwargs[name] = value
+        return (_rebuild, (type(self), kwargs))
+
+    def _track(self, source=None):
+        """Return the `_Meta` of the object, tracking it from now on."""
+        meta = self._meta
+        if meta is None:
+            meta = self._meta = _Meta(source)
+            ref = None
+            for child in self._children():
+                if ref is None:
+                    ref = weakref.ref(self)
+                child._attach(ref)
+        return meta
+
+    def _children(self):
+        """Yield the objects held by the properties built so far."""
+        for attr in _property_attrs(type(self)):
+            try:
+                value = _getattribute(self, attr)
+            except AttributeError:
+                continue
+            if isinstance(value, ComparableObject):
+                yield value
+
+    def _changed(self, name):
+        """Drop what was derived from the object after name changed."""
+        meta = self._meta
+        if meta is None:
+            return
+        if (meta.source is not None or meta.dict is not None or
+                meta.json is not None or meta.digest is not None):
+            self._materialize()
+        for container in _containers(meta):
+            container._child_changed(self, name)
+
+    def _materialize(self):
+        """Build the properties not accessed yet and drop the source."""
+        meta = self._meta
+        if meta.source is not None:
+            for name in self._fields:
+                getattr(self, name)
+        meta.source = meta.dict = meta.json = meta.digest = None
+
+    def to_dict(self, cache=False):
+        """Return a dictionary representing the object.
+
+        With cache, the dictionary of the object and of everything inside it
+        is kept until they change, and returned as is by later calls, so it
+        must not be modified. Otherwise the dictionary returned is new, or a
+        deep copy of the one kept.
+
+        """
+        return self._wrap(self._to_dict(cache, cache))
+
+    def _to_dict(self, cache=False, shared=False):
+        """Return the dictionary representation, without the wrapping.
+
+        With shared, the dictionary kept, or the source of a view, is
+        returned as is instead of a copy, for callers that only read it.
+
+        """
+        meta = self._meta
+        if meta is not None:
+            output = meta.dict
+            if output is None:
+                output = meta.source
+            if output is not None:
+                return output if shared else _copy_decoded(output)
+        output = self._build_dict(cache, shared)
+        if cache:
+            self._track().dict = output
+        return output
+
+    def _build_dict(self, cache, shared):
+        """Return a new dictionary representation, see `_to_dict`."""
+        raise NotImplementedError
+
+    def _wrap(self, output):
+        """Return the dictionary representation as returned by to_dict."""
+        return output
+
+    def _shared_dict(self, cache=False):
+        """Return the output of to_dict, sharing the dictionaries kept."""
+        return self._wrap(self._to_dict(cache, True))
+
+    def _kept_json(self):
+        """Return the JSON text kept, or None."""
+        meta = self._meta
+        return None if meta is None else meta.json
+
+    def _json_text(self, cache=False):
+        """Return the JSON text of the dictionary representation."""
+        text = self._kept_json()
+        if text is None:
+            text = _encode(self._shared_dict(cache))
+            if cache:
+                self._track().json = text
+        return text
+
+    def _attach(self, ref):
+        """Record one more occurrence of this object inside a container.
+
+        ref is a weak reference to the container.
+
+        """
+        meta = self._track()
+        current = meta.parent
+        if current is None:
+            meta.parent = ref
+        elif type(current) is tuple:
+            meta.parent = current + (ref,)
+        else:
+            meta.parent = (current, ref)
+
+    def _detach(self, parent):
+        """Forget one occurrence of this object inside parent."""
+        meta = self._meta
+        current = None if meta is None else meta.parent
+        if current is None:
+            return
+        if type(current) is not tuple:
+            if current() is parent or current() is None:
+                meta.parent = None
+            return
+        # containers that were garbage collected are forgotten too
+        parents = [ref for ref in current if ref() is not None]
+        for i, ref in enumerate(parents):
+            if ref() is parent:
+                del parents[i]
+                break
+        if not parents:
+            parents = None
+        elif len(parents) == 1:
+            parents = parents[0]
+        else:
+            parents = tuple(parents)
+        meta.parent = parents
+
+    def _child_changed(self, child, name):
+        """Called when attribute name of a contained object changed."""
+        self._changed(name)
+
+
+def fingerprint(obj):
+    """Return a digest of the content of a Collection+JSON object as a hex str.
+
+    Equal objects have the same fingerprint, which is stable between
+    processes. It's kept until the object or anything inside it changes, so
+    that only the changed objects are digested again. Objects can't be
+    hashed, since they can change, the fingerprint can be used as a key
+    instead.
+
+    It's a function rather than an attribute so that it doesn't hide a data
+    named fingerprint, looked up as an attribute of items and templates.
+
+    """
+    return obj._fingerprint()
 
 
 class Data(ComparableObject):
 
     """Object representing a Collection+JSON data object."""
 
+    __slots__ = ('_name', '_value', '_prompt', '_meta')
+
+    _fields = ('name', 'value', 'prompt')
+    _digested = False
+
+    name = _FieldProperty('name')
+    value = _FieldProperty('value')
+    prompt = _FieldProperty('prompt')
+
     def __init__(self, name, value=None, prompt=None):
-        self.name = name
-        self.value = value
-        self.prompt = prompt
+        self._name = name
+        self._value = value
+        self._prompt = prompt
+        self._meta = None
 
     def __repr__(self):
         data = "name='%s'" % self.name
@@ -102,15 +972,15 @@ class Data(ComparableObject):
             data += " prompt='%s'" % self.prompt
         return "<Data: %s>" % data
 
-    def to_dict(self):
+    def _build_dict(self, cache, shared):
         """Return a dictionary representing a Data object."""
         output = {
-            'name': self.name
+            'name': self._name
         }
-        if self.value is not None:
-            output['value'] = self.value
-        if self.prompt is not None:
-            output['prompt'] = self.prompt
+        if self._value is not None:
+            output['value'] = self._value
+        if self._prompt is not None:
+            output['prompt'] = self._prompt
         return output
 
 
@@ -118,12 +988,24 @@ class Link(ComparableObject):
 
     """Object representing a Collection+JSON link object."""
 
+    __slots__ = ('_href', '_rel', '_name', '_render', '_prompt', '_meta')
+
+    _fields = ('href', 'rel', 'name', 'render', 'prompt')
+    _digested = False
+
+    href = _FieldProperty('href')
+    rel = _FieldProperty('rel')
+    name = _FieldProperty('name')
+    render = _FieldProperty('render')
+    prompt = _FieldProperty('prompt')
+
     def __init__(self, href, rel, name=None, render=None, prompt=None):
-        self.href = href
-        self.rel = rel
-        self.name = name
-        self.render = render
-        self.prompt = prompt
+        self._href = href
+        self._rel = rel
+        self._name = name
+        self._render = render
+        self._prompt = prompt
+        self._meta = None
 
     def __repr__(self):
         data = "rel='%s'" % self.rel
@@ -135,18 +1017,18 @@ class Link(ComparableObject):
             data += " prompt='%s'" % self.prompt
         return "<Link: %s>" % data
 
-    def to_dict(self):
+    def _build_dict(self, cache, shared):
         """Return a dictionary representing a Link object."""
         output = {
-            'href': self.href,
-            'rel': self.rel,
+            'href': self._href,
+            'rel': self._rel,
         }
-        if self.name is not None:
-            output['name'] = self.name
-        if self.render is not None:
-            output['render'] = self.render
-        if self.prompt is not None:
-            output['prompt'] = self.prompt
+        if self._name is not None:
+            output['name'] = self._name
+        if self._render is not None:
+            output['render'] = self._render
+        if self._prompt is not None:
+            output['prompt'] = self._prompt
         return output
 
 
@@ -154,10 +1036,19 @@ class Error(ComparableObject):
 
     """Object representing a Collection+JSON error object."""
 
+    __slots__ = ('_code', '_message', '_title', '_meta')
+
+    _fields = ('code', 'message', 'title')
+
+    code = _FieldProperty('code')
+    message = _FieldProperty('message')
+    title = _FieldProperty('title')
+
     def __init__(self, code=None, message=None, title=None):
-        self.code = code
-        self.message = message
-        self.title = title
+        self._code = code
+        self._message = message
+        self._title = title
+        self._meta = None
 
     def __repr__(self):
         data = ''
@@ -169,41 +1060,45 @@ class Error(ComparableObject):
             data += " title='%s'" % self.title
         return "<Error%s>" % data
 
-    def to_dict(self):
+    def _build_dict(self, cache, shared):
         """Return a dictionary representing the Error instance."""
-        output = {
-            'error': {
-            }
-        }
+        output = {}
         if self.code:
-            output['error']['code'] = self.code
+            output['code'] = self.code
         if self.message:
-            output['error']['message'] = self.message
+            output['message'] = self.message
         if self.title:
-            output['error']['title'] = self.title
+            output['title'] = self.title
         return output
 
+    def _wrap(self, output):
+        return {'error': output}
+
 
 class Template(ComparableObject):
 
     """Object representing a Collection+JSON template object."""
 
+    _fields = ('data',)
+
     data = ArrayProperty(Data, "data")
 
     @staticmethod
-    def from_json(data):
+    def from_json(data, codec=None):
         """Return a template instance.
 
         Convenience method for parsing 'write' responses,
         which should only contain a template object.
 
-        This method parses a json string into a Template object.
+        This method parses a json str or bytes into a Template object, using
+        the given codec or the default one.
 
         Raises `ValueError` when no valid document is provided.
 
         """
+        loads = get_codec(codec).loads
         try:
-            data = json.loads(data)
+            data = loads(data)
             kwargs = data.get('template')
             if not kwargs:
                 raise ValueError
@@ -221,151 +1116,1534 @@ class Template(ComparableObject):
         return "<Template: data=%s>" % data
 
     def __getattr__(self, name):
-        return getattr(self.data, name)
+        if _not_data_name(type(self), name):
+            raise AttributeError(name)
+        return self.data._named(name)
 
     @property
     def properties(self):
         """Return a list of names that can be looked up on the template."""
         return [item.name for item in self.data]
 
-    def to_dict(self):
+    def _build_dict(self, cache, shared):
         """Return a dictionary representing a Template object."""
-        return {
-            'template': self.data.to_dict()
-        }
+        return {'data': self.data._to_dict(cache, shared)}
 
+    def _wrap(self, output):
+        return {'template': output}
 
-class Array(ComparableObject, list):
-
-    """Object representing a Collection+JSON array."""
 
-    def __init__(self, item_class, collection_name, items):
-        self.item_class = item_class
-        self.collection_name = collection_name
-        super(Array, self).__init__(self._build_items(items))
+class TemplateFiller(object):
 
-    def _build_items(self, items):
-        result = []
-        for item in items:
-            if isinstance(item, self.item_class):
-                result.append(item)
-            elif isinstance(item, dict):
-                result.append(self.item_class(**item))
-            else:
-                raise ValueError("Invalid value for %s: %r" % (
-                    self.item_class.__name__, item))
-        return result
+    """Fills a template with the values of records.
 
-    def __eq__(self, other):
-        """Return True if both instances are equivalent."""
-        return (super(Array, self).__eq__(other) and
-                list.__eq__(self, other))
+    Records are dictionaries mapping data names to values, or tuples of
+    values in the order of columns. Data without a value in the record keep
+    the value the template had when the filler was built.
 
-    def __ne__(self, other):
-        """Return True if both instances are not equivalent."""
-        return (super(Array, self).__ne__(other) or
-                list.__ne__(self, other))
+    """
 
-    def __getattr__(self, name):
-        results = self.find(name=name)
+    def __init__(self, template, required=None, columns=None):
+        """Compiles a filler writing records into template.
 
-        if not results:
-            raise AttributeError
-        elif len(results) == 1:
-            results = results[0]
-        return results
+        :param required: names of the data that every record must give a
+            value for, unless the template has one
+        :param columns: names of the data held by each position of tuple
+            records, defaults to the data names of the template in order;
+            a name given again holds the next data with that name
 
-    def _matches(self, name=None, rel=None):
-        for item in self:
-            item_name = getattr(item, 'name', None)
-            item_rel = getattr(item, 'rel', None)
+        Raises `ValueError` when required or columns name data the template
+        doesn't have, or name some data more times than the template has.
 
-            if name is not None and item_name == name and rel is None:
-                # only searching by name
-                yield item
-            elif rel is not None and item_rel == rel and name is None:
-                # only searching by rel
-                yield item
-            elif item_name == name and item_rel == rel:
-                # searching by name and rel
-                yield item
+        """
+        names = [data.name for data in template.data]
+        self._data = [(data.name, data.value, data.prompt)
+                      for data in template.data]
+        for name in list(required or ()) + list(columns or ()):
+            if name not in names:
+                raise ValueError('No data named %r in template' % (name,))
+        self.required = frozenset(required or ())
+        self.columns = tuple(names if columns is None else columns)
+        # positions in the tuple records, for each data of the template
+        indexes = {}
+        for index, name in enumerate(names):
+            indexes.setdefault(name, []).append(index)
+        self._positions = [None] * len(names)
+        for position, name in enumerate(self.columns):
+            if not indexes[name]:
+                raise ValueError('More columns named %r than data in '
+                                 'template' % (name,))
+            self._positions[indexes[name].pop(0)] = position
+        # JSON text of each data around its value
+        self._json = [
+            ('{"name": %s' % _encode(name),
+             '}' if prompt is None else ', "prompt": %s}' % _encode(prompt))
+            for name, value, prompt in self._data]
 
-    def find(self, name=None, rel=None):
-        """Return a list of items in the array matching name and/or rel.
+    def __repr__(self):
+        return '<TemplateFiller: columns=%r>' % (list(self.columns),)
 
-        If both name and rel parameters are provided, returned items must match
-        both properties.
+    def _values(self, record):
+        """Return the value of each data of the template for record."""
+        if isinstance(record, dict):
+            values = [record.get(name, value)
+                      for name, value, prompt in self._data]
+        else:
+            if len(record) > len(self.columns):
+                raise ValueError('Expected at most %d values, got %r' % (
+                    len(self.columns), record))
+            size = len(record)
+            values = [value if position is None or position >= size
+                      else record[position]
+                      for position, (name, value, prompt) in
+                      zip(self._positions, self._data)]
+        if self.required:
+            for (name, default, prompt), value in zip(self._data, values):
+                if value is None and name in self.required:
+                    raise ValueError('Missing value for %r in %r' % (
+                        name, record))
+        return values
+
+    def __call__(self, record):
+        """Return the dictionary of the template filled with record.
+
+        Raises `ValueError` for a record missing a required value, or a
+        tuple holding more values than columns.
 
         """
-        return list(self._matches(name=name, rel=rel))
-
-    def get(self, name=None, rel=None):
-        """Return the first item in the array matching name and/or rel.
+        data = []
+        for (name, default, prompt), value in zip(self._data,
+                                                  self._values(record)):
+            if value is None:
+                output = {'name': name}
+            else:
+                output = {'name': name, 'value': value}
+            if prompt is not None:
+                output['prompt'] = prompt
+            data.append(output)
+        return {'template': {'data': data}}
 
-        If both name and rel parameters are provided, the returned item must
-        match both properties.
+    def to_json(self, record):
+        """Return the JSON text of the template filled with record.
 
-        If no item is found, raises ValueError.
+        The text is the same as `json.dumps(filler(record))`.
 
         """
-        try:
-            return next(self._matches(name=name, rel=rel))
-        except StopIteration:
-            raise ValueError('No matching item found.')
-
-    def to_dict(self):
-        """Return a dictionary representing an Array object."""
-        return {
-            self.collection_name: [item.to_dict() for item in self]
-        }
+        data = []
+        for (head, tail), value in zip(self._json, self._values(record)):
+            if value is None:
+                data.append(head + tail)
+            else:
+                data.append(head + ', "value": ' + _encode(value) + tail)
+        return '{"template": {"data": [' + ', '.join(data) + ']}}'
 
+    def iter_dicts(self, records):
+        """Yield the dictionary of the template filled with each record.
 
-class Item(ComparableObject):
+        The `ValueError` raised for an invalid record tells its position.
 
-    """Object representing a Collection+JSON item object."""
+        """
+        for index, record in enumerate(records):
+            try:
+                yield self(record)
+            except ValueError as error:
+                raise ValueError('Record %d: %s' % (index, error))
 
-    data = ArrayProperty(Data, "data")
+    def iter_json(self, records):
+        """Yield the JSON text of the template filled with each record."""
+        for index, record in enumerate(records):
+            try:
+                yield self.to_json(record)
+            except ValueError as error:
+                raise ValueError('Record %d: %s' % (index, error))
+
+
+class Array(ComparableObject, list):
+
+    """Object representing a Collection+JSON array.
+
+    Lookups by name, rel and href are served from a hash index built on
+    first use.
+
+    """
+
+    __slots__ = ('_item_class', '_collection_name', '_index', '_value_index',
+                 '_meta', '__weakref__')
+
+    _fields = ('item_class', 'collection_name')
+    _indexed = ('name', 'rel', 'href')
+    _index_min_size = 8
+
+    item_class = _FieldProperty('item_class')
+    collection_name = _FieldProperty('collection_name')
+
+    def __init__(self, item_class, collection_name, items):
+        self._item_class = item_class
+        self._collection_name = collection_name
+        self._index = None
+        self._value_index = None
+        self._meta = None
+        super(Array, self).__init__(self._build_items(items))
+
+    @classmethod
+    def _view(cls, item_class, collection_name, source):
+        """Return an array of views wrapping the decoded list source."""
+        if source is None:
+            source = []
+        elif not isinstance(source, list):
+            raise ValueError("Invalid value for %s: %r" % (
+                collection_name, source))
+        view = item_class._view
+        items = []
+        for item in source:
+            if not isinstance(item, dict):
+                raise ValueError("Invalid value for %s: %r" % (
+                    item_class.__name__, item))
+            items.append(view(item))
+        return cls._new(item_class, collection_name, items, source=source)
+
+    @classmethod
+    def _new(cls, item_class, collection_name, items, source=None):
+        """Return an array of items, which must be new item_class objects."""
+        array = list.__new__(cls)
+        array._item_class = item_class
+        array._collection_name = collection_name
+        array._index = None
+        array._value_index = None
+        array._meta = None
+        if items:
+            list.extend(array, items)
+        if source is not None:
+            array._track(source)
+        return array
+
+    def _build_items(self, items):
+        item_class = self._item_class
+        result = []
+        for item in items:
+            if isinstance(item, item_class):
+                result.append(item)
+            elif isinstance(item, dict):
+                result.append(item_class(**item))
+            else:
+                raise ValueError("Invalid value for %s: %r" % (
+                    item_class.__name__, item))
+        self._adopt(result)
+        return result
+
+    def _children(self):
+        for item in self:
+            if isinstance(item, ComparableObject):
+                yield item
+
+    def _adopt(self, items):
+        if self._meta is None or not items:
+            return
+        ref = weakref.ref(self)
+        for item in items:
+            if isinstance(item, ComparableObject):
+                item._attach(ref)
+
+    def _release(self, items):
+        if self._meta is None:
+            return
+        for item in items:
+            if isinstance(item, ComparableObject):
+                item._detach(self)
+
+    def _child_changed(self, child, name):
+        if name in self._indexed:
+            self._index = None
+        if name == 'data' and self._value_index is not None:
+            self._value_index.update(child)
+        self._modified()
+
+    def _modified(self):
+        self._changed(self._collection_name)
+
+    def __eq__(self, other):
+        """Return True if both instances are equivalent."""
+        if not super(Array, self).__eq__(other):
+            return False
+        return list.__eq__(self, other)
+
+    def __ne__(self, other):
+        """Return True if both instances are not equivalent."""
+        return not self.__eq__(other)
+
+    def _fingerprint(self):
+        """Return a digest of the items of the array as a hex str.
+
+        It's made of the fingerprints of the items, so only the changed items
+        are digested again. Small items, like Data and Link objects, are
+        digested along with the array instead.
+
+        """
+        meta = self._meta
+        if meta is None or meta.digest is None:
+            meta = self._track()
+            parts = ['Array', self._item_class.__name__,
+                     _canonical(self._collection_name)]
+            for item in self:
+                if not isinstance(item, ComparableObject):
+                    parts.append(_canonical(item))
+                elif item._digested:
+                    parts.append(item._fingerprint())
+                else:
+                    parts.append(item._canonical_text())
+            meta.digest = _sha1('\0'.join(parts))
+        return meta.digest
+
+    def __reduce__(self):
+        return (Array, (self.item_class, self.collection_name, list(self)))
+
+    def __getattr__(self, name):
+        if _not_data_name(type(self), name):
+            raise AttributeError(name)
+        return self._named(name)
+
+    def _named(self, name):
+        """Return the item named name, or a list when there are several.
+
+        Raises `AttributeError` when no item has that name.
+
+        """
+        results = self.find(name=name)
+
+        if not results:
+            raise AttributeError(name)
+        elif len(results) == 1:
+            results = results[0]
+        return results
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            value = list(value)
+            removed = list.__getitem__(self, key)
+            added = value
+        else:
+            removed = [list.__getitem__(self, key)]
+            added = [value]
+        list.__setitem__(self, key, value)
+        self._adopt(added)
+        self._release(removed)
+        self._index = None
+        if self._value_index is not None:
+            self._value_index.remove(removed)
+            self._value_index.add(added, reordered=True)
+        self._modified()
+
+    def __delitem__(self, key):
+        removed = list.__getitem__(self, key)
+        if not isinstance(key, slice):
+            removed = [removed]
+        list.__delitem__(self, key)
+        self._release(removed)
+        self._index = None
+        if self._value_index is not None:
+            self._value_index.remove(removed)
+        self._modified()
+
+    def __setslice__(self, i, j, value):
+        # Python 2 calls this instead of __setitem__ for simple slices
+        self.__setitem__(slice(max(0, i), max(0, j)), value)
+
+    def __delslice__(self, i, j):
+        self.__delitem__(slice(max(0, i), max(0, j)))
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __imul__(self, n):
+        removed = list(self)
+        list.__imul__(self, n)
+        self._adopt(self)
+        self._release(removed)
+        self._index = None
+        if self._value_index is not None:
+            self._value_index.rebuild()
+        self._modified()
+        return self
+
+    def append(self, item):
+        list.append(self, item)
+        self._adopt([item])
+        self._index_added([item])
+        if self._value_index is not None:
+            self._value_index.add([item])
+        self._modified()
+
+    def extend(self, items):
+        items = list(items)
+        list.extend(self, items)
+        self._adopt(items)
+        self._index_added(items)
+        if self._value_index is not None:
+            self._value_index.add(items)
+        self._modified()
+
+    def insert(self, index, item):
+        list.insert(self, index, item)
+        self._adopt([item])
+        self._index = None
+        if self._value_index is not None:
+            self._value_index.add([item], reordered=True)
+        self._modified()
+
+    def remove(self, item):
+        del self[self.index(item)]
+
+    def pop(self, index=-1):
+        last = index == -1 or index == len(self) - 1
+        item = list.pop(self, index)
+        self._release([item])
+        if last and self._index is not None:
+            # the popped item is the last entry of each of its buckets
+            for key, table in self._index.items():
+                value = self._index_key(item, key)
+                entry = table[value]
+                if type(entry) is not list:
+                    del table[value]
+                else:
+                    entry.pop()
+                    if len(entry) == 1:
+                        table[value] = entry[0]
+        else:
+            self._index = None
+        if self._value_index is not None:
+            self._value_index.remove([item])
+        self._modified()
+        return item
+
+    def clear(self):
+        del self[:]
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._index = None
+        if self._value_index is not None:
+            self._value_index.reordered = True
+        self._modified()
+
+    def reverse(self):
+        list.reverse(self)
+        self._index = None
+        if self._value_index is not None:
+            self._value_index.reordered = True
+        self._modified()
+
+    @staticmethod
+    def _index_key(item, key):
+        if type(key) is tuple:
+            return tuple(getattr(item, name, None) for name in key)
+        return getattr(item, key, None)
+
+    def _index_items(self, table, key, items):
+        # buckets hold a single item, or a list when several items match
+        for item in items:
+            value = self._index_key(item, key)
+            entry = table.get(value, _MISSING)
+            if entry is _MISSING:
+                table[value] = item
+            elif type(entry) is list:
+                entry.append(item)
+            else:
+                table[value] = [entry, item]
+
+    def _index_added(self, items):
+        if self._index is None:
+            return
+        try:
+            for key, table in self._index.items():
+                self._index_items(table, key, items)
+        except TypeError:
+            # unhashable attribute value
+            self._index = None
+
+    def _lookup(self, key, value):
+        """Return the items whose key attributes are equal to value.
+
+        Returns None when the lookup can't be served from the index.
+
+        """
+        index = self._index
+        table = None if index is None else index.get(key)
+        if table is None:
+            if len(self) < self._index_min_size:
+                # scanning is cheaper than building an index
+                return None
+            fields = getattr(self.item_class, '_fields', ())
+            names = key if type(key) is tuple else (key,)
+            for name in names:
+                if name not in fields or name not in self._indexed:
+                    return None
+            table = {}
+            try:
+                self._index_items(table, key, self)
+            except TypeError:
+                # unhashable attribute value
+                return None
+            if index is None:
+                # items tell the array when their indexed attributes change
+                self._track()
+                index = self._index = {}
+            index[key] = table
+        try:
+            entry = table.get(value, _MISSING)
+        except TypeError:
+            return None
+        if entry is _MISSING:
+            return ()
+        elif type(entry) is list:
+            return entry
+        return (entry,)
+
+    def _search(self, name=None, rel=None, href=None):
+        """Return the index bucket matching the search.
+
+        Returns None when the search can't be served from the index.
+
+        """
+        if href is not None:
+            results = self._lookup('href', href)
+            if results is None or (name is None and rel is None):
+                return results
+            return [item for item in results
+                    if self._match(item, name, rel)]
+        if rel is None and name is not None:
+            return self._lookup('name', name)
+        elif name is None and rel is not None:
+            return self._lookup('rel', rel)
+        return self._lookup(('name', 'rel'), (name, rel))
+
+    @staticmethod
+    def _match(item, name, rel):
+        item_name = getattr(item, 'name', None)
+        item_rel = getattr(item, 'rel', None)
+
+        if name is not None and item_name == name and rel is None:
+            # only searching by name
+            return True
+        elif rel is not None and item_rel == rel and name is None:
+            # only searching by rel
+            return True
+        # searching by name and rel
+        return item_name == name and item_rel == rel
+
+    def _matches(self, name=None, rel=None, href=None):
+        sink = _metrics_sink
+        items = self if sink is None else _CountingIterator(self)
+        try:
+            for item in items:
+                if href is not None:
+                    if getattr(item, 'href', None) != href:
+                        continue
+                    elif name is None and rel is None:
+                        # only searching by href
+                        yield item
+                        continue
+                if self._match(item, name, rel):
+                    yield item
+        finally:
+            if sink is not None:
+                sink('scan', {'array': self.collection_name,
+                              'size': len(self), 'elements': items.count})
+
+    def find(self, name=None, rel=None, href=None):
+        """Return a list of items in the array matching name and/or rel.
+
+        If both name and rel parameters are provided, returned items must match
+        both properties. If href is provided, returned items must also match
+        it.
+
+        """
+        results = self._search(name=name, rel=rel, href=href)
+        if results is None:
+            return list(self._matches(name=name, rel=rel, href=href))
+        return list(results)
+
+    def get(self, name=None, rel=None, href=None):
+        """Return the first item in the array matching name and/or rel.
+
+        If both name and rel parameters are provided, the returned item must
+        match both properties. If href is provided, the returned item must
+        also match it.
+
+        If no item is found, raises ValueError.
+
+        """
+        results = self._search(name=name, rel=rel, href=href)
+        if results is None:
+            results = self._matches(name=name, rel=rel, href=href)
+        for item in results:
+            return item
+        raise ValueError('No matching item found.')
+
+    def _require_data(self):
+        """Raise `TypeError` unless the items hold data."""
+        if 'data' not in getattr(self.item_class, '_fields', ()):
+            raise TypeError('%s objects have no data' % (
+                self.item_class.__name__))
+
+    def create_index(self, name, ordered=False):
+        """Index the items by the value of their data named name.
+
+        `where` then finds the items with a value, or one of several, through
+        a hash table instead of checking every item. With ordered, values are
+        also kept sorted, serving range comparisons.
+
+        Indexes are kept up to date as items are added, removed or changed.
+
+        """
+        self._require_data()
+        if self._value_index is None:
+            self._track()
+            self._value_index = _ValueIndex(self)
+        self._value_index.add_field(name, ordered)
+
+    def drop_index(self, name):
+        """Remove the index of the data named name.
+
+        Raises `ValueError` when there's no such index.
+
+        """
+        index = self._value_index
+        if index is None or name not in index.fields:
+            raise ValueError('No index for %r' % (name,))
+        del index.fields[name]
+        if index.empty:
+            self._value_index = None
+
+    @property
+    def indexes(self):
+        """Return a dict telling whether the index of each data is ordered."""
+        index = self._value_index
+        if index is None:
+            return {}
+        return dict((name, field.keys is not None)
+                    for name, field in index.fields.items())
+
+    def where(self, **predicates):
+        """Return the items whose data values match all the predicates.
+
+        Each keyword names a data, whose value in an item is the one of the
+        first data with that name, or None when there's none, like in
+        `to_columns`. The item matches when its value is equal to the
+        argument, or, with a suffix after the name, when it's in the
+        argument (name__in), or less (__lt), less or equal (__lte), greater
+        (__gt) or greater or equal (__gte) than the argument. Range
+        comparisons only match numbers with numbers and strings with
+        strings. name__eq is the same as name::
+
+            items.where(status='active', age__gte=18, role__in=['a', 'b'])
+
+        Predicates on data indexed with `create_index` are served from the
+        index, starting with the one matching the fewest items, and the
+        other predicates are only checked on those. Without index, every item
+        is checked. Items are returned once, in the order of the array.
+
+        Raises `ValueError` for unknown suffixes and range arguments that
+        are neither numbers nor strings.
+
+        """
+        self._require_data()
+        tests = _where_tests(predicates)
+        index = self._value_index
+        if index is not None:
+            results = index.where(tests)
+            if results is not None:
+                return results
+        results = []
+        seen = set()
+        for item in self:
+            if (_where_matches(_first_values(item), tests) and
+                    id(item) not in seen):
+                seen.add(id(item))
+                results.append(item)
+        return results
+
+    def create_text_index(self, prompts=False):
+        """Index the items by the words of their string data values.
+
+        With prompts, the words of the data prompts are indexed too. Words
+        are runs of letters, digits and underscores, compared in lowercase.
+        The index is kept up to date as items are added, removed or changed,
+        and makes `search` look up the words instead of reading every item.
+
+        """
+        self._require_data()
+        if self._value_index is None:
+            self._track()
+            self._value_index = _ValueIndex(self)
+        self._value_index.add_text(prompts)
+
+    def drop_text_index(self):
+        """Remove the text index.
+
+        Raises `ValueError` when there's no text index.
+
+        """
+        index = self._value_index
+        if index is None or index.text is None:
+            raise ValueError('No text index')
+        index.text = None
+        if index.empty:
+            self._value_index = None
+
+    def search(self, query, prefix=False, limit=None):
+        """Return the items holding every word of query in their data.
+
+        Items are ranked by the number of times the words are found in
+        their string data values, and prompts if indexed, then by their
+        order in the array. With prefix, each word of the query matches
+        the words starting with it, as when searching while typing. limit
+        gives the maximum number of items returned.
+
+        Uses the text index created with `create_text_index`, or a temporary
+        one over the items whose values hold every word of query.
+
+        """
+        index = self._value_index
+        if index is not None and index.text is not None:
+            return index.search(query, prefix, limit)
+        terms = _words(query)
+        text = _TextIndex()
+        positions = {}
+        for item in self:
+            if id(item) in positions:
+                continue
+            # words are found in the text, only those items can match
+            strings = ' '.join(_data_strings(item)).lower()
+            for term in terms:
+                if term not in strings:
+                    break
+            else:
+                positions[id(item)] = len(positions)
+                text.add(item)
+        return text.search(query, prefix, limit, positions)
+
+    def to_columns(self, names=None):
+        """Return a dictionary with a column of data values for each name.
+
+        Every column holds, for each item in the array, the value of the
+        first data with that name, or None for items without it. Columns are
+        NumPy arrays when NumPy is installed, and lists otherwise. The
+        positions of the items without a data are listed in the absent
+        attribute of the `Columns` returned, so that `Collection.from_columns`
+        leaves them out.
+
+        names defaults to all the data names, in order of appearance.
+
+        """
+        self._require_data()
+        size = len(self)
+        columns = Columns()
+        if names is not None:
+            for name in names:
+                columns[name] = [_MISSING] * size
+        for i, item in enumerate(self):
+            for name, value in _data_pairs(item):
+                column = columns.get(name)
+                if column is None:
+                    if names is not None:
+                        continue
+                    column = columns[name] = [_MISSING] * size
+                # the first data with a name wins
+                if column[i] is _MISSING:
+                    column[i] = value
+        for name, column in columns.items():
+            absent = [i for i, value in enumerate(column)
+                      if value is _MISSING]
+            if absent:
+                columns.absent[name] = absent
+                for i in absent:
+                    column[i] = None
+        return _to_arrays(columns)
+
+    def iter_ndjson(self, codec=None):
+        """Yield a line of JSON text for each item, ending in a newline.
+
+        Each line is the encoding of `item.to_dict()` with the given codec
+        or the default one.
+
+        """
+        codec = get_codec(codec)
+        if codec is _stdlib_codec:
+            for item in self:
+                yield item._json_text() + '\n'
+        else:
+            dumps = codec.dumps
+            for item in self:
+                yield dumps(item._shared_dict()) + '\n'
+
+    def write_ndjson(self, fp, codec=None, chunk_size=65536):
+        """Write the items to a file-like object as JSON Lines.
+
+        See `iter_ndjson`. Lines are written in chunks of about chunk_size
+        characters, files that only take bytes get them encoded as UTF-8.
+
+        Returns the number of items written.
+
+        """
+        write = _text_writer(fp)
+        count = 0
+        buffered = []
+        size = 0
+        for line in self.iter_ndjson(codec):
+            buffered.append(line)
+            size += len(line)
+            count += 1
+            if size >= chunk_size:
+                write(''.join(buffered))
+                buffered = []
+                size = 0
+        if buffered:
+            write(''.join(buffered))
+        return count
+
+    def _build_dict(self, cache, shared):
+        """Return the list of the dictionaries representing the items."""
+        return [item._to_dict(cache, shared) for item in self]
+
+    def _wrap(self, output):
+        return {self._collection_name: output}
+
+    def _json_text(self, cache=False):
+        """Return the JSON text of the list of items."""
+        text = self._kept_json()
+        if text is None:
+            text = '[' + ', '.join([item._json_text(cache)
+                                    for item in self]) + ']'
+            if cache:
+                self._track().json = text
+        return text
+
+    def _iter_json_members(self, cache=False):
+        """Yield the JSON text of the dictionary members, without braces.
+
+        Unless the text of the whole list is kept, each item is encoded from
+        its own dictionary representation and yielded as a separate fragment.
+
+        """
+        yield _encode(self._collection_name) + ': '
+        if cache or self._kept_json() is not None:
+            yield self._json_text(cache)
+            return
+        yield '['
+        separator = ''
+        for item in self:
+            yield separator + item._json_text()
+            separator = ', '
+        yield ']'
+
+
+class Item(ComparableObject):
+
+    """Object representing a Collection+JSON item object."""
+
+    __slots__ = ('_href', '_data', '_links', '_values', '_meta',
+                 '__weakref__')
+
+    _fields = ('href', 'data', 'links')
+
+    href = _FieldProperty('href')
+    data = _DataProperty(Data, "data")
     links = ArrayProperty(Link, "links")
 
+    @classmethod
+    def _view(cls, source):
+        item = super(Item, cls)._view(source)
+        item._values = None
+        return item
+
+    @classmethod
+    def _new(cls, href, data, links, packed=None):
+        """Return an item holding data and links, which must be new objects.
+
+        Packed items get a `_Schema` and a tuple of values in packed instead
+        of data, see `_DataProperty`.
+
+        """
+        item = cls.__new__(cls)
+        item._href = href
+        item._values = packed
+        item._meta = None
+        if packed is None:
+            item._data = Array._new(Data, 'data', data)
+        item._links = Array._new(Link, 'links', links)
+        return item
+
     def __init__(self, href=None, data=None, links=None):
-        self.href = href
-        self.data = data
-        self.links = links
+        self._href = href
+        self._values = None
+        self._meta = None
+        self._data = Array(Data, 'data', [] if data is None else data)
+        self._links = Array(Link, 'links', [] if links is None else links)
 
     def __repr__(self):
         return "<Item: href='%s'>" % self.href
 
     def __getattr__(self, name):
-        return getattr(self.data, name)
+        if _not_data_name(type(self), name):
+            raise AttributeError(name)
+        return self.data._named(name)
 
     @property
     def properties(self):
         """Return a list of names that can be looked up on the item."""
         return [item.name for item in self.data]
 
-    def to_dict(self):
+    def _build_dict(self, cache, shared):
         """Return a dictionary representing an Item object."""
         output = {}
         if self.href:
             output['href'] = self.href
-        if self.data:
-            output.update(self.data.to_dict())
-        if self.links:
-            output.update(self.links.to_dict())
+        packed = self._values
+        if packed is not None:
+            if packed[1]:
+                output['data'] = packed[0].to_dict(packed[1])
+        else:
+            data = self.data._to_dict(cache, shared)
+            if data:
+                output['data'] = data
+        links = self.links._to_dict(cache, shared)
+        if links:
+            output['links'] = links
         return output
 
 
+class _Schema(object):
+
+    """The names and prompts of the data shared by packed items."""
+
+    __slots__ = ('names', 'prompts')
+
+    def __init__(self, names, prompts):
+        self.names = names
+        self.prompts = prompts
+
+    def build(self, values):
+        """Return the Data objects holding values."""
+        return [Data(name, value, prompt) for name, value, prompt in
+                zip(self.names, values, self.prompts)]
+
+    def to_dict(self, values):
+        """Return the list of data dictionaries holding values."""
+        output = []
+        for name, value, prompt in zip(self.names, values, self.prompts):
+            data = {'name': name}
+            if value is not None:
+                data['value'] = value
+            if prompt is not None:
+                data['prompt'] = prompt
+            output.append(data)
+        return output
+
+
+_DATA_KEYS = frozenset(['name', 'value', 'prompt'])
+
+
+class _Packer(object):
+
+    """Builds packed items, sharing repeated strings and schemas.
+
+    Data names and prompts, and link rels, names, renders and prompts are
+    interned, so that equal strings are stored once. Items whose data have
+    the same names and prompts share one `_Schema`.
+
+    """
+
+    def __init__(self):
+        self.strings = {}
+        self.schemas = {}
+
+    def intern(self, value):
+        """Return the first string equal to value seen, or value itself."""
+        if type(value) is not _text_type:
+            return value
+        return self.strings.setdefault(value, value)
+
+    def schema(self, names, prompts):
+        """Return the shared schema for the names and prompts."""
+        key = (names, prompts)
+        schema = self.schemas.get(key)
+        if schema is None:
+            schema = self.schemas[key] = _Schema(names, prompts)
+        return schema
+
+    def items(self, items):
+        """Return a list with packed items for the dictionaries in items."""
+        return [self.item(**item) if isinstance(item, dict) else item
+                for item in items]
+
+    def item(self, href=None, data=None, links=None):
+        """Return a packed item from the arguments of `Item`."""
+        intern = self.intern
+        names = []
+        values = []
+        prompts = []
+        for value in data or ():
+            if isinstance(value, Data):
+                value = value._shared_dict()
+            elif not isinstance(value, dict):
+                raise ValueError("Invalid value for Data: %r" % (value,))
+            elif not _DATA_KEYS.issuperset(value) or 'name' not in value:
+                # raises the same error as the constructor
+                Data(**value)
+            names.append(intern(value['name']))
+            values.append(value.get('value'))
+            prompts.append(intern(value.get('prompt')))
+        built = []
+        for link in links or ():
+            if isinstance(link, dict):
+                link = Link(**link)
+            elif not isinstance(link, Link):
+                raise ValueError("Invalid value for Link: %r" % (link,))
+            for name in ('rel', 'name', 'render', 'prompt'):
+                setattr(link, '_' + name, intern(getattr(link, name)))
+            built.append(link)
+        schema = self.schema(tuple(names), tuple(prompts))
+        return Item._new(href, None, built, (schema, tuple(values)))
+
+
+def _data_pairs(item):
+    """Return the name and value of each data of item, building no Data."""
+    source = _source_of(item)
+    if source is not None:
+        pairs = []
+        for data in source.get('data') or ():
+            if not isinstance(data, dict):
+                raise ValueError("Invalid value for Data: %r" % (data,))
+            pairs.append((data.get('name'), data.get('value')))
+        return pairs
+    packed = getattr(item, '_values', None)
+    if packed is not None:
+        return list(zip(packed[0].names, packed[1]))
+    return [(data._name, data._value) for data in item.data]
+
+
+def _first_values(item):
+    """Return the value of the first data with each name of item."""
+    values = {}
+    for name, value in _data_pairs(item):
+        if name not in values:
+            values[name] = value
+    return values
+
+
+_INFINITY = float('inf')
+_RANGE_OPERATORS = {
+    'lt': operator.lt,
+    'lte': operator.le,
+    'gt': operator.gt,
+    'gte': operator.ge,
+}
+
+
+def _sort_key(value):
+    """Return the key ordering value among comparable values, or None.
+
+    Numbers come before strings, NaN and other values aren't ordered.
+
+    """
+    if isinstance(value, _STRING_TYPES):
+        return (1, value)
+    if isinstance(value, numbers.Real) and value == value:
+        return (0, value)
+    return None
+
+
+def _where_tests(predicates):
+    """Return (name, operator, argument) tuples for the where keywords."""
+    tests = []
+    for keyword, argument in predicates.items():
+        name, _, suffix = keyword.rpartition('__')
+        if not name:
+            name, suffix = keyword, 'eq'
+        if suffix == 'in':
+            argument = list(argument)
+        elif suffix in _RANGE_OPERATORS:
+            key = _sort_key(argument)
+            if key is None:
+                raise ValueError('Can only compare numbers and strings, '
+                                 'got %r' % (argument,))
+            argument = key
+        elif suffix != 'eq':
+            raise ValueError('Unknown predicate: %s' % keyword)
+        tests.append((name, suffix, argument))
+    return tests
+
+
+def _where_test(suffix, value, argument):
+    """Return whether value passes a test of `_where_tests`."""
+    if suffix == 'eq':
+        return value == argument
+    if suffix == 'in':
+        return value in argument
+    key = _sort_key(value)
+    return (key is not None and key[0] == argument[0] and
+            _RANGE_OPERATORS[suffix](key[1], argument[1]))
+
+
+def _where_matches(values, tests):
+    """Return whether the data values of an item pass all the tests."""
+    for name, suffix, argument in tests:
+        if not _where_test(suffix, values.get(name), argument):
+            return False
+    return True
+
+
+class _FieldIndex(object):
+
+    """The items of an array by the value of one data.
+
+    Hashable values have a bucket of items by id, the others are kept apart.
+    With ordered, keys holds a sorted (group, value, id) entry for each item
+    whose value is a number or a string, see `_sort_key`.
+
+    """
+
+    __slots__ = ('values', 'buckets', 'unhashable', 'keys')
+
+    def __init__(self, ordered=False):
+        # indexed value by id of item
+        self.values = {}
+        self.buckets = {}
+        self.unhashable = {}
+        self.keys = [] if ordered else None
+
+    def build(self, items, name):
+        """Index items, which must not be indexed yet, in bulk."""
+        keys = self.keys
+        self.keys = None
+        for item in items:
+            self.add(item, _first_values(item).get(name))
+        if keys is not None:
+            for key, value in self.values.items():
+                sort_key = _sort_key(value)
+                if sort_key is not None:
+                    keys.append(sort_key + (key,))
+            keys.sort()
+            self.keys = keys
+
+    def add(self, item, value):
+        key = id(item)
+        self.values[key] = value
+        try:
+            bucket = self.buckets.get(value)
+        except TypeError:
+            self.unhashable[key] = item
+            return
+        if bucket is None:
+            bucket = self.buckets[value] = {}
+        bucket[key] = item
+        if self.keys is not None:
+            sort_key = _sort_key(value)
+            if sort_key is not None:
+                bisect.insort(self.keys, sort_key + (key,))
+
+    def remove(self, item):
+        key = id(item)
+        value = self.values.pop(key)
+        if self.unhashable.pop(key, None) is not None:
+            return
+        bucket = self.buckets[value]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[value]
+        if self.keys is not None:
+            sort_key = _sort_key(value)
+            if sort_key is not None:
+                entry = sort_key + (key,)
+                del self.keys[bisect.bisect_left(self.keys, entry)]
+
+    def update(self, item, value):
+        current = self.values[id(item)]
+        if type(current) is type(value) and current == value:
+            return
+        self.remove(item)
+        self.add(item, value)
+
+    def _range(self, suffix, argument):
+        """Return the start and end positions of the sorted range."""
+        keys = self.keys
+        group = argument[0]
+        # entries with the value of argument sort between these two
+        first = argument
+        last = argument + (_INFINITY,)
+        if suffix in ('lt', 'lte'):
+            start = bisect.bisect_left(keys, (group,))
+            end = bisect.bisect_left(keys, first if suffix == 'lt' else last)
+        else:
+            start = bisect.bisect_left(keys, last if suffix == 'gt' else first)
+            end = bisect.bisect_left(keys, (group + 1,))
+        return start, end
+
+    def _bucket(self, value):
+        try:
+            return self.buckets.get(value) or {}
+        except TypeError:
+            return dict((key, item) for key, item in self.unhashable.items()
+                        if self.values[key] == value)
+
+    def count(self, suffix, argument):
+        """Return the number of items passing a test, None if unserved."""
+        if suffix == 'eq':
+            return len(self._bucket(argument))
+        if suffix == 'in':
+            return sum(len(self._bucket(value)) for value in argument)
+        if self.keys is None:
+            return None
+        start, end = self._range(suffix, argument)
+        return end - start
+
+    def select(self, suffix, argument):
+        """Return the items passing a test that `count` can serve."""
+        if suffix == 'eq':
+            return list(self._bucket(argument).values())
+        if suffix == 'in':
+            selected = {}
+            for value in argument:
+                selected.update(self._bucket(value))
+            return list(selected.values())
+        start, end = self._range(suffix, argument)
+        buckets = self.buckets
+        return [buckets[value][key]
+                for _, value, key in self.keys[start:end]]
+
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def _words(text):
+    """Return the lowercase words of text."""
+    return _WORD.findall(text.lower())
+
+
+def _data_strings(item, prompts=False):
+    """Yield the string data values of item, and prompts if asked to."""
+    source = _source_of(item)
+    packed = getattr(item, '_values', None)
+    if source is not None:
+        pairs = [(data.get('value'), data.get('prompt'))
+                 for data in source.get('data') or ()
+                 if isinstance(data, dict)]
+    elif packed is not None:
+        pairs = zip(packed[1], packed[0].prompts)
+    else:
+        pairs = [(data._value, data._prompt) for data in item.data]
+    for value, prompt in pairs:
+        if isinstance(value, _STRING_TYPES):
+            yield value
+        if prompts and isinstance(prompt, _STRING_TYPES):
+            yield prompt
+
+
+class _TextIndex(object):
+
+    """The items of an array by the words of their string data values.
+
+    postings maps each word to the number of times it's found in each item,
+    by id of item. The sorted vocabulary serves prefix queries, it's only
+    sorted again on the first prefix query after a bulk build.
+
+    """
+
+    def __init__(self, prompts=False):
+        self.prompts = prompts
+        self.items = {}
+        self.words = {}
+        self.postings = {}
+        self.vocabulary = None
+
+    def build(self, items):
+        """Index items, which must not be indexed yet, in bulk."""
+        # the vocabulary is sorted when first needed
+        self.vocabulary = None
+        for item in items:
+            self.add(item)
+
+    def _count(self, item):
+        counts = {}
+        for text in _data_strings(item, self.prompts):
+            for word in _words(text):
+                counts[word] = counts.get(word, 0) + 1
+        return counts
+
+    def add(self, item, counts=None):
+        key = id(item)
+        if counts is None:
+            counts = self._count(item)
+        self.items[key] = item
+        self.words[key] = counts
+        postings = self.postings
+        for word, hits in counts.items():
+            posting = postings.get(word)
+            if posting is None:
+                posting = postings[word] = {}
+                if self.vocabulary is not None:
+                    bisect.insort(self.vocabulary, word)
+            posting[key] = hits
+
+    def remove(self, item):
+        key = id(item)
+        del self.items[key]
+        postings = self.postings
+        for word in self.words.pop(key):
+            posting = postings[word]
+            del posting[key]
+            if not posting:
+                del postings[word]
+                if self.vocabulary is not None:
+                    del self.vocabulary[
+                        bisect.bisect_left(self.vocabulary, word)]
+
+    def update(self, item):
+        counts = self._count(item)
+        if counts != self.words[id(item)]:
+            self.remove(item)
+            self.add(item, counts)
+
+    def _expand(self, term):
+        """Return the words starting with term."""
+        vocabulary = self.vocabulary
+        if vocabulary is None:
+            vocabulary = self.vocabulary = sorted(self.postings)
+        words = []
+        for position in range(bisect.bisect_left(vocabulary, term),
+                              len(vocabulary)):
+            word = vocabulary[position]
+            if not word.startswith(term):
+                break
+            words.append(word)
+        return words
+
+    def search(self, query, prefix, limit, positions):
+        """Return the items holding every word of query, see `Array.search`.
+
+        positions gives the position of the items by id, for ties.
+
+        """
+        hits = []
+        for term in set(_words(query)):
+            words = self._expand(term) if prefix else [term]
+            postings = [self.postings[word] for word in words
+                        if word in self.postings]
+            if not postings:
+                return []
+            if len(postings) == 1:
+                hits.append(postings[0])
+                continue
+            term_hits = {}
+            for posting in postings:
+                for key, count in posting.items():
+                    term_hits[key] = term_hits.get(key, 0) + count
+            hits.append(term_hits)
+        if not hits:
+            return []
+        hits.sort(key=len)
+        scores = {}
+        for key, count in hits[0].items():
+            for other in hits[1:]:
+                other_count = other.get(key)
+                if other_count is None:
+                    break
+                count += other_count
+            else:
+                scores[key] = count
+
+        def rank(key):
+            return (-scores[key], positions[key])
+        if limit is None:
+            keys = sorted(scores, key=rank)
+        else:
+            keys = heapq.nsmallest(limit, scores, key=rank)
+        return [self.items[key] for key in keys]
+
+
+class _ValueIndex(object):
+
+    """The indexes of the items of an array by data value.
+
+    Items are indexed once each, however many times they're in the array.
+    Their positions give the order of the results, they're rebuilt after
+    items are inserted or reordered, but stay in order as items are
+    appended or removed.
+
+    """
+
+    def __init__(self, array):
+        self.array = array
+        self.fields = {}
+        self.text = None
+        self.rebuild()
+
+    def add_field(self, name, ordered=False):
+        field = self.fields.get(name)
+        if field is not None and (field.keys is not None) == ordered:
+            return
+        field = _FieldIndex(ordered)
+        field.build(self._unique_items(), name)
+        self.fields[name] = field
+
+    def add_text(self, prompts=False):
+        text = self.text
+        if text is not None and text.prompts == prompts:
+            return
+        text = _TextIndex(prompts)
+        text.build(self._unique_items())
+        self.text = text
+
+    @property
+    def empty(self):
+        """Whether the array has neither field nor text index."""
+        return not self.fields and self.text is None
+
+    def _unique_items(self):
+        seen = set()
+        for item in self.array:
+            if id(item) not in seen:
+                seen.add(id(item))
+                yield item
+
+    def add(self, items, reordered=False):
+        fields = self.fields
+        text = self.text
+        for item in items:
+            key = id(item)
+            count = self.counts.get(key)
+            if count:
+                self.counts[key] = count + 1
+                continue
+            self.counts[key] = 1
+            self.positions[key] = self.next_position
+            self.next_position += 1
+            if fields:
+                values = _first_values(item)
+                for name, field in fields.items():
+                    field.add(item, values.get(name))
+            if text is not None:
+                text.add(item)
+        if reordered:
+            self.reordered = True
+
+    def remove(self, items):
+        for item in items:
+            key = id(item)
+            count = self.counts[key]
+            if count > 1:
+                self.counts[key] = count - 1
+                # the first occurrence may be the one removed
+                self.reordered = True
+                continue
+            del self.counts[key]
+            del self.positions[key]
+            for field in self.fields.values():
+                field.remove(item)
+            if self.text is not None:
+                self.text.remove(item)
+
+    def rebuild(self):
+        """Index the items of the array again."""
+        fields = self.fields
+        text = self.text
+        self.fields = {}
+        self.text = None
+        self.counts = {}
+        self.positions = {}
+        self.next_position = 0
+        self.reordered = False
+        self.add(self.array)
+        for name, field in fields.items():
+            self.add_field(name, field.keys is not None)
+        if text is not None:
+            self.add_text(text.prompts)
+
+    def update(self, item):
+        if id(item) not in self.counts:
+            return
+        if self.fields:
+            values = _first_values(item)
+            for name, field in self.fields.items():
+                field.update(item, values.get(name))
+        if self.text is not None:
+            self.text.update(item)
+
+    def ordered_positions(self):
+        """Return the position of the items by id, in array order."""
+        if self.reordered:
+            positions = {}
+            for position, item in enumerate(self.array):
+                positions.setdefault(id(item), position)
+            self.positions = positions
+            self.next_position = len(self.array)
+            self.reordered = False
+        return self.positions
+
+    def where(self, tests):
+        """Return the items passing the tests, in the order of the array.
+
+        Returns None when no test can be served from the index.
+
+        """
+        best = None
+        for test in tests:
+            field = self.fields.get(test[0])
+            if field is None:
+                continue
+            count = field.count(test[1], test[2])
+            if count is not None and (best is None or count < best[0]):
+                best = (count, field, test)
+        if best is None:
+            return None
+        count, field, selected = best
+        others = [test for test in tests if test is not selected]
+        results = []
+        for item in field.select(selected[1], selected[2]):
+            values = None
+            for name, suffix, argument in others:
+                other = self.fields.get(name)
+                if other is not None:
+                    value = other.values[id(item)]
+                else:
+                    if values is None:
+                        values = _first_values(item)
+                    value = values.get(name)
+                if not _where_test(suffix, value, argument):
+                    break
+            else:
+                results.append(item)
+        positions = self.ordered_positions()
+        results.sort(key=lambda item: positions[id(item)])
+        return results
+
+    def search(self, query, prefix=False, limit=None):
+        return self.text.search(query, prefix, limit,
+                                self.ordered_positions())
+
+
 class Query(ComparableObject):
 
     """Object representing a Collection+JSON query object."""
 
+    __slots__ = ('_href', '_rel', '_name', '_prompt', '_data', '_meta',
+                 '__weakref__')
+
+    _fields = ('href', 'rel', 'name', 'prompt', 'data')
+
+    href = _FieldProperty('href')
+    rel = _FieldProperty('rel')
+    name = _FieldProperty('name')
+    prompt = _FieldProperty('prompt')
     data = ArrayProperty(Data, "data")
 
     def __init__(self, href, rel, name=None, prompt=None, data=None):
-        self.href = href
-        self.rel = rel
-        self.name = name
-        self.prompt = prompt
+        self._href = href
+        self._rel = rel
+        self._name = name
+        self._prompt = prompt
+        self._meta = None
         self.data = data
 
     def __repr__(self):
@@ -376,7 +2654,37 @@ class Query(ComparableObject):
             data += " prompt='%s'" % self.prompt
         return "<Query: %s>" % data
 
-    def to_dict(self):
+    def build_url(self, **values):
+        """Return the href of the query with the data values appended.
+
+        See `CompiledQuery.build_url`.
+
+        """
+        return self.compile().build_url(**values)
+
+    def compile(self):
+        """Return the CompiledQuery for the href, rel, name and data.
+
+        Compiled queries are shared by equal queries of every collection,
+        keeping the 1024 most recently compiled ones.
+
+        """
+        key = (self.href, self.rel, self.name, tuple(_data_pairs(self)))
+        try:
+            return _compiled_queries[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # values that can't be hashed
+            return CompiledQuery(self.href, key[3])
+        compiled = CompiledQuery(self.href, key[3])
+        with _compiled_queries_lock:
+            if len(_compiled_queries) >= _QUERY_CACHE_SIZE:
+                _compiled_queries.popitem(last=False)
+            _compiled_queries[key] = compiled
+        return compiled
+
+    def _build_dict(self, cache, shared):
         """Return a dictionary representing a Query object."""
         output = {
             'href': self.href,
@@ -386,15 +2694,363 @@ class Query(ComparableObject):
             output['name'] = self.name
         if self.prompt is not None:
             output['prompt'] = self.prompt
-        if len(self.data):
-            output.update(self.data.to_dict())
+        data = self.data._to_dict(cache, shared)
+        if data:
+            output['data'] = data
         return output
 
 
+# characters that quote_plus leaves as they are, besides spaces
+_UNQUOTED = re.compile(r'[A-Za-z0-9_. -]*\Z')
+
+
+def _quote(value):
+    """Return value encoded for the query string of a URL."""
+    if type(value) is not _text_type:
+        if value is True or value is False:
+            value = 'true' if value else 'false'
+        else:
+            value = _text_type(value)
+    if _UNQUOTED.match(value):
+        return value.replace(' ', '+')
+    return quote_plus(value.encode('utf-8'))
+
+
+class CompiledQuery(object):
+
+    """A query with the parts of its URLs encoded ahead, see `Query.compile`.
+
+    :param href str: the href of the query
+    :param data: the name and default value of each data of the query
+
+    """
+
+    def __init__(self, href, data):
+        base, _, fragment = href.partition('#')
+        if not base.endswith(('?', '&')):
+            base += '&' if '?' in base else '?'
+        self._base = base
+        self._href = href
+        self._fragment = '#' + fragment if fragment else ''
+        self._keys = []
+        self._defaults = []
+        self._positions = {}
+        for position, (name, value) in enumerate(data):
+            key = _quote(name) + '='
+            self._keys.append(key)
+            self._defaults.append(self._encode(key, value))
+            self._positions.setdefault(name, []).append(position)
+
+    def __repr__(self):
+        return "<CompiledQuery: href='%s'>" % self._href
+
+    @staticmethod
+    def _encode(key, value):
+        if value is None:
+            return None
+        if isinstance(value, (list, tuple)):
+            return '&'.join([key + _quote(item) for item in value]) or None
+        return key + _quote(value)
+
+    def build_url(self, **values):
+        """Return the href of the query with the data values appended.
+
+        Values are given by data name, data left out keep the value of the
+        query, and data whose value is None are left out of the URL. Lists
+        of values repeat the parameter.
+
+        Raises `ValueError` for names that aren't data of the query.
+
+        """
+        parts = list(self._defaults)
+        for name, value in values.items():
+            positions = self._positions.get(name)
+            if positions is None:
+                raise ValueError('No data named %r in query' % (name,))
+            for position in positions:
+                parts[position] = self._encode(self._keys[position], value)
+        query = '&'.join([part for part in parts if part is not None])
+        if not query:
+            return self._href
+        return self._base + query + self._fragment
+
+
+_QUERY_CACHE_SIZE = 1024
+_compiled_queries = OrderedDict()
+_compiled_queries_lock = threading.Lock()
+
+
+class ValidationError(ValueError):
+
+    """Raised by strict parsing for a document breaking Collection+JSON.
+
+    :param errors list: (path, message) pairs for every problem found, in
+        document order, where path is a JSONPath such as
+        '$.collection.items[2].data[0].name'
+
+    """
+
+    _MAX_LINES = 20
+
+    def __init__(self, errors):
+        self.errors = errors
+        lines = ['%s: %s' % error for error in errors[:self._MAX_LINES]]
+        if len(errors) > self._MAX_LINES:
+            lines.append('... and %d more' % (len(errors) - self._MAX_LINES))
+        super(ValidationError, self).__init__(
+            'Invalid Collection+JSON document:\n' + '\n'.join(lines))
+
+
+def _format_path(path):
+    """Return the JSONPath of a tuple of member names and indexes."""
+    text = '$'
+    for part in path:
+        if isinstance(part, int):
+            text += '[%d]' % part
+        else:
+            text += '.' + part
+    return text
+
+
+_STRING_TYPES = (_text_type, str)
+_VALUE_TYPES = (_text_type, str, numbers.Number)
+_RENDERS = ('image', 'link')
+# the exact types of members decoded from valid documents
+_SCALAR_TYPES = frozenset([_text_type, int, float, bool, type(None)])
+_OPTIONAL_STRING_TYPES = frozenset([_text_type, type(None)])
+_OPTIONAL_RENDERS = _RENDERS + (None,)
+_LINK_KEYS = frozenset(['href', 'rel', 'name', 'render', 'prompt'])
+_ITEM_KEYS = frozenset(['href', 'data', 'links'])
+_QUERY_KEYS = frozenset(['href', 'rel', 'name', 'prompt', 'data'])
+_TEMPLATE_KEYS = frozenset(['data'])
+_ERROR_KEYS = frozenset(['code', 'message', 'title'])
+_COLLECTION_KEYS = frozenset(['version', 'href', 'links', 'items',
+                              'queries', 'template', 'error'])
+
+
+class _Validator(object):
+
+    """Checks a decoded collection member while building its objects.
+
+    Every problem found is recorded in errors with the path leading to it.
+    Objects are built from the members as they are checked, so the document
+    is walked only once; after the first problem, building stops and the
+    rest of the document is only checked.
+
+    With lazy, no objects are built and the collection is a view of the
+    member. With a packer, items are packed by it.
+
+    """
+
+    def __init__(self, lazy=False, packer=None):
+        self.errors = []
+        self.lazy = lazy
+        self.build = not lazy
+        self.packer = packer
+
+    def error(self, path, message):
+        self.errors.append((_format_path(path), message))
+        self.build = False
+
+    def check(self, value, path, keys):
+        """Return whether value is an object, and check its member names."""
+        if not isinstance(value, dict):
+            self.error(path, 'must be an object')
+            return False
+        if not keys.issuperset(value):
+            for key in value:
+                if key not in keys:
+                    self.error(path + (key,), 'is not a member of this object')
+        return True
+
+    def string(self, value, key, path, required=False):
+        """Return the member key of value, checking that it's a string."""
+        member = value.get(key)
+        if member is None:
+            if required:
+                self.error(path + (key,), 'is required')
+        elif not isinstance(member, _STRING_TYPES):
+            self.error(path + (key,), 'must be a string')
+        return member
+
+    def array(self, value, key, path, element):
+        """Return the results of element for the members of an array."""
+        members = value.get(key)
+        if members is None:
+            return []
+        path = path + (key,)
+        if not isinstance(members, list):
+            self.error(path, 'must be an array')
+            return []
+        return [element(member, path + (index,))
+                for index, member in enumerate(members)]
+
+    def check_data(self, value, path):
+        if (type(value) is dict and _DATA_KEYS.issuperset(value) and
+                type(value.get('name')) is _text_type and
+                type(value.get('value')) in _SCALAR_TYPES and
+                type(value.get('prompt')) in _OPTIONAL_STRING_TYPES):
+            # the common case, checked without reporting
+            return
+        if self.check(value, path, _DATA_KEYS):
+            self.string(value, 'name', path, True)
+            self.string(value, 'prompt', path)
+            member = value.get('value')
+            if member is not None and not isinstance(member, _VALUE_TYPES):
+                self.error(path + ('value',),
+                           'must be a string, number, boolean or null')
+
+    def data(self, value, path):
+        self.check_data(value, path)
+        if self.build:
+            return Data(value['name'], value.get('value'), value.get('prompt'))
+
+    def link(self, value, path):
+        if not (type(value) is dict and _LINK_KEYS.issuperset(value) and
+                type(value.get('href')) is _text_type and
+                type(value.get('rel')) is _text_type and
+                type(value.get('name')) in _OPTIONAL_STRING_TYPES and
+                type(value.get('prompt')) in _OPTIONAL_STRING_TYPES and
+                value.get('render') in _OPTIONAL_RENDERS):
+            if not self.check(value, path, _LINK_KEYS):
+                return None
+            self.string(value, 'href', path, True)
+            self.string(value, 'rel', path, True)
+            self.string(value, 'name', path)
+            render = self.string(value, 'render', path)
+            self.string(value, 'prompt', path)
+            if isinstance(render, _STRING_TYPES) and render not in _RENDERS:
+                self.error(path + ('render',), "must be 'image' or 'link'")
+        if self.build:
+            get = value.get
+            return Link(get('href'), get('rel'), get('name'), get('render'),
+                        get('prompt'))
+
+    def item(self, value, path):
+        if not (type(value) is dict and _ITEM_KEYS.issuperset(value) and
+                type(value.get('href')) in _OPTIONAL_STRING_TYPES):
+            if not self.check(value, path, _ITEM_KEYS):
+                return None
+            self.string(value, 'href', path)
+        href = value.get('href')
+        if self.packer is not None:
+            self.array(value, 'data', path, self.check_data)
+            links = self.array(value, 'links', path, self.link)
+            if self.build:
+                return self.packer.item(href, value.get('data'), links)
+            return None
+        data = self.array(value, 'data', path, self.data)
+        links = self.array(value, 'links', path, self.link)
+        if not self.build:
+            return None
+        return Item._new(href, data, links)
+
+    def items(self, values):
+        """Return the items for the item members in values."""
+        return [self.item(value, ('collection', 'items', index))
+                for index, value in enumerate(values)]
+
+    def query(self, value, path):
+        if not self.check(value, path, _QUERY_KEYS):
+            return None
+        href = self.string(value, 'href', path, True)
+        rel = self.string(value, 'rel', path, True)
+        name = self.string(value, 'name', path)
+        prompt = self.string(value, 'prompt', path)
+        data = self.array(value, 'data', path, self.data)
+        if self.build:
+            return Query(href, rel, name, prompt, data)
+
+    def template(self, value, path):
+        if not self.check(value, path, _TEMPLATE_KEYS):
+            return None
+        data = self.array(value, 'data', path, self.data)
+        if self.build:
+            return Template(data)
+
+    def error_member(self, value, path):
+        if not self.check(value, path, _ERROR_KEYS):
+            return None
+        code = self.string(value, 'code', path)
+        message = self.string(value, 'message', path)
+        title = self.string(value, 'title', path)
+        if self.build:
+            return Error(code, message, title)
+
+    def document(self, document):
+        """Check that a decoded document holds a collection member.
+
+        The member itself is checked by `collection`.
+
+        Raises `ValidationError` when there's no such member.
+
+        """
+        if not isinstance(document, dict):
+            self.error((), 'must be an object')
+        elif 'collection' not in document:
+            self.error(('collection',), 'is required')
+        if self.errors:
+            raise ValidationError(self.errors)
+
+    def collection(self, value, items=None):
+        """Return the Collection for the decoded collection member.
+
+        items are the items built with `items`, when the item members were
+        checked as they were decoded.
+
+        Raises `ValidationError` when any problem was found.
+
+        """
+        path = ('collection',)
+        if self.check(value, path, _COLLECTION_KEYS):
+            self.string(value, 'version', path)
+            href = self.string(value, 'href', path, True)
+            links = self.array(value, 'links', path, self.link)
+            if items is None:
+                items = self.array(value, 'items', path, self.item)
+            queries = self.array(value, 'queries', path, self.query)
+            template = value.get('template')
+            if template is not None:
+                template = self.template(template, path + ('template',))
+            error = value.get('error')
+            if error is not None:
+                error = self.error_member(error, path + ('error',))
+        if self.errors:
+            raise ValidationError(self.errors)
+        if self.lazy:
+            return Collection._view(value)
+        return Collection(href, links, items, queries, template, error,
+                          value.get('version', '1.0'))
+
+
+def _collection_member(document, strict=False):
+    """Return the collection member of a decoded document.
+
+    Raises `ValueError` when it's missing or isn't a non-empty object. With
+    strict, a missing member raises `ValidationError` instead, and the
+    member is left for `_Validator.collection` to check.
+
+    """
+    if strict:
+        _Validator().document(document)
+        return document['collection']
+    member = None
+    if isinstance(document, dict):
+        member = document.get('collection')
+    if not member or not isinstance(member, dict):
+        raise ValueError('Not a valid Collection+JSON document.')
+    return member
+
+
 class Collection(ComparableObject):
 
     """Object representing a Collection+JSON document."""
 
+    _fields = ('version', 'href', 'error', 'template', 'items', 'links',
+               'queries')
+
+    version = _FieldProperty('version')
+    href = _FieldProperty('href')
     error = TypedProperty(Error, "error")
     template = TypedProperty(Template, "template")
     items = ArrayProperty(Item, "items")
@@ -402,25 +3058,318 @@ class Collection(ComparableObject):
     queries = ArrayProperty(Query, "queries")
 
     @staticmethod
-    def from_json(data):
+    def from_json(data, codec=None, lazy=False, compact=False, strict=False):
         """Return a Collection instance.
 
-        This method parses a json string into a Collection object.
+        This method parses a json str or bytes into a Collection object,
+        using the given codec or the default one.
 
-        Raises `ValueError` when no valid document is provided.
+        With lazy, the collection is a view of the decoded document: nested
+        objects are only built when accessed, and `to_dict` returns the
+        decoded dictionaries of the parts that weren't modified, including
+        members unknown to this module; copied, unless cache is given.
+        Changing an object only rebuilds the dictionaries of that object and
+        the ones containing it.
+
+        With compact, the items are packed: the strings repeated between
+        items, such as data names and link rels, are stored once, and items
+        whose data have the same names and prompts share them, holding only
+        the values. The Data objects of an item are built when its data is
+        accessed.
+
+        With strict, the collection member is checked against the
+        Collection+JSON format while its objects are built: required members
+        such as the href and rel of links and queries, the types of all
+        members, and names unknown to the format. Every problem is reported
+        at once in a `ValidationError`, with the path leading to it.
+
+        Raises `ValueError` when no valid document is provided, or when both
+        lazy and compact are given.
 
         """
+        if lazy and compact:
+            raise ValueError('lazy and compact are mutually exclusive')
+        codec = get_codec(codec)
+        sink = _metrics_sink
+        if sink is not None:
+            start = _clock()
         try:
-            data = json.loads(data)
-            kwargs = data.get('collection')
-            if not kwargs:
-                raise ValueError
+            document = codec.loads(data)
         except ValueError:
             raise ValueError('Not a valid Collection+JSON document.')
+        kwargs = _collection_member(document, strict)
+        if sink is None:
+            return Collection._from_dict(kwargs, lazy, compact, strict)
+        sink('parse', {'seconds': _clock() - start, 'size': len(data),
+                       'codec': codec.name})
+        return Collection._measured_build(sink, kwargs, lazy, compact,
+                                          strict)
+
+    @staticmethod
+    def from_file(path, codec=None, lazy=False, compact=False, stream=False,
+                  chunk_size=65536, strict=False):
+        """Return a Collection read from the file at path.
+
+        The file is memory-mapped rather than read into memory, so that the
+        operating system pages it in as it's decoded, and it's never held
+        whole as bytes and str next to the decoded document. Codecs that
+        decode buffers get a memoryview of the mapping, except on Python 2.
+        The default codec decodes it incrementally, chunk_size characters
+        at a time, and others get a copy of its bytes.
+
+        With stream, returns a `CollectionReader` over the mapping instead,
+        yielding the items one at a time. The mapping is closed when the
+        reader is garbage collected.
+
+        See `from_json` for lazy, compact and strict.
+
+        Raises `ValueError` when no valid document is provided.
+
+        """
+        if lazy and compact:
+            raise ValueError('lazy and compact are mutually exclusive')
+        codec = get_codec(codec)
+        with open(path, 'rb') as fileobj:
+            try:
+                mapping = mmap.mmap(fileobj.fileno(), 0,
+                                    access=mmap.ACCESS_READ)
+            except ValueError:
+                # an empty file can't be mapped
+                raise ValueError('Not a valid Collection+JSON document.')
+        if stream:
+            return CollectionReader(mapping, chunk_size)
+        sink = _metrics_sink
+        try:
+            if codec is _stdlib_codec:
+                if sink is not None:
+                    start = _clock()
+                reader = CollectionReader(mapping, chunk_size)
+                validator = None
+                if strict and not lazy:
+                    validator = _Validator(packer=_Packer() if compact
+                                           else None)
+                # only keep the decoded items that are needed
+                if lazy:
+                    items = list(reader._iter_dicts())
+                elif validator is not None:
+                    items = validator.items(reader._iter_dicts())
+                elif compact:
+                    items = _Packer().items(reader._iter_dicts())
+                else:
+                    items = list(reader)
+                kwargs = reader._member_dict()
+                if sink is not None:
+                    sink('parse', {'seconds': _clock() - start,
+                                   'size': len(mapping),
+                                   'codec': codec.name})
+                if validator is not None:
+                    if sink is None:
+                        return validator.collection(kwargs, items)
+                    return Collection._measured_build(
+                        sink, kwargs, validator=validator, items=items)
+                if items:
+                    kwargs['items'] = items
+                if sink is None:
+                    return Collection._from_dict(kwargs, lazy, compact,
+                                                 strict)
+                return Collection._measured_build(sink, kwargs, lazy,
+                                                  compact, strict)
+            view = None
+            if codec.buffers:
+                try:
+                    view = memoryview(mapping)
+                except TypeError:
+                    # Python 2 maps only have the old buffer interface
+                    pass
+            if view is not None:
+                try:
+                    return Collection.from_json(view, codec, lazy, compact,
+                                                strict)
+                finally:
+                    view.release()
+            return Collection.from_json(mapping[:], codec, lazy, compact,
+                                        strict)
+        finally:
+            mapping.close()
+
+    @staticmethod
+    def from_ndjson(source, href=None, codec=None, lazy=False,
+                    compact=False, **kwargs):
+        """Return a Collection with the items read from JSON Lines.
+
+        The source is a file-like object opened in text or binary mode, or
+        any iterable of lines, each holding the dictionary of one item as
+        written by `Array.write_ndjson`. Lines are decoded one at a time with
+        the given codec or the default one, blank lines are skipped.
+
+        See `from_json` for lazy and compact. Other keyword arguments are
+        passed to Collection.
+
+        Raises `ValueError` when a line isn't a valid item, telling its line
+        number.
 
+        """
+        if lazy and compact:
+            raise ValueError('lazy and compact are mutually exclusive')
+        if lazy:
+            build = Item._view
+        elif compact:
+            packer = _Packer()
+
+            def build(item):
+                return packer.item(**item)
+        else:
+            build = _build_item
+        items = list(_iter_ndjson(source, codec, build))
+        return Collection(href, items=items, **kwargs)
+
+    @staticmethod
+    def _measured_build(sink, kwargs, lazy=False, compact=False,
+                        strict=False, validator=None, items=None):
+        """Return the output of _from_dict, reporting the build to sink.
+
+        A validator is given with the items it built as they were decoded.
+
+        """
+        start = _clock()
+        if validator is None:
+            collection = Collection._from_dict(kwargs, lazy, compact, strict)
+        else:
+            collection = validator.collection(kwargs, items)
+        seconds = _clock() - start
+        sink('build', {'seconds': seconds,
+                       'items': _count_items(collection),
+                       'objects': _count_objects(collection)})
+        return collection
+
+    @staticmethod
+    def _from_dict(kwargs, lazy=False, compact=False, strict=False):
+        """Return a Collection from the decoded collection member."""
+        if strict:
+            validator = _Validator(lazy, _Packer() if compact else None)
+            return validator.collection(kwargs)
+        if lazy:
+            return Collection._view(kwargs)
+        if compact:
+            items = kwargs.pop('items', None) or ()
+            if not isinstance(items, list):
+                raise ValueError("Invalid value for items: %r" % (items,))
+            kwargs['items'] = _Packer().items(items)
         collection = Collection(**kwargs)
         return collection
 
+    @staticmethod
+    def from_rows(href, columns, rows, item_href=None, item_links=None,
+                  compact=False, **kwargs):
+        """Return a Collection with one item per row of values.
+
+        Each row is a sequence holding a value for every data name in
+        columns. Data and Item objects are built straight from the rows,
+        without intermediate dictionaries.
+
+        item_href gives the href of each item, either a format string filled
+        with the row values by column name, like 'http://example.org/{id}',
+        or a callable taking the row. item_links is a list of Link objects or
+        dictionaries whose href is a format string in the same way.
+
+        With compact, the items share the column names and only hold a tuple
+        of values each, see `from_json`.
+
+        Other keyword arguments are passed to Collection.
+
+        Raises `ValueError` when a row doesn't hold one value per column.
+
+        """
+        columns = list(columns)
+        size = len(columns)
+        links = [link if isinstance(link, Link) else Link(**link)
+                 for link in item_links or ()]
+        format_href = item_href is not None and not callable(item_href)
+        schema = None
+        if compact:
+            schema = _Schema(tuple(columns), (None,) * size)
+            # the schemas of rows with absent values, by present positions
+            schemas = {}
+        items = []
+        for row in rows:
+            if len(row) != size:
+                raise ValueError('Expected %d values, got %r' % (size, row))
+            names = columns
+            row_schema = schema
+            if _MISSING in row:
+                # from_columns marks the values absent from the items
+                present = tuple(i for i, value in enumerate(row)
+                                if value is not _MISSING)
+                names = [columns[i] for i in present]
+                row = [row[i] for i in present]
+                if schema is not None:
+                    row_schema = schemas.get(present)
+                    if row_schema is None:
+                        row_schema = schemas[present] = _Schema(
+                            tuple(names), (None,) * len(names))
+            if format_href or links:
+                values = dict(zip(names, row))
+            if item_href is None:
+                row_href = None
+            elif format_href:
+                row_href = item_href.format(**values)
+            else:
+                row_href = item_href(row)
+            row_links = [Link(link.href.format(**values), link.rel,
+                              link.name, link.render, link.prompt)
+                         for link in links]
+            if schema is None:
+                items.append(Item._new(row_href, [
+                    Data(name, value) for name, value in zip(names, row)
+                ], row_links))
+            else:
+                items.append(Item._new(row_href, None, row_links,
+                                       (row_schema, tuple(row))))
+        return Collection(href, items=items, **kwargs)
+
+    @staticmethod
+    def from_columns(href, columns, item_href=None, item_links=None,
+                     **kwargs):
+        """Return a Collection with items built from columns of data values.
+
+        columns is a dictionary holding a sequence of values for each data
+        name, such as the output of `Array.to_columns`; item i gets a data
+        for every name, with the value at position i. NumPy arrays are
+        converted to Python values. The positions listed for a name in the
+        absent attribute of columns, if any, get no data of that name, see
+        `Columns`.
+
+        The other arguments are the same as for `from_rows`.
+
+        Raises `ValueError` when the columns have different lengths.
+
+        """
+        names = list(columns)
+        absent = getattr(columns, 'absent', None) or {}
+        values = []
+        for name in names:
+            column = columns[name]
+            if hasattr(column, 'tolist'):
+                column = column.tolist()
+            values.append(column)
+        if len(set(len(column) for column in values)) > 1:
+            raise ValueError('Columns have different lengths')
+        for position, name in enumerate(names):
+            if absent.get(name):
+                column = values[position] = list(values[position])
+                for i in absent[name]:
+                    column[i] = _MISSING
+        return Collection.from_rows(href, names, zip(*values),
+                                    item_href=item_href,
+                                    item_links=item_links, **kwargs)
+
+    @classmethod
+    def _view(cls, source):
+        collection = super(Collection, cls)._view(source)
+        if collection.version is None:
+            collection._version = '1.0'
+        return collection
+
     def __init__(self, href, links=None, items=None, queries=None,
                  template=None, error=None, version='1.0'):
         self.version = version
@@ -437,24 +3386,532 @@ class Collection(ComparableObject):
             self.version, self.href)
 
     def __str__(self):
-        return json.dumps(self.to_dict())
+        return self.to_json()
+
+    def to_json(self, codec=None, cache=False):
+        """Return the json str for the collection.
+
+        Uses the given codec or the default one. With cache, the dictionary
+        representation, and the JSON text when using the default codec, of
+        every object in the document is kept until it changes, so encoding
+        the collection again only encodes the objects changed since.
+
+        """
+        codec = get_codec(codec)
+        sink = _metrics_sink
+        if sink is not None:
+            return self._measured_json(sink, codec, cache, False)
+        if codec is _stdlib_codec and (cache or self._kept_json() is not None):
+            return self._json_text(cache)
+        return codec.dumps(self._shared_dict(cache))
 
-    def to_dict(self):
+    def to_json_bytes(self, codec=None, cache=False):
+        """Return the json document for the collection as UTF-8 bytes.
+
+        Uses the given codec or the default one, see `to_json` for cache.
+
+        """
+        codec = get_codec(codec)
+        sink = _metrics_sink
+        if sink is not None:
+            return self._measured_json(sink, codec, cache, True)
+        if codec is _stdlib_codec and (cache or self._kept_json() is not None):
+            return self._json_text(cache).encode('utf-8')
+        return codec.dumps_bytes(self._shared_dict(cache))
+
+    def _measured_json(self, sink, codec, cache, encoded):
+        """Return the output of to_json, or to_json_bytes when encoded.
+
+        The time spent in each phase is reported to sink.
+
+        """
+        start = _clock()
+        if codec is _stdlib_codec and (cache or self._kept_json() is not None):
+            output = self._json_text(cache)
+            if encoded:
+                output = output.encode('utf-8')
+        else:
+            document = self._shared_dict(cache)
+            seconds = _clock() - start
+            sink('to_dict', {'seconds': seconds,
+                             'items': _count_items(self)})
+            start = _clock()
+            if encoded:
+                output = codec.dumps_bytes(document)
+            else:
+                output = codec.dumps(document)
+        seconds = _clock() - start
+        sink('encode', {'seconds': seconds, 'size': len(output),
+                        'codec': codec.name})
+        return output
+
+    def _build_dict(self, cache, shared):
         """Return a dictionary representing a Collection object."""
         output = {
-            'collection': {
-                'version': self.version,
-                'href': self.href,
-            }
+            'version': self.version,
+            'href': self.href,
         }
-        if self.links:
-            output['collection'].update(self.links.to_dict())
-        if self.items:
-            output['collection'].update(self.items.to_dict())
-        if self.queries:
-            output['collection'].update(self.queries.to_dict())
-        if self.template:
-            output['collection'].update(self.template.to_dict())
-        if self.error:
-            output['collection'].update(self.error.to_dict())
+        for array in (self.links, self.items, self.queries):
+            value = array._to_dict(cache, shared)
+            if value:
+                output[array.collection_name] = value
+        if self.template is not None:
+            output['template'] = self.template._to_dict(cache, shared)
+        if self.error is not None:
+            output['error'] = self.error._to_dict(cache, shared)
         return output
+
+    def _wrap(self, output):
+        return {'collection': output}
+
+    def _json_text(self, cache=False):
+        """Return the JSON text of the dictionary representation."""
+        text = self._kept_json()
+        if text is None:
+            text = ''.join(self._iter_json(cache))
+            if cache:
+                self._track().json = text
+        return text
+
+    def _iter_json(self, cache=False):
+        """Yield the JSON text of the dictionary representation.
+
+        Items are yielded as separate fragments, unless their text is kept.
+
+        """
+        meta = self._meta
+        if meta is not None and meta.json is not None:
+            yield meta.json
+            return
+        source = None
+        if meta is not None:
+            source = meta.dict
+            if source is None:
+                source = meta.source
+        if source is not None:
+            for fragment in self._iter_source_json(source):
+                yield fragment
+            return
+        yield '{"collection": {"version": %s, "href": %s' % (
+            _encode(self.version), _encode(self.href))
+        for array in (self.links, self.items, self.queries):
+            if array:
+                yield ', '
+                for fragment in array._iter_json_members(cache):
+                    yield fragment
+        for value in (self.template, self.error):
+            if value:
+                # strip the braces to merge the members into the collection
+                yield ', ' + value._json_text(cache)[1:-1]
+        yield '}}'
+
+    @staticmethod
+    def _iter_source_json(source):
+        yield '{"collection": {'
+        separator = ''
+        for name, value in source.items():
+            if name == 'items' and isinstance(value, list):
+                yield separator + '"items": ['
+                item_separator = ''
+                for item in value:
+                    yield item_separator + _encode(item)
+                    item_separator = ', '
+                yield ']'
+            else:
+                yield separator + _encode(name) + ': ' + _encode(value)
+            separator = ', '
+        yield '}}'
+
+    def iter_json_chunks(self, chunk_size=65536):
+        """Yield the JSON text of the collection in chunks.
+
+        The text is generated straight from the objects, without building
+        the dictionary representation of the whole document. Every chunk but
+        the last one is exactly chunk_size characters long, and joined
+        together they are identical to `json.dumps(collection.to_dict())`.
+
+        """
+        buffered = []
+        size = 0
+        for fragment in self._iter_json():
+            buffered.append(fragment)
+            size += len(fragment)
+            if size >= chunk_size:
+                text = ''.join(buffered)
+                end = size - size % chunk_size
+                for start in range(0, end, chunk_size):
+                    yield text[start:start + chunk_size]
+                buffered = [text[end:]]
+                size -= end
+        text = ''.join(buffered)
+        if text:
+            yield text
+
+    def write_json(self, fp, chunk_size=65536, encoding=None):
+        """Write the JSON text of the collection to a file-like object.
+
+        The text is written in chunks, see `iter_json_chunks`. With
+        encoding, the chunks are encoded and written as bytes. Otherwise
+        they are written as str, unless fp turns out to only take bytes, in
+        which case they are encoded as UTF-8.
+
+        """
+        write = _text_writer(fp, encoding)
+        for chunk in self.iter_json_chunks(chunk_size):
+            write(chunk)
+
+
+def _text_writer(fp, encoding=None):
+    """Return a function writing str to the file-like object fp.
+
+    Without encoding, an empty str is written to find out whether fp takes
+    str, otherwise text is written encoded, as UTF-8 by default.
+
+    """
+    write = fp.write
+    if encoding is None:
+        try:
+            write('')
+        except TypeError:
+            encoding = 'utf-8'
+        else:
+            return write
+
+    def write_encoded(text):
+        return write(text.encode(encoding))
+    return write_encoded
+
+
+def _copy(obj):
+    """Return a deep copy of obj built from its public attributes."""
+    kwargs = {}
+    for name in obj._fields:
+        value = getattr(obj, name)
+        if isinstance(value, Array):
+            value = [_copy(item) for item in value]
+        kwargs[name] = value
+    return type(obj)(**kwargs)
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# characters that may follow the part of a number decoded so far
+_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+_MEMBER = object()
+
+
+def _read_chunks(fileobj, size):
+    """Yield successive chunks read from a file-like object."""
+    while True:
+        chunk = fileobj.read(size)
+        if not chunk:
+            break
+        yield chunk
+
+
+class _JSONStream(object):
+
+    """Incremental JSON tokenizer over a stream of text or byte chunks.
+
+    Only the unconsumed tail of the input is kept in memory, so the buffer
+    never grows beyond the size of the largest single value plus one chunk.
+
+    """
+
+    def __init__(self, source, chunk_size):
+        if hasattr(source, 'read'):
+            source = _read_chunks(source, chunk_size)
+        self.chunks = iter(source)
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = None
+        # bytes read before the encoding is known
+        self.head = b''
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Append the next chunk to the buffer, return False at the end."""
+        if self.eof:
+            return False
+        for chunk in self.chunks:
+            if isinstance(chunk, bytes):
+                chunk = self.decode(chunk)
+            if chunk:
+                self.buffer = self.buffer[self.pos:] + chunk
+                self.pos = 0
+                return True
+        self.eof = True
+        if self.text_decoder is not None or self.head:
+            # raises on a truncated multi-byte sequence
+            chunk = self.decode(b'', True)
+            if chunk:
+                self.buffer = self.buffer[self.pos:] + chunk
+                self.pos = 0
+                return True
+        return False
+
+    def decode(self, chunk, final=False):
+        """Return the text of a chunk of bytes.
+
+        The encoding is detected from the first four bytes, see
+        `_detect_encoding`, and a byte order mark is skipped.
+
+        """
+        if self.text_decoder is None:
+            self.head += chunk
+            if len(self.head) < 4 and not final:
+                return ''
+            chunk, self.head = self.head, b''
+            self.text_decoder = codecs.getincrementaldecoder(
+                _detect_encoding(chunk))()
+        return self.text_decoder.decode(chunk, final)
+
+    def peek(self):
+        """Return the next non-whitespace character, or '' at the end."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        """Consume the next non-whitespace character, which must be char."""
+        if self.peek() != char:
+            raise ValueError("Expected %r in JSON stream." % char)
+        self.pos += 1
+
+    def value(self):
+        """Decode and return the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self.fill():
+                    raise
+                continue
+            # a number followed by the end of the buffer, or by a partial
+            # fraction or exponent, may continue in the next chunk
+            if (isinstance(obj, numbers.Number) and
+                    not isinstance(obj, bool) and
+                    _NUMBER_TAIL.match(self.buffer, end).end() ==
+                    len(self.buffer) and self.fill()):
+                continue
+            self.pos = end
+            return obj
+
+    def keys(self):
+        """Yield the keys of the object whose '{' was just consumed.
+
+        The caller must consume the value of each key before resuming.
+
+        """
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise ValueError("Expected object key in JSON stream.")
+            key = self.value()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            elif char != ',':
+                raise ValueError("Expected ',' or '}' in JSON stream.")
+
+    def elements(self):
+        """Yield the elements of the array whose '[' was just consumed."""
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return
+            elif char != ',':
+                raise ValueError("Expected ',' or ']' in JSON stream.")
+
+
+class CollectionReader(object):
+
+    """Incrementally read a Collection+JSON document from a stream.
+
+    The source can be a file-like object opened in text or binary mode, or
+    any iterable of str or bytes chunks. Iterating over the reader yields
+    the document's items as Item objects, one at a time, so memory use does
+    not depend on the number of items in the document.
+
+    The remaining top-level members are available as attributes. Accessing
+    a member that appears after the items in the document skips over the
+    items that were not consumed yet.
+
+    Raises `ValueError` when no valid document is provided.
+
+    """
+
+    def __init__(self, source, chunk_size=65536):
+        self._stream = _JSONStream(source, chunk_size)
+        self._members = {}
+        self._found = False
+        self._done = False
+        self._items = self._parse()
+
+    def __repr__(self):
+        return "<CollectionReader: href='%s'>" % self.href
+
+    def __iter__(self):
+        for item in self._iter_dicts():
+            if not isinstance(item, dict):
+                raise ValueError("Invalid value for Item: %r" % item)
+            yield Item(**item)
+
+    def _iter_dicts(self):
+        """Yield the decoded items."""
+        for item in self._items:
+            if item is not _MEMBER:
+                yield item
+
+    def _parse(self):
+        stream = self._stream
+        try:
+            stream.expect('{')
+            for key in stream.keys():
+                if key == 'collection' and stream.peek() == '{':
+                    self._found = True
+                    stream.pos += 1
+                    for item in self._parse_collection():
+                        yield item
+                else:
+                    stream.value()
+            if stream.peek():
+                raise ValueError("Extra data after JSON document.")
+        finally:
+            self._done = True
+        if not (self._found and self._members):
+            raise ValueError('Not a valid Collection+JSON document.')
+
+    def _parse_collection(self):
+        stream = self._stream
+        for key in stream.keys():
+            if key != 'items':
+                self._members[key] = stream.value()
+                # lets member lookups stop before reaching the items
+                yield _MEMBER
+            elif stream.peek() == '[':
+                stream.pos += 1
+                for item in stream.elements():
+                    yield item
+            else:
+                items = stream.value()
+                if items is not None:
+                    raise ValueError("Invalid value for items: %r" % items)
+
+    def _member(self, name):
+        while name not in self._members and not self._done:
+            # skips any item that was not consumed yet
+            next(self._items, None)
+        if self._done and not (self._found and self._members):
+            raise ValueError('Not a valid Collection+JSON document.')
+        return self._members.get(name)
+
+    def _member_dict(self):
+        """Return the top-level members, reading the rest of the document."""
+        self._member(None)
+        return dict(self._members)
+
+    @property
+    def version(self):
+        """The collection version."""
+        version = self._member('version')
+        return '1.0' if version is None else version
+
+    @property
+    def href(self):
+        """The collection href."""
+        return self._member('href')
+
+    @property
+    def links(self):
+        """The collection links, as an Array."""
+        return Array(Link, 'links', self._member('links') or [])
+
+    @property
+    def queries(self):
+        """The collection queries, as an Array."""
+        return Array(Query, 'queries', self._member('queries') or [])
+
+    @property
+    def template(self):
+        """The collection template, or None."""
+        template = self._member('template')
+        return template if template is None else Template(**template)
+
+    @property
+    def error(self):
+        """The collection error, or None."""
+        error = self._member('error')
+        return error if error is None else Error(**error)
+
+    @property
+    def collection(self):
+        """Return a Collection with every top-level member except items.
+
+        This reads the remainder of the document.
+
+        """
+        return Collection(**self._member_dict())
+
+
+def iter_items(source, chunk_size=65536):
+    """Yield the items of a Collection+JSON document read from a stream.
+
+    See `CollectionReader` for the supported sources.
+
+    """
+    return iter(CollectionReader(source, chunk_size))
+
+
+def _iter_ndjson(source, codec=None, build=None):
+    """Yield the dictionary decoded from each non-blank line of source.
+
+    With build, the item it returns for each dictionary is yielded instead,
+    its errors are raised as `ValueError` telling the line number.
+
+    """
+    loads = get_codec(codec).loads
+    for number, line in enumerate(source, 1):
+        if not line.strip():
+            continue
+        try:
+            item = loads(line)
+        except ValueError:
+            raise ValueError('Line %d: invalid JSON' % number)
+        if not isinstance(item, dict):
+            raise ValueError('Line %d: invalid value for Item: %r' % (
+                number, item))
+        if build is not None:
+            try:
+                item = build(item)
+            except (TypeError, ValueError, KeyError) as error:
+                raise ValueError('Line %d: invalid value for Item: %s' % (
+                    number, error))
+        yield item
+
+
+def _build_item(item):
+    return Item(**item)
+
+
+def iter_ndjson_items(source, codec=None):
+    """Yield the items of a JSON Lines stream as Item objects.
+
+    See `Collection.from_ndjson` for the supported sources and errors.
+
+    """
+    return _iter_ndjson(source, codec, _build_item)
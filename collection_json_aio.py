@@ -0,0 +1,453 @@
+"""Asynchronous crawling of Collection+JSON link graphs.
+
+This module requires Python 3.6 or later.
+
+"""
+import asyncio
+
+from urllib.parse import urljoin, urlsplit
+
+from collection_json import MEDIA_TYPE, Collection
+from collection_json_http import _DEFAULT_PORTS, normalize_href
+
+
+_REDIRECTS = (301, 302, 303, 307, 308)
+
+
+class ProtocolError(IOError):
+
+    """Raised for a malformed HTTP response, or one over a size limit."""
+
+
+class Transport(object):
+
+    """Interface of the transports fetching documents for a `Crawler`.
+
+    Any object with the same two coroutine methods can be used instead.
+
+    """
+
+    async def fetch(self, href):
+        """Return the body of the response to a GET request for href.
+
+        Raises `IOError` for responses with a status other than 2xx.
+
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """Release the connections held by the transport."""
+
+
+class HTTPTransport(Transport):
+
+    """Fetches documents with HTTP/1.1 GET requests over asyncio streams.
+
+    Connections are kept alive and reused by later requests to the same
+    host. Responses are read within the given limits, and a `ProtocolError`
+    is raised for those that are malformed or exceed them.
+
+    :param headers dict: extra request headers
+    :param timeout float: seconds allowed for each request
+    :param max_redirects int: redirects followed before giving up, across
+        schemes; redirects from https to http are refused
+    :param max_header_size int: bytes allowed for the status line and
+        headers, and for the trailer of a chunked body
+    :param max_body_size int: bytes allowed for a body, or None
+
+    """
+
+    def __init__(self, headers=None, timeout=30, max_redirects=5,
+                 max_header_size=65536, max_body_size=64 * 1024 * 1024):
+        self.headers = {'Accept': MEDIA_TYPE}
+        if headers:
+            self.headers.update(headers)
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self._idle = {}
+
+    async def fetch(self, href):
+        """Return the body of the response to a GET request for href.
+
+        Raises `IOError` for responses with a status other than 2xx, and
+        for too many redirects or redirects to an unsupported scheme.
+
+        """
+        for _ in range(self.max_redirects + 1):
+            status, headers, body = await asyncio.wait_for(
+                self._request(href), self.timeout)
+            if status in _REDIRECTS and 'location' in headers:
+                href = _redirect(href, headers['location'])
+                continue
+            if not 200 <= status < 300:
+                raise IOError('HTTP %d for %s' % (status, href))
+            return body
+        raise IOError('Too many redirects for %s' % href)
+
+    async def close(self):
+        """Close the connections kept alive."""
+        for connections in self._idle.values():
+            for reader, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+    async def _request(self, href):
+        parts = urlsplit(href)
+        if parts.scheme not in _DEFAULT_PORTS:
+            raise ValueError('Unsupported URL: %s' % href)
+        port = parts.port or _DEFAULT_PORTS[parts.scheme]
+        key = (parts.scheme, parts.hostname, port)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        lines = ['GET %s HTTP/1.1' % target,
+                 'Host: %s' % parts.netloc.rpartition('@')[2]]
+        lines.extend('%s: %s' % header for header in self.headers.items())
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('ascii')
+
+        idle = self._idle.setdefault(key, [])
+        while True:
+            reused = bool(idle)
+            if reused:
+                reader, writer = idle.pop()
+            else:
+                reader, writer = await asyncio.open_connection(
+                    parts.hostname, port, ssl=parts.scheme == 'https')
+            try:
+                writer.write(request)
+                status, headers, body, keep_alive = await _read_response(
+                    reader, self.max_header_size, self.max_body_size)
+            except ProtocolError:
+                writer.close()
+                raise
+            except (OSError, EOFError):
+                writer.close()
+                if reused:
+                    # the server closed the idle connection, retry
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive:
+                idle.append((reader, writer))
+            else:
+                writer.close()
+            return status, headers, body
+
+
+def _redirect(href, location):
+    """Return the href a redirect to location from href leads to."""
+    target = urljoin(href, location)
+    scheme = urlsplit(target).scheme
+    if scheme not in _DEFAULT_PORTS:
+        raise IOError('Unsupported redirect from %s to %s' % (href, target))
+    if scheme == 'http' and urlsplit(href).scheme == 'https':
+        raise IOError('Refused redirect from %s to %s' % (href, target))
+    return target
+
+
+async def _read_line(reader, limit):
+    """Return a line of at most limit bytes, with its line ending."""
+    try:
+        line = await reader.readuntil(b'\n')
+    except asyncio.IncompleteReadError as error:
+        # the connection was closed, possibly in the middle of a line
+        line = error.partial
+    except asyncio.LimitOverrunError:
+        raise ProtocolError('Response line too long')
+    if len(line) > limit:
+        raise ProtocolError('Response headers too long')
+    return line
+
+
+async def _read_headers(reader, limit):
+    """Return the headers up to an empty line, and the bytes left of limit.
+
+    Header names are returned lowercase.
+
+    """
+    headers = {}
+    while True:
+        line = await _read_line(reader, limit)
+        limit -= len(line)
+        if not line:
+            raise ProtocolError('Response ended in the headers')
+        if not line.strip():
+            return headers, limit
+        name, colon, value = line.decode('latin-1').partition(':')
+        if not colon or not name.strip():
+            raise ProtocolError('Malformed header: %r' % line)
+        headers[name.strip().lower()] = value.strip()
+
+
+async def _read_response(reader, max_header_size=65536, max_body_size=None):
+    """Return the status, headers, body and keep-alive flag of a response.
+
+    Raises `ProtocolError` for a malformed response, for headers longer than
+    max_header_size bytes and for a body longer than max_body_size bytes.
+
+    """
+    line = await _read_line(reader, max_header_size)
+    if not line:
+        raise ConnectionResetError('Connection closed by the server')
+    parts = line.split(None, 2)
+    if (len(parts) < 2 or not parts[0].startswith(b'HTTP/') or
+            not parts[1].isdigit() or len(parts[1]) != 3):
+        raise ProtocolError('Malformed status line: %r' % line)
+    version = parts[0]
+    status = int(parts[1])
+    headers, limit = await _read_headers(
+        reader, max_header_size - len(line))
+
+    def check_size(size):
+        if max_body_size is not None and size > max_body_size:
+            raise ProtocolError('Response body too long')
+
+    connection = headers.get('connection', '').lower()
+    if version == b'HTTP/1.1':
+        keep_alive = connection != 'close'
+    else:
+        keep_alive = connection == 'keep-alive'
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        size = 0
+        while True:
+            line = await _read_line(reader, limit)
+            try:
+                chunk_size = int(line.split(b';')[0].strip(), 16)
+            except ValueError:
+                raise ProtocolError('Malformed chunk size: %r' % line)
+            if chunk_size < 0:
+                raise ProtocolError('Malformed chunk size: %r' % line)
+            if not chunk_size:
+                break
+            size += chunk_size
+            check_size(size)
+            chunk = await reader.readexactly(chunk_size + 2)
+            if chunk[-2:] != b'\r\n':
+                raise ProtocolError('Malformed chunk ending')
+            chunks.append(chunk[:-2])
+        # skip the trailer
+        await _read_headers(reader, limit)
+        body = b''.join(chunks)
+    elif 'content-length' in headers:
+        length = headers['content-length']
+        if not length.isdigit():
+            raise ProtocolError('Malformed Content-Length: %r' % length)
+        check_size(int(length))
+        body = await reader.readexactly(int(length))
+    elif status in (204, 304) or status < 200:
+        body = b''
+    else:
+        chunks = []
+        size = 0
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            size += len(chunk)
+            check_size(size)
+            chunks.append(chunk)
+        body = b''.join(chunks)
+        keep_alive = False
+    return status, headers, body, keep_alive
+
+
+class AiohttpTransport(Transport):
+
+    """Fetches documents with an aiohttp client session.
+
+    Requires aiohttp, which is not installed along with this module.
+
+    :param session: aiohttp ClientSession used for the requests, a new one
+        is made, and closed by `close`, if not given
+    :param headers dict: extra request headers
+    :param timeout float: seconds allowed for each request
+    :param max_redirects int: redirects followed before giving up
+    :param max_body_size int: bytes allowed for a body, or None
+
+    """
+
+    def __init__(self, session=None, headers=None, timeout=30,
+                 max_redirects=5, max_body_size=64 * 1024 * 1024):
+        import aiohttp
+        self._aiohttp = aiohttp
+        self.headers = {'Accept': MEDIA_TYPE}
+        if headers:
+            self.headers.update(headers)
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.max_body_size = max_body_size
+        self._session = session
+        self._owned = session is None
+
+    async def fetch(self, href):
+        """Return the body of the response to a GET request for href.
+
+        Raises `IOError` for responses with a status other than 2xx, and
+        `ProtocolError` for a body longer than max_body_size bytes.
+
+        """
+        aiohttp = self._aiohttp
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        try:
+            response = await self._session.get(
+                href, headers=self.headers,
+                max_redirects=self.max_redirects,
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        except aiohttp.TooManyRedirects:
+            raise IOError('Too many redirects for %s' % href)
+        async with response:
+            if not 200 <= response.status < 300:
+                raise IOError('HTTP %d for %s' % (response.status, href))
+            chunks = []
+            size = 0
+            async for chunk in response.content.iter_chunked(65536):
+                size += len(chunk)
+                if (self.max_body_size is not None and
+                        size > self.max_body_size):
+                    raise ProtocolError('Response body too long')
+                chunks.append(chunk)
+            return b''.join(chunks)
+
+    async def close(self):
+        """Close the session, if made by the transport."""
+        if self._owned and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class Crawler(object):
+
+    """Crawls the documents reachable from a set of Collection+JSON hrefs.
+
+    Every fetched document is parsed as a Collection, and the hrefs of its
+    links, its items and their links are followed, each one only once after
+    normalizing it with `normalize_href`.
+
+    :param transport: `Transport`, or object with the same methods, fetching
+        the documents; defaults to a new `HTTPTransport` for each crawl, see
+        also `AiohttpTransport`
+    :param rels: rels of the links to follow, defaults to all of them
+    :param follow_items bool: whether to follow the href of items
+    :param hosts: hosts, with their port if not the default one, that may
+        be crawled; defaults to the hosts of the starting hrefs
+    :param max_concurrency int: maximum number of requests in flight
+    :param max_per_host int: maximum number of requests in flight per host
+    :param max_documents int: maximum number of documents to fetch
+    :param lazy bool: whether documents are parsed as lazy views, see
+        `Collection.from_json`
+    :param codec: JSON codec used for parsing
+
+    Documents that can't be fetched or parsed are recorded in `failures`,
+    which maps their href to the exception raised.
+
+    """
+
+    def __init__(self, transport=None, rels=None, follow_items=True,
+                 hosts=None, max_concurrency=32, max_per_host=8,
+                 max_documents=None, lazy=True, codec=None):
+        self.transport = transport
+        self.rels = None if rels is None else frozenset(rels)
+        self.follow_items = follow_items
+        self.hosts = None if hosts is None else frozenset(
+            host.lower() for host in hosts)
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.max_documents = max_documents
+        self.lazy = lazy
+        self.codec = codec
+        self.failures = {}
+
+    def links(self, collection):
+        """Return the hrefs to follow from collection, as found."""
+        hrefs = []
+        rels = self.rels
+        for link in collection.links:
+            if rels is None or link.rel in rels:
+                hrefs.append(link.href)
+        for item in collection.items:
+            if self.follow_items:
+                hrefs.append(item.href)
+            for link in item.links:
+                if rels is None or link.rel in rels:
+                    hrefs.append(link.href)
+        return [href for href in hrefs if href]
+
+    async def crawl(self, *hrefs):
+        """Yield the Collection of each document, as they are fetched."""
+        transport = self.transport
+        if transport is None:
+            transport = HTTPTransport()
+        hosts = self.hosts
+        if hosts is None:
+            hosts = frozenset(urlsplit(normalize_href(href)).netloc
+                              for href in hrefs)
+        self.failures = {}
+        todo = asyncio.Queue()
+        done = asyncio.Queue()
+        limits = {}
+        seen = set()
+        state = {'scheduled': 0, 'pending': 0}
+
+        def schedule(href):
+            try:
+                href = normalize_href(href)
+                host = urlsplit(href).netloc
+            except ValueError:
+                return
+            if href in seen or host not in hosts:
+                return
+            seen.add(href)
+            if (self.max_documents is not None and
+                    state['scheduled'] >= self.max_documents):
+                return
+            state['scheduled'] += 1
+            state['pending'] += 1
+            todo.put_nowait(href)
+
+        async def work():
+            while True:
+                href = await todo.get()
+                host = urlsplit(href).netloc
+                limit = limits.get(host)
+                if limit is None:
+                    limit = limits[host] = asyncio.Semaphore(
+                        self.max_per_host)
+                try:
+                    async with limit:
+                        document = await transport.fetch(href)
+                    collection = Collection.from_json(
+                        document, codec=self.codec, lazy=self.lazy)
+                    if collection.href:
+                        seen.add(normalize_href(
+                            urljoin(href, collection.href)))
+                    for link in self.links(collection):
+                        schedule(urljoin(href, link))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as error:
+                    self.failures[href] = error
+                    collection = None
+                done.put_nowait(collection)
+
+        for href in hrefs:
+            schedule(href)
+        workers = [asyncio.ensure_future(work())
+                   for _ in range(self.max_concurrency)]
+        try:
+            while state['pending']:
+                collection = await done.get()
+                state['pending'] -= 1
+                if collection is not None:
+                    yield collection
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if self.transport is None:
+                await transport.close()
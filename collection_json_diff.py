@@ -0,0 +1,296 @@
+"""Comparing the items of Collection+JSON documents."""
+from __future__ import absolute_import, unicode_literals
+from collections import OrderedDict
+
+from collection_json import Data, Item, Link, _MISSING, _copy, _data_pairs
+
+
+def diff(old, new, key=None):
+    """Return the CollectionDiff turning the items of old into new's.
+
+    Items are matched by their href, or by the value of the data named
+    key, through a hash table. Matched items are compared by their
+    dictionary representation, which lazy collections don't need to
+    build, and only the ones that differ are compared field by field.
+    The order of items, and of the data and links of an item, is not
+    compared.
+
+    Raises `ValueError` when an item has no key, or shares it with
+    another item of the same collection.
+
+    """
+    before = _items_by_key(old.items, key)
+    after = _items_by_key(new.items, key)
+    result = CollectionDiff(key=key)
+    for value, item in before.items():
+        if value not in after:
+            result.removed.append(value)
+    for value, item in after.items():
+        previous = before.get(value)
+        if previous is None:
+            result.added.append(item)
+        elif previous._shared_dict() != item._shared_dict():
+            changes = ItemDiff.between(value, previous, item)
+            if changes:
+                result.changed.append(changes)
+    return result
+
+
+def apply_diff(collection, diff):
+    """Change the items of collection as described by diff.
+
+    Removed items are dropped, changed items are updated in place, and
+    copies of the added items are appended.
+
+    Raises `ValueError` when the items don't match the diff, in which
+    case the collection is left unchanged.
+
+    """
+    items = collection.items
+    by_key = _items_by_key(items, diff.key)
+    for value in diff.removed:
+        if value not in by_key:
+            raise ValueError('No item with key %r' % (value,))
+    updates = []
+    for changes in diff.changed:
+        item = by_key.get(changes.key)
+        if item is None:
+            raise ValueError('No item with key %r' % (changes.key,))
+        updates.append((item, changes.patched(item)))
+    added = [_copy(item) for item in diff.added]
+
+    if diff.removed:
+        removed = set(diff.removed)
+        items[:] = [item for value, item in by_key.items()
+                    if value not in removed]
+    for item, (href, data, links) in updates:
+        if href is not _MISSING:
+            item.href = href
+        if data is not None:
+            item.data = data
+        if links is not None:
+            item.links = links
+    if added:
+        items.extend(added)
+
+
+def _item_key(item, key):
+    if key is None:
+        return item.href
+    for name, value in _data_pairs(item):
+        if name == key:
+            return value
+    return None
+
+
+def _items_by_key(items, key):
+    """Return an ordered dictionary of items by their key."""
+    result = OrderedDict()
+    for item in items:
+        value = _item_key(item, key)
+        if value is None:
+            raise ValueError('Item without %s: %r' % (key or 'href', item))
+        if value in result:
+            raise ValueError('Duplicate %s: %r' % (key or 'href', value))
+        result[value] = item
+    return result
+
+
+def _link_key(link):
+    return tuple(sorted(link._shared_dict().items()))
+
+
+class ItemDiff(object):
+
+    """The changes between two items with the same key.
+
+    :param key: the value the items were matched by
+    :param href tuple: the old and new href, or None when it didn't change
+    :param data list: (old, new) pairs of Data objects that differ, matched
+        by name in order of appearance; old is None for added data and new
+        is None for removed data
+    :param added_links list: Link objects only found in the new item
+    :param removed_links list: Link objects only found in the old item
+
+    """
+
+    def __init__(self, key, href=None, data=None, added_links=None,
+                 removed_links=None):
+        self.key = key
+        self.href = href
+        self.data = data or []
+        self.added_links = added_links or []
+        self.removed_links = removed_links or []
+
+    def __repr__(self):
+        return '<ItemDiff: key=%r>' % (self.key,)
+
+    def __bool__(self):
+        return bool(self.href or self.data or self.added_links or
+                    self.removed_links)
+
+    __nonzero__ = __bool__
+
+    @classmethod
+    def between(cls, key, old, new):
+        """Return the ItemDiff from item old to item new."""
+        result = cls(key)
+        if old.href != new.href:
+            result.href = (old.href, new.href)
+
+        new_data = OrderedDict()
+        for data in new.data:
+            new_data.setdefault(data.name, []).append(data)
+        for data in old.data:
+            matches = new_data.get(data.name)
+            if matches:
+                match = matches.pop(0)
+                if data._shared_dict() != match._shared_dict():
+                    result.data.append((data, match))
+            else:
+                result.data.append((data, None))
+        for matches in new_data.values():
+            for data in matches:
+                result.data.append((None, data))
+
+        counts = {}
+        for link in new.links:
+            link_key = _link_key(link)
+            counts[link_key] = counts.get(link_key, 0) + 1
+        for link in old.links:
+            link_key = _link_key(link)
+            if counts.get(link_key):
+                counts[link_key] -= 1
+            else:
+                result.removed_links.append(link)
+        for link in new.links:
+            link_key = _link_key(link)
+            if counts.get(link_key):
+                counts[link_key] -= 1
+                result.added_links.append(link)
+        return result
+
+    def patched(self, item):
+        """Return the href, data and links of item with the changes applied.
+
+        href is `_MISSING` when it doesn't change, and data or links are
+        None when they don't change. The item itself is left untouched.
+
+        Raises `ValueError` when the changes don't apply to item.
+
+        """
+        href = _MISSING
+        if self.href is not None:
+            if item.href != self.href[0]:
+                raise ValueError('Item %r has href %r, expected %r' % (
+                    self.key, item.href, self.href[0]))
+            href = self.href[1]
+
+        data = None
+        if self.data:
+            data = list(item.data)
+            for old, new in self.data:
+                if old is None:
+                    data.append(_copy(new))
+                    continue
+                index = _index_of(data, old, self.key)
+                if new is None:
+                    del data[index]
+                else:
+                    data[index] = _copy(new)
+
+        links = None
+        if self.added_links or self.removed_links:
+            links = list(item.links)
+            for link in self.removed_links:
+                del links[_index_of(links, link, self.key)]
+            links.extend(_copy(link) for link in self.added_links)
+        return href, data, links
+
+    def to_dict(self):
+        """Return a dictionary representing the changes."""
+        output = {'key': self.key}
+        if self.href is not None:
+            output['href'] = list(self.href)
+        if self.data:
+            output['data'] = [
+                [None if old is None else old.to_dict(),
+                 None if new is None else new.to_dict()]
+                for old, new in self.data]
+        if self.added_links:
+            output['added_links'] = [link.to_dict()
+                                     for link in self.added_links]
+        if self.removed_links:
+            output['removed_links'] = [link.to_dict()
+                                       for link in self.removed_links]
+        return output
+
+    @classmethod
+    def from_dict(cls, data):
+        """Return an ItemDiff from its dictionary representation."""
+        href = data.get('href')
+        return cls(
+            data['key'],
+            href=None if href is None else tuple(href),
+            data=[(None if old is None else Data(**old),
+                   None if new is None else Data(**new))
+                  for old, new in data.get('data') or ()],
+            added_links=[Link(**link)
+                         for link in data.get('added_links') or ()],
+            removed_links=[Link(**link)
+                           for link in data.get('removed_links') or ()])
+
+
+def _index_of(values, value, key):
+    for index, candidate in enumerate(values):
+        if candidate == value:
+            return index
+    raise ValueError('Item %r has no %r' % (key, value))
+
+
+class CollectionDiff(object):
+
+    """The changes between the items of two collections.
+
+    Returned by `diff`, and applied with `apply_diff`.
+
+    :param key: name of the data the items were matched by, None for href
+    :param added list: Item objects only found in the new collection
+    :param removed list: keys of the items only found in the old collection
+    :param changed list: ItemDiff objects for the items that differ
+
+    """
+
+    def __init__(self, key=None, added=None, removed=None, changed=None):
+        self.key = key
+        self.added = added or []
+        self.removed = removed or []
+        self.changed = changed or []
+
+    def __repr__(self):
+        return '<CollectionDiff: added=%d removed=%d changed=%d>' % (
+            len(self.added), len(self.removed), len(self.changed))
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    __nonzero__ = __bool__
+
+    def to_dict(self):
+        """Return a dictionary representing the changes."""
+        return {
+            'key': self.key,
+            'added': [item.to_dict() for item in self.added],
+            'removed': list(self.removed),
+            'changed': [changes.to_dict() for changes in self.changed],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Return a CollectionDiff from its dictionary representation."""
+        return cls(
+            key=data.get('key'),
+            added=[Item(**item) for item in data.get('added') or ()],
+            removed=list(data.get('removed') or ()),
+            changed=[ItemDiff.from_dict(changes)
+                     for changes in data.get('changed') or ()])
@@ -0,0 +1,413 @@
+"""Fetching Collection+JSON documents over HTTP."""
+from __future__ import absolute_import, unicode_literals
+import threading
+from collections import OrderedDict
+
+try:
+    import queue
+    from urllib.error import HTTPError
+    from urllib.parse import urljoin, urlsplit, urlunsplit
+    from urllib.request import Request, urlopen
+except ImportError:  # Python 2
+    import Queue as queue
+    from urllib2 import HTTPError, Request, urlopen
+    from urlparse import urljoin, urlsplit, urlunsplit
+
+from collection_json import (
+    MEDIA_TYPE,
+    Collection,
+    Error,
+    _copy,
+    _copy_decoded,
+)
+
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_href(href):
+    """Return href in a canonical form, for telling apart links.
+
+    The scheme and host are lowercased, the default port and the fragment
+    are removed, and an empty path becomes '/'.
+
+    """
+    parts = urlsplit(href)
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname or ''
+    if ':' in netloc:
+        # IPv6 address
+        netloc = '[%s]' % netloc
+    port = parts.port
+    if port is not None and port != _DEFAULT_PORTS.get(scheme):
+        netloc += ':%d' % port
+    userinfo = parts.netloc.rpartition('@')[0]
+    if userinfo:
+        netloc = userinfo + '@' + netloc
+    path = parts.path
+    if not path and netloc:
+        path = '/'
+    return urlunsplit((scheme, netloc, path, parts.query, ''))
+
+
+def _fetch_url(href):
+    """Return the body of the response to a GET request for href.
+
+    An error status returns a Collection carrying the error instead, see
+    `_error_collection`.
+
+    """
+    try:
+        response = urlopen(Request(href, headers={'Accept': MEDIA_TYPE}))
+    except HTTPError as error:
+        return _error_collection(href, error)
+    try:
+        return response.read()
+    finally:
+        response.close()
+
+
+def _error_collection(href, error):
+    """Return a Collection carrying the error of an HTTPError response.
+
+    A body holding a Collection+JSON document with an error is parsed, any
+    other body gives a Collection whose error has the status code and
+    reason.
+
+    """
+    body = None
+    try:
+        if error.fp is not None:
+            body = error.read()
+    except (IOError, OSError):
+        pass
+    finally:
+        error.close()
+    if body:
+        try:
+            collection = Collection.from_json(body)
+        except (TypeError, ValueError):
+            pass
+        else:
+            if collection.error is not None:
+                return collection
+    reason = getattr(error, 'reason', None) or error.msg
+    return Collection(href, error=Error(code='%d' % error.code,
+                                        title=reason or None))
+
+
+def _fetch_collection(document, codec):
+    """Return the Collection of a fetched document, parsing it if needed."""
+    if isinstance(document, Collection):
+        return document
+    return Collection.from_json(document, codec=codec)
+
+
+def _fetch_conditional(href, headers):
+    """Return the status, headers and body of a GET request for href.
+
+    Header names are returned lowercase.
+
+    """
+    headers = dict(headers)
+    headers['Accept'] = MEDIA_TYPE
+    try:
+        response = urlopen(Request(href, headers=headers))
+    except HTTPError as error:
+        if error.code != 304:
+            raise
+        response = error
+    try:
+        return (response.getcode(),
+                dict((name.lower(), value)
+                     for name, value in response.info().items()),
+                response.read())
+    finally:
+        response.close()
+
+
+class _CacheEntry(object):
+
+    __slots__ = ('document', 'etag', 'last_modified', 'size')
+
+    def __init__(self, document, etag, last_modified, size):
+        self.document = document
+        self.etag = etag
+        self.last_modified = last_modified
+        self.size = size
+
+
+class CollectionCache(object):
+
+    """Client side cache of parsed collections, validated with HTTP.
+
+    Collections are cached by href along with the ETag and Last-Modified
+    validators of their response. Later requests for the same href are made
+    conditional, and a 304 Not Modified response returns the cached
+    Collection without parsing anything.
+
+    Every call returns a new lazy Collection, see `Collection.from_json`,
+    viewing its own copy of the decoded document, so that it can be modified
+    without affecting the cache or other callers.
+
+    The least recently used collections are evicted when there are more
+    than max_entries, or when the size of their documents adds up to more
+    than max_size. Responses without validators aren't cached.
+
+    :param fetch: called with an href and a dict of request headers, returns
+        the status, a dict of lowercase response headers and the body of the
+        response; defaults to a GET request made with urllib
+    :param max_entries int: maximum number of cached collections
+    :param max_size int: maximum total size of the cached documents, in
+        characters or bytes as returned by fetch
+    :param codec: JSON codec used for parsing
+
+    `hits` counts the requests answered from the cache, `misses` the
+    documents fetched and parsed and `evictions` the collections evicted.
+
+    """
+
+    def __init__(self, fetch=None, max_entries=128, max_size=None,
+                 codec=None):
+        self.fetch = fetch or _fetch_conditional
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.codec = codec
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, href):
+        return normalize_href(href) in self._entries
+
+    def get(self, href):
+        """Return the Collection at href, from the cache if not modified.
+
+        Raises `IOError` for responses with a status other than 2xx or 304.
+
+        """
+        key = normalize_href(href)
+        with self._lock:
+            entry = self._entries.get(key)
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        status, response_headers, body = self.fetch(href, headers)
+        if status == 304 and entry is not None:
+            with self._lock:
+                self.hits += 1
+                if self._entries.get(key) is entry:
+                    # mark as most recently used
+                    del self._entries[key]
+                    self._entries[key] = entry
+            return Collection._view(_copy_decoded(entry.document))
+        if not 200 <= status < 300:
+            raise IOError('HTTP %d for %s' % (status, href))
+
+        collection = Collection.from_json(body, codec=self.codec, lazy=True)
+        etag = response_headers.get('etag')
+        last_modified = response_headers.get('last-modified')
+        with self._lock:
+            self.misses += 1
+            self._discard(key)
+            if etag or last_modified:
+                source = collection._meta.source
+                self._store(key, _CacheEntry(
+                    _copy_decoded(source), etag, last_modified, len(body)))
+        return collection
+
+    def discard(self, href):
+        """Remove the collection at href from the cache, if present."""
+        with self._lock:
+            self._discard(normalize_href(href))
+
+    def clear(self):
+        """Remove all the collections from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def _store(self, key, entry):
+        if self.max_size is not None and entry.size > self.max_size:
+            return
+        self._entries[key] = entry
+        self.size += entry.size
+        while (len(self._entries) > self.max_entries or
+               (self.max_size is not None and self.size > self.max_size)):
+            evicted = self._entries.popitem(last=False)[1]
+            self.size -= evicted.size
+            self.evictions += 1
+
+
+def _hydrated_item(collection, href, take=True):
+    """Return the item representing href in the fetched collection.
+
+    With take, the item is removed from the collection, and otherwise a
+    copy of it is returned.
+
+    """
+    if collection.error is not None:
+        raise ValueError('Error fetching %s: %s' % (
+            href, collection.error.message or collection.error.code))
+    items = collection.items
+    href = normalize_href(href)
+    for index, item in enumerate(items):
+        if item.href and normalize_href(item.href) == href:
+            break
+    else:
+        if len(items) != 1:
+            raise ValueError('No item found at %s' % href)
+        index = 0
+    if not take:
+        return _copy(items[index])
+    # taken out, so that the item doesn't keep the collection alive
+    return items.pop(index)
+
+
+def hydrate(items, fetch=None, max_workers=8, codec=None):
+    """Replace each item of an Array with the representation at its href.
+
+    The href of every item is fetched on up to max_workers threads, and
+    the response parsed as a Collection. The item of that collection
+    with the same href, or its only item, takes the place of the one
+    fetched, so the order of the array is kept.
+
+    fetch is called with each href and returns the document as str or
+    bytes, it defaults to a GET request made with urllib. It may also
+    return a Collection, such as `CollectionCache.get` does, in which
+    case a copy of its item is used, leaving the collection unchanged.
+
+    Returns a dictionary mapping the position of every item that
+    couldn't be hydrated to the exception raised, those items are left
+    as they were. A response with an error status gives a `ValueError`
+    holding the error message or code.
+
+    Raises `ValueError` when max_workers is less than 1.
+
+    """
+    if max_workers < 1:
+        raise ValueError('max_workers must be at least 1, got %r' % (
+            max_workers,))
+    if fetch is None:
+        fetch = _fetch_url
+    jobs = [(index, item.href) for index, item in enumerate(items)
+            if getattr(item, 'href', None)]
+    pending = iter(jobs)
+    lock = threading.Lock()
+    hydrated = {}
+    failures = {}
+
+    def work():
+        while True:
+            with lock:
+                job = next(pending, None)
+            if job is None:
+                return
+            index, href = job
+            try:
+                document = fetch(href)
+                collection = _fetch_collection(document, codec)
+                hydrated[index] = _hydrated_item(
+                    collection, href, collection is not document)
+            except Exception as error:
+                failures[index] = error
+
+    workers = [threading.Thread(target=work)
+               for _ in range(min(max_workers, len(jobs)))]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for worker in workers:
+        worker.join()
+    for index in sorted(hydrated):
+        items[index] = hydrated[index]
+    return failures
+
+
+def _fetch_pages(href, fetch, rel, codec, pages, stop):
+    """Put each page in the pages queue, until stop is set."""
+    def put(entry):
+        # wait for room in the queue, giving up when iteration stopped
+        while not stop.is_set():
+            try:
+                pages.put(entry, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    seen = set()
+    try:
+        while href not in seen:
+            seen.add(href)
+            try:
+                document = fetch(href)
+            except HTTPError as error:
+                document = _error_collection(href, error)
+            page = _fetch_collection(document, codec)
+            if not put((page, None)):
+                return
+            if page.error is not None:
+                break
+            try:
+                link = page.links.get(rel=rel)
+            except ValueError:
+                break
+            href = urljoin(href, link.href)
+    except Exception as error:
+        put((None, error))
+        return
+    put((None, None))
+
+
+def iter_pages(href, fetch=None, prefetch=2, rel='next', codec=None):
+    """Yield the Collection of each page, following the links with rel.
+
+    Pages are fetched and parsed in a background thread, up to prefetch
+    pages ahead of the one being processed.
+
+    fetch is called with the href of each page and returns its document as
+    str or bytes, or as a Collection, it defaults to a GET request made with
+    urllib. Relative hrefs are resolved against the href of the page linking
+    to them. A response with an error status, or an `HTTPError` raised by
+    fetch, gives a page carrying the error, parsed from the body when it
+    holds one and made of the status code and reason otherwise.
+
+    Iteration stops after a page without a link with rel, after a page with
+    an error, or when a link points back to a page already seen. Exceptions
+    raised while fetching or parsing a page are raised when iteration gets
+    to it. Closing the iterator stops the background thread.
+
+    """
+    if fetch is None:
+        fetch = _fetch_url
+    pages = queue.Queue(max(1, prefetch))
+    stop = threading.Event()
+    worker = threading.Thread(target=_fetch_pages,
+                              args=(href, fetch, rel, codec, pages, stop))
+    worker.daemon = True
+    worker.start()
+    try:
+        while True:
+            page, error = pages.get()
+            if error is not None:
+                raise error
+            if page is None:
+                break
+            yield page
+    finally:
+        stop.set()
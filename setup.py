@@ -22,7 +22,8 @@ setup(
     author='Ricardo Kirkner',
     author_email='ricardo@kirkner.com.ar',
     url='http://pypi.python.org/pypi/collection-json',
-    py_modules=['collection_json'],
+    py_modules=['collection_json', 'collection_json_aio',
+                'collection_json_diff', 'collection_json_http'],
     description='Small library to work with Collection+JSON documents.',
     long_description=open('README.txt').read(),
     license='BSD',
@@ -1,19 +1,108 @@
 from __future__ import absolute_import, unicode_literals
+import copy
+import hashlib
+import io
 import json
-from unittest import TestCase
+import mmap
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from unittest import TestCase, skipUnless
+
+try:
+    import asyncio
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.error import HTTPError
+except ImportError:  # Python 2
+    asyncio = None
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib2 import HTTPError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import aiohttp
+except (ImportError, SyntaxError):
+    aiohttp = None
+
+try:
+    import collection_json_aio
+except (ImportError, SyntaxError):
+    collection_json_aio = None
+
+import collection_json
 
 from collection_json import (
     Array,
     ArrayProperty,
     Collection,
+    CollectionReader,
+    ComparableObject,
     Data,
     Error,
     Item,
+    JSONCodec,
     Link,
+    MetricsRecorder,
     Query,
     Template,
-    TypedProperty
+    TemplateFiller,
+    TypedProperty,
+    ValidationError,
+    available_codecs,
+    fingerprint,
+    get_codec,
+    iter_items,
+    iter_ndjson_items,
+    register_codec,
+    set_default_codec,
+    set_metrics_sink,
 )
+from collection_json_diff import CollectionDiff, apply_diff, diff
+from collection_json_http import CollectionCache, hydrate, iter_pages
+
+
+_text_type = type('')
+# dictionaries keep their insertion order, so equal documents encode the same
+_ORDERED_DICTS = sys.version_info >= (3, 6)
+
+
+def comparable_json(text):
+    """Return text, or its decoded value when member order is arbitrary."""
+    if _ORDERED_DICTS:
+        return text
+    return json.loads(text)
+
+
+def kept(obj, name):
+    """Return what obj keeps in its _meta under name, or None."""
+    meta = obj._meta
+    return None if meta is None else getattr(meta, name)
+
+
+class FileLike(object):
+
+    """A file-like object writing chunks of a single type to a list."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.chunks = []
+
+    def write(self, data):
+        if not isinstance(data, self.kind):
+            raise TypeError('Expected %s, got %r' % (self.kind, data))
+        if data:
+            self.chunks.append(data)
 
 
 class CollectionTestCase(TestCase):
@@ -327,6 +416,160 @@ class CollectionTestCase(TestCase):
         expected = json.dumps(collection.to_dict())
         self.assertEqual(str(collection), expected)
 
+    def _full_collection(self):
+        link = Link('href', 'rel', 'name', 'render', 'prompt')
+        data = Data('name', {'value': [1, 2.5, None, True]}, '\u00e9')
+        item = Item('href', [data, Data('other', 0)], [link])
+        query = Query('href', 'rel', 'name', 'prompt', [data])
+        return Collection(
+            href='http://example.com',
+            links=[link],
+            items=[item, Item(), Item(links=[link])],
+            queries=[query, Query('href', 'rel')],
+            template=Template([data]),
+            error=Error('code', 'message', 'title'))
+
+    def test_iter_json_chunks_minimal(self):
+        collection = Collection('href')
+        expected = json.dumps(collection.to_dict())
+        chunks = list(collection.iter_json_chunks())
+        self.assertEqual([comparable_json(chunk) for chunk in chunks],
+                         [comparable_json(expected)])
+
+    def test_iter_json_chunks_full(self):
+        collection = self._full_collection()
+        expected = json.dumps(collection.to_dict())
+        chunks = list(collection.iter_json_chunks(chunk_size=10))
+        self.assertEqual(comparable_json(''.join(chunks)),
+                         comparable_json(expected))
+        self.assertTrue(all(len(chunk) == 10 for chunk in chunks[:-1]))
+        self.assertTrue(0 < len(chunks[-1]) <= 10)
+
+    def test_iter_json_chunks_empty_error(self):
+        collection = Collection('href', error=Error())
+        expected = json.dumps(collection.to_dict())
+        text = ''.join(collection.iter_json_chunks())
+        self.assertEqual(comparable_json(text), comparable_json(expected))
+
+    def test_write_json(self):
+        collection = self._full_collection()
+        fp = io.StringIO()
+        collection.write_json(fp, chunk_size=16)
+        self.assertEqual(comparable_json(fp.getvalue()),
+                         comparable_json(json.dumps(collection.to_dict())))
+
+    def test_write_json_binary(self):
+        collection = self._full_collection()
+        fp = io.BytesIO()
+        collection.write_json(fp)
+        self.assertEqual(comparable_json(fp.getvalue()), comparable_json(
+            json.dumps(collection.to_dict()).encode('ascii')))
+
+    def test_write_json_file_like(self):
+        collection = self._full_collection()
+        expected = json.dumps(collection.to_dict())
+        # neither takes part in the io class hierarchy
+        text = FileLike(_text_type)
+        collection.write_json(text, chunk_size=16)
+        self.assertEqual(comparable_json(''.join(text.chunks)),
+                         comparable_json(expected))
+        binary = FileLike(bytes)
+        collection.write_json(binary, chunk_size=16)
+        self.assertEqual(comparable_json(b''.join(binary.chunks)),
+                         comparable_json(expected.encode('ascii')))
+
+    def test_write_json_encoding(self):
+        collection = Collection('\u00e9')
+        fp = FileLike(bytes)
+        collection.write_json(fp, encoding='utf-16')
+        self.assertEqual(comparable_json(b''.join(fp.chunks).decode('utf-16')),
+                         comparable_json(collection.to_json()))
+
+    def test_pickle(self):
+        collection = self._full_collection()
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copied = pickle.loads(pickle.dumps(collection, protocol))
+            self.assertEqual(copied, collection)
+
+    def test_deepcopy(self):
+        collection = self._full_collection()
+        copied = copy.deepcopy(collection)
+        self.assertEqual(copied, collection)
+        self.assertIsNot(copied.items[0], collection.items[0])
+        copied.items[0].data[0].name = 'changed'
+        self.assertEqual(copied.items[0].changed, copied.items[0].data[0])
+
+    def test_from_rows(self):
+        rows = [(1, 'first'), (2, None)]
+        collection = Collection.from_rows(
+            'href', ['id', 'title'], iter(rows), version='1.1')
+        expected = Collection('href', items=[
+            {'data': [{'name': 'id', 'value': 1},
+                      {'name': 'title', 'value': 'first'}]},
+            {'data': [{'name': 'id', 'value': 2},
+                      {'name': 'title'}]},
+        ], version='1.1')
+        self.assertEqual(collection, expected)
+        self.assertEqual(collection.items[0].title.value, 'first')
+
+    def test_from_rows_templates(self):
+        collection = Collection.from_rows(
+            'href', ['id'], [(1,), (2,)], item_href='href/{id}',
+            item_links=[{'href': 'href/{id}/owner', 'rel': 'owner'},
+                        Link('other', 'other', prompt='Other')])
+        item = collection.items[1]
+        self.assertEqual(item.href, 'href/2')
+        self.assertEqual(list(item.links), [
+            Link('href/2/owner', 'owner'),
+            Link('other', 'other', prompt='Other')])
+
+    def test_from_rows_href_callable(self):
+        collection = Collection.from_rows(
+            'href', ['id'], [(1,)], item_href=lambda row: 'item%d' % row[0])
+        self.assertEqual(collection.items[0].href, 'item1')
+
+    def test_from_columns(self):
+        columns = {'id': [1, 2], 'title': ['first', None]}
+        collection = Collection.from_columns('href', columns,
+                                             item_href='href/{id}')
+        self.assertEqual(collection.items[1].href, 'href/2')
+        self.assertEqual(collection.items[1].id.value, 2)
+        columns = collection.items.to_columns(['id', 'title'])
+        self.assertEqual(list(columns['title']), ['first', None])
+
+    def test_from_columns_round_trip_absent(self):
+        collection = Collection('href', items=[
+            {'data': [{'name': 'id', 'value': 1},
+                      {'name': 'title', 'value': 'first'}]},
+            {'data': [{'name': 'id', 'value': 2}]},
+            {'data': [{'name': 'title'}]},
+        ])
+        columns = collection.items.to_columns()
+        self.assertEqual(columns.absent, {'id': [2], 'title': [1]})
+        for compact in (False, True):
+            copied = Collection.from_columns('href', columns,
+                                             compact=compact)
+            self.assertEqual(copied.to_dict(), collection.to_dict())
+            self.assertEqual(list(copied.items[2].data),
+                             [Data('title')])
+        copied = pickle.loads(pickle.dumps(columns))
+        self.assertEqual(copied.absent, columns.absent)
+
+    def test_from_columns_different_lengths(self):
+        with self.assertRaises(ValueError):
+            Collection.from_columns('href', {'id': [1, 2], 'title': []})
+
+    @skipUnless(numpy is not None, 'NumPy is not installed')
+    def test_from_columns_numpy(self):
+        collection = Collection.from_columns('href', {
+            'id': numpy.arange(3)})
+        self.assertIs(type(collection.items[2].id.value), int)
+        json.dumps(collection.to_dict())
+
+    def test_from_rows_invalid_row(self):
+        with self.assertRaises(ValueError):
+            Collection.from_rows('href', ['id', 'title'], [(1,)])
+
     def test_set_error_invalid(self):
         collection = Collection('href')
         invalid_obj = object()
@@ -540,6 +783,11 @@ class TemplateTestCase(TestCase):
         template = Template([data])
         self.assertEqual(template.name, data)
 
+    def test_attribute_lookup_array_method_name(self):
+        data = Data('search', 'value')
+        template = Template([data])
+        self.assertIs(template.search, data)
+
     def test_template_from_json_no_error(self):
         expected = {
             'template': {
@@ -583,6 +831,105 @@ class TemplateTestCase(TestCase):
         self.assertEqual(template, expected)
 
 
+class TemplateFillerTestCase(TestCase):
+
+    def setUp(self):
+        self.template = Template([
+            Data('title', prompt='Title'),
+            Data('year'),
+            Data('kind', value='book', prompt='Kind'),
+        ])
+        self.filler = TemplateFiller(self.template, required=['title'])
+
+    def filled(self, values):
+        template = copy.deepcopy(self.template)
+        for name, value in values.items():
+            template.data.get(name=name).value = value
+        return template.to_dict()
+
+    def test_dict_record(self):
+        record = {'title': 'Title \xe9', 'year': 2015, 'other': 1}
+        expected = self.filled({'title': 'Title \xe9', 'year': 2015})
+        self.assertEqual(self.filler(record), expected)
+        self.assertEqual(comparable_json(self.filler.to_json(record)),
+                         comparable_json(json.dumps(expected)))
+
+    def test_defaults(self):
+        expected = self.filled({'title': 'title'})
+        self.assertEqual(self.filler({'title': 'title'}), expected)
+        self.assertEqual(comparable_json(self.filler.to_json(('title',))),
+                         comparable_json(json.dumps(expected)))
+        expected = self.filled({'title': 'title', 'kind': 'film'})
+        self.assertEqual(self.filler(('title', None, 'film')), expected)
+
+    def test_columns(self):
+        filler = TemplateFiller(self.template, columns=['year', 'title'])
+        self.assertEqual(filler((2015, 'title')),
+                         self.filled({'title': 'title', 'year': 2015}))
+        with self.assertRaises(ValueError):
+            filler((2015, 'title', 'film'))
+        self.assertEqual(filler(()), self.template.to_dict())
+
+    def test_required(self):
+        for record in ({}, {'title': None}, (None, 2015), ()):
+            with self.assertRaises(ValueError):
+                self.filler(record)
+            with self.assertRaises(ValueError):
+                self.filler.to_json(record)
+        filler = TemplateFiller(Template([Data('title', value='default')]),
+                                required=['title'])
+        self.assertEqual(filler({}), {'template': {'data': [
+            {'name': 'title', 'value': 'default'}]}})
+
+    def test_duplicate_names(self):
+        template = Template([Data('tag'), Data('title'), Data('tag')])
+        filled = TemplateFiller(template)(('a', 'title', 'b'))
+        self.assertEqual([data.get('value') for data in
+                          filled['template']['data']], ['a', 'title', 'b'])
+        filler = TemplateFiller(template, columns=['tag', 'tag'])
+        self.assertEqual(filler(('a', 'b')), {'template': {'data': [
+            {'name': 'tag', 'value': 'a'}, {'name': 'title'},
+            {'name': 'tag', 'value': 'b'}]}})
+        self.assertEqual(json.loads(filler.to_json(('a', 'b'))),
+                         filler(('a', 'b')))
+        with self.assertRaises(ValueError):
+            TemplateFiller(template, columns=['title', 'title'])
+
+    def test_data_named_compile(self):
+        data = Data('compile', 'value')
+        self.assertIs(Template([data]).compile, data)
+
+    def test_unknown_names(self):
+        with self.assertRaises(ValueError):
+            TemplateFiller(self.template, required=['other'])
+        with self.assertRaises(ValueError):
+            TemplateFiller(self.template, columns=['title', 'other'])
+
+    def test_template_changes_ignored(self):
+        self.template.data.append(Data('other'))
+        self.template.data[0].prompt = 'Other'
+        self.assertEqual(len(self.filler(('title',))['template']['data']), 3)
+        self.assertEqual(self.filler(('title',))['template']['data'][0],
+                         {'name': 'title', 'value': 'title',
+                          'prompt': 'Title'})
+
+    def test_batches(self):
+        records = [('title %d' % i, i) for i in range(3)]
+        dicts = list(self.filler.iter_dicts(records))
+        self.assertEqual(dicts, [self.filler(record) for record in records])
+        self.assertEqual([comparable_json(text) for text in
+                          self.filler.iter_json(iter(records))],
+                         [comparable_json(json.dumps(payload))
+                          for payload in dicts])
+        records.insert(2, {'year': 1})
+        payloads = self.filler.iter_json(records)
+        next(payloads)
+        next(payloads)
+        with self.assertRaises(ValueError) as context:
+            next(payloads)
+        self.assertIn('Record 2', str(context.exception))
+
+
 class ItemTestCase(TestCase):
     def test_item_minimal(self):
         item = Item()
@@ -639,6 +986,13 @@ class ItemTestCase(TestCase):
         item = Item(data=[data])
         self.assertEqual(item.name, data)
 
+    def test_attribute_lookup_array_method_name(self):
+        data = Data('search', 'value')
+        item = Item(data=[data])
+        self.assertIs(item.search, data)
+        with self.assertRaises(AttributeError):
+            Item().search
+
     def test_set_data_invalid(self):
         item = Item()
         invalid_obj = object()
@@ -783,6 +1137,63 @@ class QueryTestCase(TestCase):
         self.assertEqual(query, expected)
 
 
+class CompiledQueryTestCase(TestCase):
+
+    def setUp(self):
+        self.query = Query('http://example.org/search', 'search', 'find',
+                           data=[Data('q', value=''), Data('sort by'),
+                                 Data('page', value=1)])
+
+    def test_build_url(self):
+        self.assertEqual(self.query.build_url(),
+                         'http://example.org/search?q=&page=1')
+        self.assertEqual(self.query.build_url(q='caf\xe9 & bar',
+                                              page=None),
+                         'http://example.org/search?q=caf%C3%A9+%26+bar')
+        self.assertEqual(self.query.build_url(**{'sort by': 'name', 'q': 'a'}),
+                         'http://example.org/search?q=a&sort+by=name&page=1')
+
+    def test_values(self):
+        self.assertEqual(self.query.build_url(q=['a', 'b'], page=2.5),
+                         'http://example.org/search?q=a&q=b&page=2.5')
+        self.assertEqual(self.query.build_url(q=True, page=[]),
+                         'http://example.org/search?q=true')
+
+    def test_href(self):
+        query = Query('search?type=book#results', 'search',
+                      data=[Data('q')])
+        self.assertEqual(query.build_url(q='a'),
+                         'search?type=book&q=a#results')
+        self.assertEqual(query.build_url(), 'search?type=book#results')
+        query = Query('search?', 'search', data=[Data('q', value='a')])
+        self.assertEqual(query.build_url(), 'search?q=a')
+
+    def test_unknown_name(self):
+        with self.assertRaises(ValueError):
+            self.query.build_url(other='value')
+
+    def test_compiled_queries_shared(self):
+        compiled = self.query.compile()
+        self.assertIs(compiled, copy.deepcopy(self.query).compile())
+        lazy = Collection.from_json(json.dumps({'collection': {
+            'href': 'href', 'queries': [self.query.to_dict()]}}), lazy=True)
+        self.assertIs(lazy.queries[0].compile(), compiled)
+        self.query.data[0].value = 'changed'
+        self.assertIsNot(self.query.compile(), compiled)
+        self.assertEqual(compiled.build_url(q='b', page=None),
+                         'http://example.org/search?q=b')
+        unhashable = Query('href', 'rel', data=[Data('q', value=[1])])
+        self.assertEqual(unhashable.build_url(), 'href?q=1')
+
+    def test_cache_size(self):
+        size = collection_json._QUERY_CACHE_SIZE
+        first = Query('href0', 'rel').compile()
+        for i in range(1, size + 1):
+            Query('href%d' % i, 'rel').compile()
+        self.assertEqual(len(collection_json._compiled_queries), size)
+        self.assertIsNot(Query('href0', 'rel').compile(), first)
+
+
 class LinkTestCase(TestCase):
     def test_link_minimal(self):
         link = Link('href', 'rel')
@@ -864,6 +1275,59 @@ class ArrayTestCase(TestCase):
         list1 = [{1: 1}]
         self.assertNotEqual(array1, list1)
 
+    def test_to_columns(self):
+        items = Array(Item, 'items', [
+            {'data': [{'name': 'id', 'value': 1},
+                      {'name': 'title', 'value': 'first'},
+                      {'name': 'id', 'value': 3}]},
+            {'data': [{'name': 'id', 'value': 2}]},
+        ])
+        columns = items.to_columns()
+        self.assertEqual(list(columns), ['id', 'title'])
+        self.assertEqual(list(columns['id']), [1, 2])
+        self.assertEqual(list(columns['title']), ['first', None])
+
+    def test_to_columns_names(self):
+        items = Array(Item, 'items', [
+            {'data': [{'name': 'id', 'value': 1},
+                      {'name': 'title', 'value': 'first'}]},
+        ])
+        columns = items.to_columns(['title', 'missing'])
+        self.assertEqual(list(columns), ['title', 'missing'])
+        self.assertEqual(list(columns['missing']), [None])
+
+    def test_data_named_to_columns(self):
+        items = Array(Item, 'items', [
+            {'data': [{'name': 'to_columns', 'value': 1}]}])
+        self.assertEqual(items[0].to_columns.value, 1)
+        self.assertEqual(list(items.to_columns()['to_columns']), [1])
+
+    def test_to_columns_lazy(self):
+        document = Collection.from_rows(
+            'href', ['id', 'title'], [(1, 'first'), (2, 'second')]).to_dict()
+        collection = Collection.from_json(json.dumps(document), lazy=True)
+        columns = collection.items.to_columns()
+        self.assertEqual(list(columns['title']), ['first', 'second'])
+        self.assertIsNotNone(kept(collection.items[0], 'source'))
+
+    def test_to_columns_without_data(self):
+        with self.assertRaises(TypeError):
+            Array(Link, 'links', []).to_columns()
+
+    @skipUnless(numpy is not None, 'NumPy is not installed')
+    def test_to_columns_numpy(self):
+        items = Array(Item, 'items', [
+            {'data': [{'name': 'id', 'value': i},
+                      {'name': 'title', 'value': 'title'},
+                      {'name': 'tags', 'value': [i] * i}]}
+            for i in range(3)
+        ])
+        columns = items.to_columns()
+        self.assertEqual(columns['id'].dtype.kind, 'i')
+        self.assertEqual(columns['id'].sum(), 3)
+        self.assertEqual(columns['title'].dtype, object)
+        self.assertEqual(columns['tags'].shape, (3,))
+
     def test_find_by_rel(self):
         link = Link('href', rel='foo')
         links = Array(Link, 'links', [link])
@@ -979,6 +1443,441 @@ class ArrayTestCase(TestCase):
         self.assertEqual(links.foo, [foo, bar])
 
 
+class ArrayIndexTestCase(TestCase):
+
+    def setUp(self):
+        # index arrays of any size
+        self.patch = Array._index_min_size
+        Array._index_min_size = 0
+
+    def tearDown(self):
+        Array._index_min_size = self.patch
+
+    def test_find_by_href(self):
+        item1 = Item('href1')
+        item2 = Item('href2')
+        items = Array(Item, 'items', [item1, item2, Item('href1')])
+        self.assertEqual(items.find(href='href2'), [item2])
+        self.assertEqual(items.get(href='href1'), item1)
+        self.assertEqual(items.find(href='href3'), [])
+
+    def test_find_by_href_and_rel(self):
+        foo = Link('href', rel='foo')
+        bar = Link('href', rel='bar')
+        links = Array(Link, 'links', [foo, bar, Link('other', rel='foo')])
+        self.assertEqual(links.find(href='href', rel='bar'), [bar])
+
+    def test_find_result_is_a_copy(self):
+        link = Link('href', rel='foo')
+        links = Array(Link, 'links', [link])
+        links.find(rel='foo').append(link)
+        self.assertEqual(links.find(rel='foo'), [link])
+
+    def test_find_after_append(self):
+        foo = Link('href1', rel='foo')
+        links = Array(Link, 'links', [foo])
+        self.assertEqual(links.find(rel='foo'), [foo])
+        bar = Link('href2', rel='foo')
+        links.append(bar)
+        links += [Link('href3', rel='baz')]
+        self.assertEqual(links.find(rel='foo'), [foo, bar])
+        self.assertEqual(links.get(rel='baz').href, 'href3')
+
+    def test_find_after_setitem(self):
+        foo = Link('href1', rel='foo')
+        links = Array(Link, 'links', [foo])
+        self.assertEqual(links.find(rel='foo'), [foo])
+        bar = Link('href2', rel='bar')
+        links[0] = bar
+        self.assertEqual(links.find(rel='foo'), [])
+        self.assertEqual(links.find(rel='bar'), [bar])
+        links[:] = [foo]
+        self.assertEqual(links.find(rel='foo'), [foo])
+
+    def test_find_after_remove(self):
+        foo = Link('href1', rel='foo')
+        bar = Link('href2', rel='foo')
+        links = Array(Link, 'links', [foo, bar])
+        self.assertEqual(links.find(rel='foo'), [foo, bar])
+        links.remove(foo)
+        self.assertEqual(links.find(rel='foo'), [bar])
+        links.pop()
+        self.assertEqual(links.find(rel='foo'), [])
+
+    def test_find_after_insert(self):
+        foo = Link('href1', rel='foo')
+        bar = Link('href2', rel='foo')
+        links = Array(Link, 'links', [foo])
+        self.assertEqual(links.find(rel='foo'), [foo])
+        links.insert(0, bar)
+        self.assertEqual(links.find(rel='foo'), [bar, foo])
+
+    def test_find_after_item_changed(self):
+        foo = Link('href', rel='foo')
+        links = Array(Link, 'links', [foo])
+        self.assertEqual(links.find(rel='foo'), [foo])
+        foo.rel = 'bar'
+        self.assertEqual(links.find(rel='foo'), [])
+        self.assertEqual(links.find(rel='bar'), [foo])
+
+    def test_find_after_removed_item_changed(self):
+        foo = Link('href', rel='foo')
+        links = Array(Link, 'links', [foo, foo])
+        self.assertEqual(links.find(rel='foo'), [foo, foo])
+        del links[0]
+        foo.rel = 'bar'
+        self.assertEqual(links.find(rel='bar'), [foo])
+        links.remove(foo)
+        self.assertEqual(links.find(rel='bar'), [])
+
+    def test_find_in_several_arrays(self):
+        foo = Link('href', rel='foo')
+        links1 = Array(Link, 'links', [foo])
+        links2 = Array(Link, 'links', [foo])
+        self.assertEqual(links1.find(rel='foo'), [foo])
+        self.assertEqual(links2.find(rel='foo'), [foo])
+        foo.rel = 'bar'
+        self.assertEqual(links1.find(rel='bar'), [foo])
+        self.assertEqual(links2.find(rel='bar'), [foo])
+
+    def test_attribute_lookup_after_data_changed(self):
+        data = Data('name', 'value')
+        item = Item(data=[data])
+        self.assertEqual(item.name, data)
+        data.name = 'other'
+        self.assertEqual(item.other, data)
+        with self.assertRaises(AttributeError):
+            item.name
+
+    def test_equal_ignores_index(self):
+        array1 = Array(Link, 'links', [Link('href', 'rel')])
+        array2 = Array(Link, 'links', [Link('href', 'rel')])
+        array1.find(rel='rel')
+        self.assertEqual(array1, array2)
+
+    def test_find_unhashable_values(self):
+        foo = Data(['unhashable'])
+        bar = Data('bar')
+        data = Array(Data, 'data', [foo, bar])
+        self.assertEqual(data.find(name='bar'), [bar])
+        self.assertEqual(data.find(name=['unhashable']), [foo])
+
+    def test_find_large_array(self):
+        Array._index_min_size = self.patch
+        links = Array(Link, 'links', [
+            Link('href%d' % i, rel='rel%d' % (i % 3))
+            for i in range(Array._index_min_size * 3)])
+        expected = [link for link in links if link.rel == 'rel1']
+        self.assertEqual(links.find(rel='rel1'), expected)
+        self.assertIsNotNone(links._index)
+
+
+class ArrayWhereTestCase(TestCase):
+
+    def setUp(self):
+        self.items = Array(Item, 'items', [
+            Item('item%d' % i, data=[
+                Data('status', ['active', 'closed', 'draft'][i % 3]),
+                Data('age', i * 10),
+                Data('name', 'name %d' % i),
+            ]) for i in range(10)
+        ])
+
+    def hrefs(self, items):
+        return [item.href for item in items]
+
+    def check(self, **predicates):
+        # the indexes must give the same results as a scan
+        index = self.items._value_index
+        self.items._value_index = None
+        expected = self.items.where(**predicates)
+        self.items._value_index = index
+        self.assertEqual(self.hrefs(self.items.where(**predicates)),
+                         self.hrefs(expected))
+        return self.hrefs(expected)
+
+    def test_scan(self):
+        self.assertEqual(self.hrefs(self.items.where(status='closed')),
+                         ['item1', 'item4', 'item7'])
+        self.assertEqual(
+            self.hrefs(self.items.where(status='active', age__gt=30)),
+            ['item6', 'item9'])
+        self.assertEqual(self.hrefs(self.items.where(
+            status__in=['draft', 'closed'], age__lte=20)), ['item1', 'item2'])
+        self.assertEqual(self.items.where(missing=1), [])
+        self.assertEqual(len(self.items.where(missing=None)), 10)
+        self.assertEqual(len(self.items.where()), 10)
+
+    def test_indexed(self):
+        self.items.create_index('status')
+        self.items.create_index('age', ordered=True)
+        self.assertEqual(self.items.indexes, {'status': False, 'age': True})
+        self.assertEqual(self.check(status='closed'),
+                         ['item1', 'item4', 'item7'])
+        self.assertEqual(self.check(age__gte=50, age__lt=80),
+                         ['item5', 'item6', 'item7'])
+        self.assertEqual(self.check(age__gt=70, status__in=['active']),
+                         ['item9'])
+        self.check(status__eq='draft', name='name 2')
+        self.check(age__lt='z')
+        self.check(name__gt='name 5', status='closed')
+        self.assertEqual(self.check(age__in=[10, 30.0, 'x']),
+                         ['item1', 'item3'])
+
+    def test_index_uses_fewest_candidates(self):
+        self.items.create_index('status')
+        self.items.create_index('age', ordered=True)
+        age = self.items._value_index.fields['age']
+        selected = []
+        select = collection_json._FieldIndex.select
+
+        def spy(field, *args):
+            selected.append((field is age,) + args)
+            return select(field, *args)
+        collection_json._FieldIndex.select = spy
+        self.addCleanup(setattr, collection_json._FieldIndex, 'select',
+                        select)
+        self.assertEqual(self.hrefs(self.items.where(
+            status='active', age__gt=80)), ['item9'])
+        self.assertEqual(selected, [(True, 'gt', (0, 80))])
+
+    def test_index_updates(self):
+        self.items.create_index('status')
+        self.items.create_index('age', ordered=True)
+        items = self.items
+        items.append(Item('new', data=[Data('status', 'closed'),
+                                       Data('age', 15)]))
+        items.insert(0, Item('first', data=[Data('status', 'closed')]))
+        items.pop(3)
+        del items[5]
+        items[1] = Item('replaced', data=[Data('age', 5)])
+        self.assertEqual(self.check(status='closed'),
+                         ['first', 'item1', 'item4', 'item7', 'new'])
+        self.assertEqual(self.check(age__lt=20), ['replaced', 'item1', 'new'])
+        items.reverse()
+        self.assertEqual(self.check(status='closed'),
+                         ['new', 'item7', 'item4', 'item1', 'first'])
+        items.sort(key=lambda item: item.href)
+        self.check(status='closed')
+        items *= 2
+        self.check(status='closed')
+        items.clear()
+        self.assertEqual(self.check(status='closed'), [])
+
+    def test_index_follows_item_changes(self):
+        self.items.create_index('status')
+        self.items.create_index('age', ordered=True)
+        item = self.items[0]
+        item.status.value = 'closed'
+        item.age.value = 95
+        self.assertEqual(self.check(status='closed'),
+                         ['item0', 'item1', 'item4', 'item7'])
+        self.assertEqual(self.check(age__gt=90), ['item0'])
+        item.data.append(Data('status', 'active'))
+        self.assertEqual(self.check(status='closed')[0], 'item0')
+        del item.data[0]
+        self.assertNotIn('item0', self.check(status='closed'))
+        self.items[1].data = [Data('status', 'draft')]
+        self.assertEqual(self.check(status='draft', age=None), ['item1'])
+        self.items[2].status.name = 'state'
+        self.assertNotIn('item2', self.check(status='draft'))
+
+    def test_lazy_and_compact(self):
+        document = {'collection': {'href': 'href', 'items': [
+            item.to_dict() for item in self.items]}}
+        for kwargs in ({'lazy': True}, {'compact': True}):
+            items = Collection.from_json(json.dumps(document),
+                                         **kwargs).items
+            items.create_index('status')
+            self.assertIsNotNone(kept(items[4], 'source') or
+                                 items[4]._values)
+            self.assertEqual(self.hrefs(items.where(status='closed')),
+                             ['item1', 'item4', 'item7'])
+            items[4].status.value = 'draft'
+            self.assertEqual(self.hrefs(items.where(status='closed')),
+                             ['item1', 'item7'])
+
+    def test_unhashable_and_duplicates(self):
+        item = Item('list', data=[Data('status', ['a'])])
+        self.items.extend([item, item])
+        self.items.create_index('status', ordered=True)
+        self.assertEqual(self.check(status=['a']), ['list'])
+        self.items.remove(item)
+        self.assertEqual(self.check(status=['a']), ['list'])
+        self.items.remove(item)
+        self.assertEqual(self.check(status=['a']), [])
+
+    def test_drop_index(self):
+        self.items.create_index('status')
+        self.items.drop_index('status')
+        self.assertIsNone(self.items._value_index)
+        self.assertEqual(self.items.indexes, {})
+        with self.assertRaises(ValueError):
+            self.items.drop_index('status')
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError) as context:
+            self.items.where(age__between=1)
+        self.assertIn('age__between', str(context.exception))
+        with self.assertRaises(ValueError):
+            self.items.where(age__gt=None)
+        with self.assertRaises(TypeError):
+            Array(Link, 'links', []).where(rel='next')
+        with self.assertRaises(TypeError):
+            Array(Link, 'links', []).create_index('rel')
+
+    def test_data_named_after_methods(self):
+        names = ['where', 'create_index', 'drop_index', 'indexes']
+        item = Item('item', data=[Data(name, i)
+                                  for i, name in enumerate(names)])
+        for i, name in enumerate(names):
+            self.assertEqual(getattr(item, name).value, i)
+        self.items.append(item)
+        self.items.create_index('where')
+        self.assertEqual(self.hrefs(self.items.where(where=0)), ['item'])
+        self.assertEqual(self.items.indexes, {'where': False})
+
+
+class ArraySearchTestCase(TestCase):
+
+    def setUp(self):
+        self.items = Array(Item, 'items', [
+            Item('smith', data=[Data('name', 'John Smith', 'Full name'),
+                                Data('bio', 'Smith, of Smith & Sons.'),
+                                Data('age', 40)]),
+            Item('walker', data=[Data('name', 'Johnny Walker'),
+                                 Data('bio', 'Walks with John')]),
+            Item('doe', data=[Data('name', 'Jane Doe', 'Full name')]),
+        ])
+
+    def search(self, *args, **kwargs):
+        results = [item.href for item in
+                   self.items.search(*args, **kwargs)]
+        text = getattr(self.items._value_index, 'text', None)
+        if text is not None:
+            # the kept index must give the same results as a new one
+            index = collection_json._ValueIndex(self.items)
+            index.add_text(text.prompts)
+            self.assertEqual([item.href for item in
+                              index.search(*args, **kwargs)], results)
+        return results
+
+    def test_search(self):
+        self.assertEqual(self.search('john'), ['smith', 'walker'])
+        self.assertEqual(self.search('SMITH'), ['smith'])
+        self.assertEqual(self.search('john smith'), ['smith'])
+        self.assertEqual(self.search('john jane'), [])
+        self.assertEqual(self.search('40'), [])
+        self.assertEqual(self.search('full'), [])
+        self.assertEqual(self.search(''), [])
+        self.assertEqual(self.search('john', limit=1), ['smith'])
+
+    def test_prefix(self):
+        # walker holds both Johnny and John
+        self.assertEqual(self.search('jo', prefix=True), ['walker', 'smith'])
+        self.assertEqual(self.search('walk', prefix=True), ['walker'])
+        self.assertEqual(self.search('j d', prefix=True), ['doe'])
+        self.assertEqual(self.search('jo', prefix=False), [])
+
+    def test_ranking(self):
+        # smith is found 3 times in the first item, once in the last one
+        self.items.append(Item('other', data=[Data('name', 'Ann Smith')]))
+        self.items.append(Item('many', data=[Data('name', 'Smith ' * 4)]))
+        self.assertEqual(self.search('smith'), ['many', 'smith', 'other'])
+        self.assertEqual(self.search('smith', limit=2), ['many', 'smith'])
+
+    def test_index(self):
+        self.items.create_text_index()
+        self.assertEqual(self.search('john'), ['smith', 'walker'])
+        self.assertEqual(self.search('full'), [])
+        self.items.create_text_index(prompts=True)
+        self.assertEqual(self.search('full name'), ['smith', 'doe'])
+        self.items.drop_text_index()
+        self.assertIsNone(self.items._value_index)
+        with self.assertRaises(ValueError):
+            self.items.drop_text_index()
+
+    def test_index_updates(self):
+        self.items.create_text_index()
+        self.items.create_index('age')
+        items = self.items
+        self.assertEqual(self.search('jo', prefix=True), ['walker', 'smith'])
+        items[2].name.value = 'Joan Doe'
+        self.assertEqual(self.search('jo', prefix=True),
+                         ['walker', 'smith', 'doe'])
+        items[0].data = [Data('name', 'Bob')]
+        self.assertEqual(self.search('smith'), [])
+        items.insert(0, Item('first', data=[Data('bio', 'Jolly')]))
+        self.assertEqual(self.search('jo', prefix=True),
+                         ['walker', 'first', 'doe'])
+        del items[1]
+        items.pop()
+        items.reverse()
+        self.assertEqual(self.search('jo', prefix=True), ['walker', 'first'])
+        items.drop_index('age')
+        self.assertIsNotNone(items._value_index)
+        items.extend([Item('zed', data=[Data('name', 'Zed Jones')])])
+        self.assertEqual(self.search('jones'), ['zed'])
+        self.assertEqual(self.search('zeta', prefix=True), [])
+
+    def test_lazy_and_compact(self):
+        document = {'collection': {'href': 'href', 'items': [
+            item.to_dict() for item in self.items]}}
+        for kwargs in ({'lazy': True}, {'compact': True}):
+            items = Collection.from_json(json.dumps(document),
+                                         **kwargs).items
+            items.create_text_index(prompts=True)
+            self.assertIsNotNone(kept(items[2], 'source') or
+                                 items[2]._values)
+            self.assertEqual([item.href for item in items.search('full')],
+                             ['smith', 'doe'])
+            items[2].name.value = 'Jane'
+            self.assertEqual([item.href for item in items.search('doe')],
+                             [])
+
+    def test_invalid(self):
+        with self.assertRaises(TypeError):
+            Array(Link, 'links', []).create_text_index()
+
+
+class Custom(ComparableObject):
+
+    def __init__(self, value):
+        self.value = value
+
+
+class ComparableObjectTestCase(TestCase):
+
+    def test_equal_without_fields(self):
+        self.assertEqual(Custom(1), Custom(1))
+        self.assertNotEqual(Custom(1), Custom(2))
+        self.assertNotEqual(fingerprint(Custom(1)),
+                            fingerprint(Custom(2)))
+
+    def test_equal_without_fields_ignores_containers(self):
+        custom = Custom(1)
+        Array(Custom, 'customs', [custom])
+        self.assertEqual(custom, Custom(1))
+
+    def test_pickle_without_fields(self):
+        custom = pickle.loads(pickle.dumps(Custom(1)))
+        self.assertEqual(custom, Custom(1))
+
+    def test_containers_are_weak_references(self):
+        collection = Collection('href', items=[Item('href', [Data('name')])])
+        item = collection.items[0]
+        data = item.data[0]
+        items = weakref.ref(collection.items)
+        del collection
+        # without reference cycles, containers are freed right away
+        self.assertIsNone(items())
+        item.href = 'other'
+        data.value = 'value'
+        self.assertEqual(item.name.value, 'value')
+        del item
+        self.assertEqual(data.value, 'value')
+
+
 class ArrayPropertyTestCase(TestCase):
 
     class Simple(object):
@@ -1021,3 +1920,2045 @@ class TypedPropertyTestCase(TestCase):
     def test_get_without_instance(self):
         self.assertTrue(isinstance(TypedPropertyTestCase.Simple.tprop,
                                    TypedProperty))
+
+
+class CollectionReaderTestCase(TestCase):
+
+    def setUp(self):
+        # the tests depend on the order of the members
+        self.document = {'collection': OrderedDict([
+            ('version', '1.0'),
+            ('href', 'http://example.org'),
+            ('links', [{'href': 'href', 'rel': 'rel'}]),
+            ('items', [
+                {
+                    'href': 'href%d' % i,
+                    'data': [{'name': 'name', 'value': '\u00e9 %d' % i}],
+                    'links': [{'href': 'href', 'rel': 'rel'}],
+                } for i in range(20)
+            ]),
+            ('queries', [{'href': 'href', 'rel': 'search'}]),
+            ('template', {'data': [{'name': 'name'}]}),
+        ])}
+        self.data = json.dumps(self.document, ensure_ascii=False)
+
+    def test_iter_items_from_text_file(self):
+        items = list(iter_items(io.StringIO(self.data), chunk_size=7))
+        expected = Collection.from_json(self.data).items
+        self.assertEqual(items, list(expected))
+
+    def test_iter_items_from_byte_chunks(self):
+        data = self.data.encode('utf-8')
+        # split inside multi-byte sequences and numbers
+        chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+        items = list(iter_items(chunks))
+        expected = Collection.from_json(self.data).items
+        self.assertEqual(items, list(expected))
+
+    def test_iter_items_yields_items(self):
+        reader = CollectionReader(io.BytesIO(self.data.encode('utf-8')))
+        item = next(iter(reader))
+        self.assertIsInstance(item, Item)
+        self.assertEqual(item.name.value, '\u00e9 0')
+
+    def test_members_before_items(self):
+        reader = CollectionReader(io.StringIO(self.data), chunk_size=5)
+        self.assertEqual(reader.href, 'http://example.org')
+        self.assertEqual(reader.links, Array(Link, 'links', [
+            Link('href', 'rel')]))
+        self.assertEqual(len(list(reader)), 20)
+
+    def test_members_after_items(self):
+        reader = CollectionReader(io.StringIO(self.data), chunk_size=5)
+        items = iter(reader)
+        next(items)
+        self.assertEqual(reader.template, Template([Data('name')]))
+        self.assertEqual(reader.queries, Array(Query, 'queries', [
+            Query('href', 'search')]))
+        self.assertEqual(reader.error, None)
+        # remaining items were skipped
+        self.assertEqual(list(items), [])
+
+    def test_collection(self):
+        reader = CollectionReader(io.StringIO(self.data))
+        expected = Collection.from_json(self.data)
+        expected.items = []
+        self.assertEqual(reader.collection, expected)
+
+    def test_numbers_across_chunks(self):
+        data = '{"collection": {"href": "href", "items": [' \
+               '{"data": [{"name": "n", "value": 123456}]}]}}'
+        chunks = [data[i:i + 2] for i in range(0, len(data), 2)]
+        items = list(iter_items(chunks))
+        self.assertEqual(items[0].n.value, 123456)
+
+    def test_split_at_every_offset(self):
+        data = '{"collection": {"version": 1.5, "href": "href", "items": [' \
+               '{"data": [{"name": "n", "value": -12.5e+3}]}, 7], ' \
+               '"links": [], "size": 20}}'
+        for offset in range(1, len(data)):
+            reader = CollectionReader([data[:offset], data[offset:]])
+            values = list(reader._iter_dicts())
+            self.assertEqual(values[0]['data'][0]['value'], -12.5e+3,
+                             offset)
+            self.assertEqual(values[1], 7, offset)
+            self.assertEqual(reader.version, 1.5, offset)
+            self.assertEqual(reader._member('size'), 20, offset)
+
+    def test_invalid_data(self):
+        with self.assertRaises(ValueError):
+            list(iter_items(io.StringIO('')))
+
+    def test_invalid_document(self):
+        with self.assertRaises(ValueError):
+            list(iter_items(io.StringIO('{"items": []}')))
+
+    def test_invalid_items(self):
+        data = '{"collection": {"href": "href", "items": [1]}}'
+        with self.assertRaises(ValueError):
+            list(iter_items(io.StringIO(data)))
+
+    def test_truncated_document(self):
+        data = self.data[:len(self.data) // 2]
+        with self.assertRaises(ValueError):
+            list(iter_items(io.StringIO(data)))
+        reader = CollectionReader(io.StringIO(data))
+        with self.assertRaises(ValueError):
+            reader.collection
+
+
+class JSONCodecTestCase(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.default = get_codec()
+
+        def loads(data):
+            self.calls.append('loads')
+            return json.loads(data)
+
+        def dumps(obj):
+            self.calls.append('dumps')
+            return json.dumps(obj, separators=(',', ':'))
+
+        self.codec = JSONCodec('test', loads, dumps)
+        register_codec(self.codec)
+        self.data = json.dumps({
+            'collection': {'href': 'href', 'items': [{'href': 'href'}]}})
+
+    def tearDown(self):
+        set_default_codec(self.default.name)
+        del collection_json._codecs['test']
+
+    def test_default_codec(self):
+        self.assertEqual(get_codec().name, 'json')
+        self.assertIn('json', available_codecs())
+
+    def test_get_codec(self):
+        self.assertIs(get_codec('test'), self.codec)
+        self.assertIs(get_codec(self.codec), self.codec)
+
+    def test_get_codec_unknown(self):
+        with self.assertRaises(ValueError):
+            get_codec('unknown')
+
+    def test_from_json_codec(self):
+        collection = Collection.from_json(self.data, codec='test')
+        self.assertEqual(collection, Collection.from_json(self.data))
+        self.assertEqual(self.calls, ['loads'])
+
+    def test_from_json_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            Collection.from_json(self.data, codec='unknown')
+
+    def test_from_json_bytes(self):
+        collection = Collection.from_json(self.data.encode('utf-8'))
+        self.assertEqual(collection, Collection.from_json(self.data))
+
+    def test_from_json_bytes_encodings(self):
+        data = json.dumps({'collection': {'href': '\u00e9\U0001f600'}},
+                          ensure_ascii=False)
+        for encoding in ('utf-8', 'utf-8-sig', 'utf-16', 'utf-16-le',
+                         'utf-16-be', 'utf-32', 'utf-32-le', 'utf-32-be'):
+            collection = Collection.from_json(data.encode(encoding))
+            self.assertEqual(collection.href, '\u00e9\U0001f600', encoding)
+        self.assertEqual(Template.from_json(bytearray(
+            b'{"template": {"data": [{"name": "name"}]}}')),
+            Template([Data('name')]))
+
+    def test_from_json_bytes_decoded_as_str(self):
+        # json.loads only takes str before Python 3.6
+        loads = json.loads
+
+        def loads_str(data):
+            if isinstance(data, bytes):
+                raise TypeError('Expected str, got bytes')
+            return loads(data)
+        json.loads = loads_str
+        try:
+            collection = Collection.from_json(self.data.encode('utf-16'))
+        finally:
+            json.loads = loads
+        self.assertEqual(collection, Collection.from_json(self.data))
+
+    def test_from_json_bytes_invalid(self):
+        with self.assertRaises(ValueError):
+            Collection.from_json(b'{"collection": {"href": "\xff"}}')
+
+    def test_template_from_json_codec(self):
+        data = json.dumps({'template': {'data': [{'name': 'name'}]}})
+        template = Template.from_json(data, codec='test')
+        self.assertEqual(template, Template([Data('name')]))
+        self.assertEqual(self.calls, ['loads'])
+
+    def test_to_json_codec(self):
+        collection = Collection('href')
+        self.assertEqual(
+            comparable_json(collection.to_json(codec='test')),
+            comparable_json('{"collection":{"version":"1.0","href":"href"}}'))
+        self.assertEqual(self.calls, ['dumps'])
+
+    def test_to_json_bytes(self):
+        collection = Collection('\u00e9')
+        self.assertEqual(collection.to_json_bytes(),
+                         str(collection).encode('utf-8'))
+        self.assertEqual(collection.to_json_bytes(codec='test'),
+                         collection.to_json(codec='test').encode('utf-8'))
+
+    def test_set_default_codec(self):
+        set_default_codec('test')
+        collection = Collection.from_json(self.data)
+        str(collection)
+        self.assertEqual(self.calls, ['loads', 'dumps'])
+
+    def test_set_default_codec_fallback(self):
+        codec = set_default_codec('unknown', 'test', 'json')
+        self.assertIs(codec, self.codec)
+        self.assertIs(get_codec(), self.codec)
+
+    def test_set_default_codec_unavailable(self):
+        with self.assertRaises(ValueError):
+            set_default_codec('unknown')
+        self.assertIs(get_codec(), self.default)
+
+    @skipUnless('orjson' in available_codecs(), 'orjson is not installed')
+    def test_orjson_codec(self):
+        collection = Collection.from_json(self.data.encode('utf-8'),
+                                          codec='orjson')
+        self.assertEqual(collection, Collection.from_json(self.data))
+        self.assertEqual(
+            json.loads(collection.to_json_bytes(codec='orjson')),
+            collection.to_dict())
+
+
+class SlotsTestCase(TestCase):
+
+    def test_no_instance_dict(self):
+        objects = [Data('name'), Link('href', 'rel'), Error(),
+                   Query('href', 'rel'), Item(), Array(Data, 'data', [])]
+        for obj in objects:
+            self.assertFalse(hasattr(obj, '__dict__'), obj)
+
+    def test_no_extra_attributes(self):
+        data = Data('name')
+        with self.assertRaises(AttributeError):
+            data.extra = 'value'
+
+    def test_attribute_lookup_with_underscore(self):
+        data = Data('_id', 7)
+        item = Item(data=[data, Data('__private', 8)])
+        self.assertIs(item._id, data)
+        self.assertIs(item.data._id, data)
+        self.assertIs(Template([data])._id, data)
+        # special method names aren't looked up in the data
+        with self.assertRaises(AttributeError):
+            getattr(item, '__private')
+
+    def test_unset_slots_not_looked_up(self):
+        item = Item.__new__(Item)
+        with self.assertRaises(AttributeError):
+            item._values
+        with self.assertRaises(AttributeError):
+            item._id
+        with self.assertRaises(AttributeError):
+            item.data
+
+
+class LazyCollectionTestCase(TestCase):
+
+    def setUp(self):
+        self.document = {
+            'collection': {
+                'version': '1.0',
+                'href': 'http://example.org',
+                'links': [{'href': 'href', 'rel': 'rel'}],
+                'items': [
+                    {
+                        'href': 'href%d' % i,
+                        'data': [{'name': 'name', 'value': 'value %d' % i}],
+                        'links': [{'href': 'href', 'rel': 'rel'}],
+                    } for i in range(3)
+                ],
+                'queries': [{'href': 'href', 'rel': 'search',
+                             'data': [{'name': 'q'}]}],
+                'template': {'data': [{'name': 'name'}]},
+                'error': {'code': 'code', 'message': 'message'},
+            }
+        }
+        self.data = json.dumps(self.document)
+        self.collection = Collection.from_json(self.data, lazy=True)
+        self.source = self.collection.to_dict(cache=True)
+
+    def test_equal_to_parsed(self):
+        self.assertEqual(self.collection, Collection.from_json(self.data))
+        self.assertEqual(self.source, self.document)
+
+    def test_properties_built_on_access(self):
+        item = self.collection.items[0]
+        with self.assertRaises(AttributeError):
+            object.__getattribute__(item, '_data')
+        self.assertEqual(item.name.value, 'value 0')
+        self.assertIs(item.data.to_dict(cache=True)['data'],
+                      self.source['collection']['items'][0]['data'])
+
+    def test_untouched_to_dict_returns_source(self):
+        items = self.collection.items
+        self.assertEqual(items.find(name=None, href='href1'), [items[1]])
+        self.assertIs(self.collection.to_dict(cache=True)['collection'],
+                      self.source['collection'])
+        self.assertIs(items[1].to_dict(cache=True),
+                      self.source['collection']['items'][1])
+
+    def test_untouched_to_dict_copies_source(self):
+        output = self.collection.to_dict()
+        self.assertEqual(output, self.document)
+        output['collection']['items'][0]['data'][0]['value'] = 'changed'
+        output['collection']['links'].append({})
+        self.assertEqual(self.collection.to_dict(), self.document)
+        self.assertEqual(self.collection.items[0].name.value, 'value 0')
+
+    def test_unknown_members_preserved(self):
+        self.document['collection']['extension'] = {'key': 'value'}
+        self.document['collection']['items'][0]['extension'] = 1
+        data = json.dumps(self.document)
+        collection = Collection.from_json(data, lazy=True)
+        self.assertEqual(collection.to_dict(), self.document)
+        self.assertEqual(
+            comparable_json(''.join(collection.iter_json_chunks(10))),
+            comparable_json(data))
+
+    def test_change_rebuilds_path_to_root(self):
+        items = self.source['collection']['items']
+        self.collection.items[0].data[0].value = 'changed'
+        output = self.collection.to_dict(cache=True)['collection']
+        self.assertIsNot(output, self.source['collection'])
+        self.assertEqual(output['items'][0]['data'],
+                         [{'name': 'name', 'value': 'changed'}])
+        self.assertIs(output['items'][0]['links'], items[0]['links'])
+        self.assertIs(output['items'][1], items[1])
+        self.assertIs(output['links'], self.source['collection']['links'])
+        self.assertEqual(self.collection.items[0].name.value, 'changed')
+
+    def test_change_collection_attribute(self):
+        self.collection.href = 'http://example.org/other'
+        output = self.collection.to_dict(cache=True)['collection']
+        self.assertEqual(output['href'], 'http://example.org/other')
+        self.assertIs(output['items'], self.source['collection']['items'])
+        self.assertEqual(output['error'], self.document['collection']['error'])
+
+    def test_change_array(self):
+        self.collection.items.append(Item(href='new'))
+        del self.collection.links[0]
+        output = self.collection.to_dict()['collection']
+        self.assertEqual(output['items'][-1], {'href': 'new'})
+        self.assertNotIn('links', output)
+        self.assertEqual(
+            json.loads(''.join(self.collection.iter_json_chunks())),
+            self.collection.to_dict())
+
+    def test_change_typed_properties(self):
+        self.collection.error.code = 'other'
+        self.assertEqual(self.collection.to_dict()['collection']['error'],
+                         {'code': 'other', 'message': 'message'})
+        collection = Collection.from_json(self.data, lazy=True)
+        collection.template.data[0].value = 'value'
+        self.assertEqual(collection.to_dict()['collection']['template'],
+                         {'data': [{'name': 'name', 'value': 'value'}]})
+
+    def test_replace_property(self):
+        item = self.collection.items[2]
+        item.links = []
+        output = self.collection.to_dict()['collection']['items'][2]
+        self.assertEqual(output, {
+            'href': 'href2',
+            'data': [{'name': 'name', 'value': 'value 2'}],
+        })
+
+    def test_invalid_nested_value(self):
+        self.document['collection']['items'][0]['data'] = [1]
+        collection = Collection.from_json(json.dumps(self.document),
+                                          lazy=True)
+        with self.assertRaises(ValueError):
+            collection.items[0].data
+
+    def test_pickle(self):
+        copied = pickle.loads(pickle.dumps(self.collection))
+        self.assertEqual(copied, self.collection)
+
+
+class CachedSerializationTestCase(TestCase):
+
+    def setUp(self):
+        self.collection = Collection(
+            href='http://example.org',
+            links=[Link('href', 'rel')],
+            items=[Item(href='href%d' % i,
+                        data=[Data('name', value='value %d' % i)],
+                        links=[Link('href', 'rel')])
+                   for i in range(3)],
+            queries=[Query('href', 'search', data=[Data('q')])],
+            template=Template(data=[Data('name')]),
+            error=Error(code='code', message='message'))
+
+    def assertSerialized(self, collection):
+        expected = comparable_json(json.dumps(collection.to_dict()))
+        self.assertEqual(comparable_json(collection.to_json(cache=True)),
+                         expected)
+        self.assertEqual(comparable_json(collection.to_json()), expected)
+        self.assertEqual(
+            comparable_json(''.join(collection.iter_json_chunks(7))),
+            expected)
+        self.assertEqual(comparable_json(collection.to_json_bytes()),
+                         comparable_json(json.dumps(
+                             collection.to_dict()).encode('utf-8')))
+
+    def test_not_kept_by_default(self):
+        self.collection.to_json()
+        self.assertIsNot(self.collection.to_dict(),
+                         self.collection.to_dict())
+        self.assertIsNone(kept(self.collection.items[0], 'json'))
+
+    def test_dict_kept(self):
+        output = self.collection.to_dict(cache=True)
+        self.assertEqual(output, Collection.from_json(
+            self.collection.to_json()).to_dict())
+        self.assertIs(self.collection.to_dict(cache=True)['collection'],
+                      output['collection'])
+        self.assertIs(self.collection.items[1].to_dict(cache=True),
+                      output['collection']['items'][1])
+
+    def test_dict_kept_copied(self):
+        output = self.collection.to_dict(cache=True)
+        copied = self.collection.to_dict()
+        self.assertEqual(copied, output)
+        self.assertIsNot(copied['collection'], output['collection'])
+        copied['collection']['items'][0]['data'][0]['value'] = 'changed'
+        self.assertEqual(self.collection.to_dict(), output)
+        self.assertEqual(self.collection.items[0].name.value, 'value 0')
+
+    def test_empty_array_kept(self):
+        collection = Collection('http://example.org', items=[
+            Item('href', data=[]), Item('other')])
+        self.assertEqual(collection.to_dict(cache=True)['collection'],
+                         {'version': '1.0', 'href': 'http://example.org',
+                          'items': [{'href': 'href'}, {'href': 'other'}]})
+        self.assertEqual(kept(collection.items[0].data, 'dict'), [])
+        collection.items[0].data.append(Data('name', value='value'))
+        collection.links.append(Link('href', 'rel'))
+        collection.items[1].links.append(Link('href', 'rel'))
+        self.assertSerialized(collection)
+        output = collection.to_dict(cache=True)['collection']
+        self.assertEqual(output['items'][0]['data'],
+                         [{'name': 'name', 'value': 'value'}])
+        self.assertEqual(output['items'][1]['links'],
+                         [{'href': 'href', 'rel': 'rel'}])
+        self.assertEqual(output['links'], [{'href': 'href', 'rel': 'rel'}])
+
+    def test_change_below_uncached_object(self):
+        collection = Collection.from_json(self.collection.to_json(),
+                                          compact=True)
+        collection.to_json(cache=True)
+        # the data of a packed item are built after its dictionary was
+        # kept, and hold nothing kept themselves
+        collection.items[1].data[0].value = 'changed'
+        self.assertEqual(collection.to_dict(cache=True)['collection']
+                         ['items'][1]['data'],
+                         [{'name': 'name', 'value': 'changed'}])
+        self.assertSerialized(collection)
+
+    def test_text_kept(self):
+        text = self.collection.to_json(cache=True)
+        self.assertIs(self.collection.to_json(), text)
+        expected = json.dumps(self.collection.to_dict())
+        self.assertEqual(comparable_json(text), comparable_json(expected))
+        self.assertIsNotNone(kept(self.collection.items[2], 'json'))
+
+    def test_change_invalidates_path_to_root(self):
+        self.collection.to_json(cache=True)
+        output = self.collection.to_dict(cache=True)['collection']
+        items = self.collection.items
+        first, second = kept(items[0], 'json'), kept(items[1], 'json')
+        items[0].data[0].value = 'changed'
+        self.assertIsNone(kept(items[0], 'json'))
+        self.assertIsNone(kept(items, 'json'))
+        self.assertIsNone(kept(self.collection, 'json'))
+        self.assertIs(kept(items[1], 'json'), second)
+        self.assertIsNotNone(kept(self.collection.links, 'json'))
+        self.assertSerialized(self.collection)
+        self.assertIsNot(kept(items[0], 'json'), first)
+        self.assertIs(
+            self.collection.to_dict(cache=True)['collection']['items'][1],
+            output['items'][1])
+        self.assertEqual(json.loads(self.collection.to_json())['collection']
+                         ['items'][0]['data'][0]['value'], 'changed')
+
+    def test_change_array(self):
+        self.collection.to_json(cache=True)
+        self.collection.items.append(Item(href='new'))
+        del self.collection.links[0]
+        self.assertSerialized(self.collection)
+        self.collection.items[3].href = 'other'
+        self.assertSerialized(self.collection)
+        self.assertEqual(self.collection.to_dict()['collection']['items'][3],
+                         {'href': 'other'})
+
+    def test_change_typed_properties(self):
+        self.collection.to_json(cache=True)
+        self.collection.error.code = 'other'
+        self.assertSerialized(self.collection)
+        self.collection.template.data[0].value = 'value'
+        self.assertSerialized(self.collection)
+        self.collection.template = Template(data=[Data('other')])
+        self.assertSerialized(self.collection)
+        self.assertEqual(
+            self.collection.to_dict()['collection']['template'],
+            {'data': [{'name': 'other'}]})
+
+    def test_replace_property(self):
+        self.collection.to_json(cache=True)
+        self.collection.items[2].links = []
+        self.assertSerialized(self.collection)
+        self.assertNotIn('links',
+                         self.collection.to_dict()['collection']['items'][2])
+
+    def test_lazy_view(self):
+        data = self.collection.to_json()
+        collection = Collection.from_json(data, lazy=True)
+        self.assertEqual(comparable_json(collection.to_json(cache=True)),
+                         comparable_json(data))
+        collection.items[1].data[0].value = 'changed'
+        self.assertSerialized(collection)
+        self.assertEqual(collection.items[1].name.value, 'changed')
+
+    def test_codec(self):
+        codec = JSONCodec('sorted', json.loads,
+                          lambda obj: json.dumps(obj, sort_keys=True))
+        text = self.collection.to_json(codec=codec, cache=True)
+        self.assertEqual(text, json.dumps(self.collection.to_dict(),
+                                          sort_keys=True))
+        self.assertEqual(self.collection.to_json(codec=codec), text)
+
+
+class CollectionDiffTestCase(TestCase):
+
+    def setUp(self):
+        self.old = Collection(href='http://example.org', items=[
+            Item(href='href%d' % i,
+                 data=[Data('id', value=i), Data('name', value='value')],
+                 links=[Link('href', 'rel')])
+            for i in range(4)])
+        self.new = copy.deepcopy(self.old)
+
+    def assertApplies(self, delta):
+        replica = copy.deepcopy(self.old)
+        apply_diff(replica, delta)
+        self.assertEqual(sorted(item.to_dict()['href']
+                                for item in replica.items),
+                         sorted(item.href for item in self.new.items))
+        by_href = dict((item.href, item) for item in replica.items)
+        for item in self.new.items:
+            self.assertEqual(sorted(by_href[item.href].data.to_dict()['data'],
+                                    key=repr),
+                             sorted(item.data.to_dict()['data'], key=repr))
+            self.assertEqual(
+                sorted(link.href for link in by_href[item.href].links),
+                sorted(link.href for link in item.links))
+        return replica
+
+    def test_no_changes(self):
+        delta = diff(self.old, self.new)
+        self.assertFalse(delta)
+        self.assertEqual((delta.added, delta.removed, delta.changed),
+                         ([], [], []))
+
+    def test_added_and_removed(self):
+        del self.new.items[1]
+        self.new.items.append(Item(href='new', data=[Data('id', value=9)]))
+        delta = diff(self.old, self.new)
+        self.assertEqual(delta.removed, ['href1'])
+        self.assertEqual(delta.added, [self.new.items[-1]])
+        self.assertEqual(delta.changed, [])
+        replica = self.assertApplies(delta)
+        self.assertIsNot(replica.items[-1], self.new.items[-1])
+
+    def test_data_changes(self):
+        item = self.new.items[2]
+        item.data[1].value = 'changed'
+        item.data.append(Data('extra', value=1))
+        del item.data[0]
+        delta = diff(self.old, self.new)
+        changes, = delta.changed
+        self.assertEqual(changes.key, 'href2')
+        self.assertIsNone(changes.href)
+        self.assertEqual(changes.data, [
+            (self.old.items[2].data[0], None),
+            (self.old.items[2].data[1], item.data[0]),
+            (None, item.data[1]),
+        ])
+        self.assertEqual(changes.added_links, [])
+        self.assertApplies(delta)
+
+    def test_link_changes(self):
+        links = self.new.items[0].links
+        links.append(Link('other', 'rel'))
+        links[0].rel = 'changed'
+        delta = diff(self.old, self.new)
+        changes, = delta.changed
+        self.assertEqual(changes.data, [])
+        self.assertEqual(changes.removed_links, [Link('href', 'rel')])
+        self.assertEqual(changes.added_links,
+                         [Link('href', 'changed'), Link('other', 'rel')])
+        self.assertApplies(delta)
+
+    def test_order_ignored(self):
+        self.new.items.reverse()
+        self.new.items[0].data.reverse()
+        self.assertFalse(diff(self.old, self.new))
+
+    def test_data_key(self):
+        self.new.items[3].href = 'moved'
+        delta = diff(self.old, self.new, key='id')
+        self.assertEqual(delta.key, 'id')
+        changes, = delta.changed
+        self.assertEqual(changes.key, 3)
+        self.assertEqual(changes.href, ('href3', 'moved'))
+        self.assertApplies(delta)
+        delta = diff(self.old, self.new)
+        self.assertEqual(delta.removed, ['href3'])
+        self.assertEqual(len(delta.added), 1)
+
+    def test_lazy(self):
+        self.new.items[1].data[1].value = 'changed'
+        old = Collection.from_json(self.old.to_json(), lazy=True)
+        new = Collection.from_json(self.new.to_json(), lazy=True)
+        delta = diff(old, new, key='id')
+        self.assertEqual([changes.key for changes in delta.changed], [1])
+        self.assertIsNotNone(kept(old.items[0], 'source'))
+        with self.assertRaises(AttributeError):
+            object.__getattribute__(old.items[0], '_data')
+        self.assertApplies(delta)
+
+    def test_invalid_keys(self):
+        self.new.items.append(Item(href='href0'))
+        with self.assertRaises(ValueError):
+            diff(self.old, self.new)
+        with self.assertRaises(ValueError):
+            diff(self.old, Collection('href', items=[Item()]))
+        with self.assertRaises(ValueError):
+            diff(self.old, self.old, key='missing')
+
+    def test_apply_mismatch(self):
+        self.new.items[0].data[1].value = 'changed'
+        del self.new.items[3]
+        delta = diff(self.old, self.new)
+        replica = copy.deepcopy(self.old)
+        replica.items[0].data[1].value = 'other'
+        with self.assertRaises(ValueError):
+            apply_diff(replica, delta)
+        self.assertEqual(len(replica.items), 4)
+        del replica.items[3]
+        delta.changed = []
+        with self.assertRaises(ValueError):
+            apply_diff(replica, delta)
+
+    def test_dict_round_trip(self):
+        self.new.items[0].href = 'moved'
+        self.new.items[1].data[0].value = 'changed'
+        self.new.items[2].links = []
+        data = json.loads(json.dumps(
+            diff(self.old, self.new, 'id').to_dict()))
+        delta = CollectionDiff.from_dict(data)
+        self.assertEqual(delta.to_dict(), data)
+        self.assertApplies(delta)
+
+
+class FingerprintTestCase(TestCase):
+
+    def setUp(self):
+        self.document = {
+            'collection': {
+                'version': '1.0',
+                'href': 'http://example.org',
+                'items': [
+                    {
+                        'href': 'href%d' % i,
+                        'data': [{'name': 'name', 'value': i}],
+                        'links': [{'href': 'href', 'rel': 'rel'}],
+                    } for i in range(3)
+                ],
+                'template': {'data': [{'name': 'name'}]},
+                'error': {'code': 'code'},
+            }
+        }
+        self.collection = Collection.from_json(json.dumps(self.document))
+
+    def test_equal_objects(self):
+        other = Collection.from_json(json.dumps(self.document))
+        self.assertEqual(fingerprint(self.collection), fingerprint(other))
+        self.assertEqual(len(fingerprint(self.collection)), 40)
+        for first, second in zip(self.collection.items, other.items):
+            self.assertEqual(fingerprint(first), fingerprint(second))
+            self.assertEqual(fingerprint(first.data), fingerprint(second.data))
+            self.assertEqual(fingerprint(first.links[0]),
+                             fingerprint(second.links[0]))
+        self.assertEqual(self.collection, other)
+
+    def test_data_named_fingerprint(self):
+        data = Data('fingerprint', 'value')
+        item = Item('href', data=[data])
+        self.assertIs(item.fingerprint, data)
+        self.assertIs(Template([data]).fingerprint, data)
+        self.assertEqual(len(fingerprint(item)), 40)
+
+    def test_different_objects(self):
+        fingerprints = set([
+            fingerprint(Data('name')),
+            fingerprint(Data('name', value='')),
+            fingerprint(Data('name', value='None')),
+            fingerprint(Data('name', value=[1])),
+            fingerprint(Data('name', value=(1,))),
+            fingerprint(Data('name', prompt='')),
+            fingerprint(Link('name', 'rel')),
+            fingerprint(Item(href='name')),
+            fingerprint(Array(Data, 'data', [])),
+            fingerprint(Array(Link, 'data', [])),
+            fingerprint(Array(Data, 'other', [])),
+        ])
+        self.assertEqual(len(fingerprints), 11)
+
+    def test_equal_values(self):
+        self.assertEqual(fingerprint(Data('name', value=1)),
+                         fingerprint(Data('name', value=1.0)))
+        self.assertEqual(fingerprint(Data('name', value=True)),
+                         fingerprint(Data('name', value=1)))
+        self.assertEqual(fingerprint(Data('name', value={'a': 1, 'b': [2]})),
+                         fingerprint(Data('name', value={'b': [2.0], 'a': 1})))
+        self.assertNotEqual(fingerprint(Data('name', value=1.5)),
+                            fingerprint(Data('name', value=1)))
+
+    def test_stable(self):
+        # the same in every process, unlike hash()
+        self.assertEqual(fingerprint(Data('name', value=1)),
+                         hashlib.sha1(b'Data\0"name"\x001\0null').hexdigest())
+
+    def test_lazy_view(self):
+        self.document['collection']['extension'] = 1
+        collection = Collection.from_json(json.dumps(self.document),
+                                          lazy=True)
+        self.assertEqual(fingerprint(collection), fingerprint(self.collection))
+
+    def test_change_invalidates_path_to_root(self):
+        digest = fingerprint(self.collection)
+        items = self.collection.items
+        sibling = fingerprint(items[1])
+        items[0].data[0].value = 'changed'
+        self.assertIsNone(kept(items, 'digest'))
+        self.assertIsNone(kept(self.collection, 'digest'))
+        self.assertEqual(kept(items[1], 'digest'), sibling)
+        self.assertNotEqual(fingerprint(self.collection), digest)
+        items[0].data[0].value = 0
+        self.assertEqual(fingerprint(self.collection), digest)
+
+    def test_change_array_and_typed_properties(self):
+        digest = fingerprint(self.collection)
+        self.collection.items.append(Item(href='new'))
+        self.assertNotEqual(fingerprint(self.collection), digest)
+        self.collection.items.pop()
+        self.assertEqual(fingerprint(self.collection), digest)
+        self.collection.error.code = 'other'
+        self.assertNotEqual(fingerprint(self.collection), digest)
+        self.collection.error = Error(code='code')
+        self.assertEqual(fingerprint(self.collection), digest)
+        self.collection.template.data[0].value = 'value'
+        self.assertNotEqual(fingerprint(self.collection), digest)
+
+    def test_equality_uses_fingerprints(self):
+        other = Collection.from_json(json.dumps(self.document))
+        fingerprint(self.collection)
+        fingerprint(other)
+        self.assertEqual(self.collection, other)
+        other.items[2].links[0].rel = 'other'
+        self.assertIsNone(kept(other, 'digest'))
+        self.assertNotEqual(self.collection, other)
+        fingerprint(other)
+        self.assertNotEqual(self.collection, other)
+        self.assertNotEqual(self.collection.items, other.items)
+        self.assertEqual(self.collection.items[:2], other.items[:2])
+
+    def test_equal_fingerprints_compare_fields(self):
+        data = Data('name', value=1)
+        other = Data('name', value=2)
+        # a fingerprint only tells unequal objects apart
+        other._track().digest = fingerprint(data)
+        self.assertNotEqual(data, other)
+        items = self.collection.items
+        items[1]._track().digest = fingerprint(items[0])
+        self.assertNotEqual(items[0], items[1])
+
+    def test_unhashable(self):
+        items = list(self.collection.items)
+        for obj in [items[0], items[0].data, items[0].data[0],
+                    self.collection]:
+            with self.assertRaises(TypeError):
+                hash(obj)
+        copies = [Item(**item.to_dict()) for item in items]
+        self.assertEqual(
+            len(set(fingerprint(item) for item in items + copies)), 3)
+        self.assertIn(fingerprint(copies[1]),
+                      dict((fingerprint(item), None) for item in items))
+
+
+class CompactCollectionTestCase(TestCase):
+
+    def setUp(self):
+        self.document = {
+            'collection': {
+                'version': '1.0',
+                'href': 'http://example.org',
+                'items': [
+                    {
+                        'href': 'href%d' % i,
+                        'data': [{'name': 'id', 'value': i},
+                                 {'name': 'title', 'prompt': 'Title',
+                                  'value': 'title %d' % i}],
+                        'links': [{'href': 'href', 'rel': 'rel'}],
+                    } for i in range(3)
+                ] + [{'href': 'other', 'data': [{'name': 'id'}]}],
+                'template': {'data': [{'name': 'id'}]},
+            }
+        }
+        self.data = json.dumps(self.document)
+        self.collection = Collection.from_json(self.data, compact=True)
+
+    def test_equal_to_parsed(self):
+        self.assertEqual(self.collection.to_dict(), self.document)
+        self.assertEqual(self.collection, Collection.from_json(self.data))
+        self.assertEqual(self.collection.to_json(),
+                         Collection.from_json(self.data).to_json())
+
+    def test_shared_schema_and_strings(self):
+        items = self.collection.items
+        self.assertIs(items[0]._values[0], items[2]._values[0])
+        self.assertIsNot(items[0]._values[0], items[3]._values[0])
+        self.assertEqual(items[1]._values[1], (1, 'title 1'))
+        self.assertIs(items[0].links[0].rel, items[1].links[0].rel)
+        self.assertIs(items[0].data[1].prompt, items[2].data[1].prompt)
+
+    def test_data_built_on_access(self):
+        item = self.collection.items[1]
+        with self.assertRaises(AttributeError):
+            object.__getattribute__(item, '_data')
+        item._track()
+        self.assertEqual(item.title.value, 'title 1')
+        self.assertIsNone(item._values)
+        self.assertIs(item.data[0]._meta.parent(), item.data)
+        self.assertEqual(item.to_dict(), self.document['collection']
+                         ['items'][1])
+
+    def test_change(self):
+        items = self.collection.items
+        items[0].data[0].value = 'changed'
+        items[1].href = 'changed'
+        items[2].data = [Data('name')]
+        output = self.collection.to_dict()['collection']['items']
+        self.assertEqual(output[0]['data'][0], {'name': 'id',
+                                                'value': 'changed'})
+        self.assertEqual(output[1]['href'], 'changed')
+        self.assertEqual(output[1]['data'],
+                         self.document['collection']['items'][1]['data'])
+        self.assertEqual(output[2]['data'], [{'name': 'name'}])
+
+    def test_to_columns_and_diff(self):
+        columns = self.collection.items.to_columns()
+        self.assertEqual(list(columns['id']), [0, 1, 2, None])
+        self.assertEqual(list(columns['title'])[:3],
+                         ['title 0', 'title 1', 'title 2'])
+        other = Collection.from_json(self.data, compact=True)
+        other.items[2].data[1].value = 'changed'
+        delta = diff(self.collection, other)
+        self.assertEqual([changes.key for changes in delta.changed],
+                         ['href2'])
+        self.assertIsNotNone(self.collection.items[0]._values)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Collection.from_json(self.data, lazy=True, compact=True)
+        self.document['collection']['items'][0]['data'].append(1)
+        with self.assertRaises(ValueError):
+            Collection.from_json(json.dumps(self.document), compact=True)
+        self.document['collection']['items'][0]['data'][-1] = {'other': 1}
+        with self.assertRaises(TypeError):
+            Collection.from_json(json.dumps(self.document), compact=True)
+
+    def test_from_rows(self):
+        columns = ['id', 'title']
+        rows = [(1, 'first'), (2, None)]
+        collection = Collection.from_rows('href', columns, rows,
+                                          item_href='href/{id}', compact=True)
+        items = collection.items
+        self.assertIs(items[0]._values[0], items[1]._values[0])
+        self.assertEqual(items[1].to_dict(), {
+            'href': 'href/2',
+            'data': [{'name': 'id', 'value': 2}, {'name': 'title'}],
+        })
+        self.assertEqual(collection,
+                         Collection.from_rows('href', columns, rows,
+                                              item_href='href/{id}'))
+
+    def test_pickle(self):
+        copied = pickle.loads(pickle.dumps(self.collection))
+        self.assertEqual(copied, self.collection)
+
+
+class FromFileTestCase(TestCase):
+
+    def setUp(self):
+        self.document = {
+            'collection': {
+                'version': '1.0',
+                'href': 'http://example.org',
+                'links': [{'href': 'next', 'rel': 'next'}],
+                'items': [
+                    {
+                        'href': 'href%d' % i,
+                        'data': [{'name': 'name',
+                                  'value': 'value \xe9 %d' % i}],
+                    } for i in range(20)
+                ],
+                'template': {'data': [{'name': 'name'}]},
+            }
+        }
+        self.data = json.dumps(self.document)
+        self.path = self.write(self.data.encode('utf-8'))
+
+    def write(self, data):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'wb') as fileobj:
+            fileobj.write(data)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_from_file(self):
+        collection = Collection.from_file(self.path, chunk_size=7)
+        self.assertEqual(collection, Collection.from_json(self.data))
+        self.assertEqual(collection.to_dict(), self.document)
+
+    def test_encodings(self):
+        expected = Collection.from_json(self.data)
+        for encoding in ('utf-8-sig', 'utf-16', 'utf-16-le', 'utf-32-be'):
+            path = self.write(self.data.encode(encoding))
+            for chunk_size in (1, 7, 65536):
+                self.assertEqual(
+                    Collection.from_file(path, chunk_size=chunk_size),
+                    expected, encoding)
+            with open(path, 'rb') as fileobj:
+                self.assertEqual(list(iter_items(fileobj, chunk_size=3)),
+                                 list(expected.items), encoding)
+
+    def test_lazy_and_compact(self):
+        lazy = Collection.from_file(self.path, lazy=True)
+        self.assertEqual(lazy.to_dict(), self.document)
+        self.assertIsNotNone(kept(lazy.items[0], 'source'))
+        compact = Collection.from_file(self.path, compact=True)
+        self.assertIsNotNone(compact.items[0]._values)
+        self.assertEqual(compact.to_dict(), self.document)
+        with self.assertRaises(ValueError):
+            Collection.from_file(self.path, lazy=True, compact=True)
+
+    def test_stream(self):
+        reader = Collection.from_file(self.path, stream=True, chunk_size=16)
+        self.assertIsInstance(reader, CollectionReader)
+        self.assertEqual(reader.href, 'http://example.org')
+        items = list(reader)
+        self.assertEqual(len(items), 20)
+        self.assertEqual(items[3].name.value, 'value \xe9 3')
+        self.assertEqual(reader.template, Template(data=[Data('name')]))
+
+    def test_codecs(self):
+        received = []
+
+        def loads(data):
+            received.append(type(data))
+            return json.loads(bytes(data).decode('utf-8'))
+        buffers = JSONCodec('buffers', loads, json.dumps, buffers=True)
+        copies = JSONCodec('copies', loads, json.dumps)
+        expected = Collection.from_json(self.data)
+        self.assertEqual(Collection.from_file(self.path, codec=buffers),
+                         expected)
+        self.assertEqual(Collection.from_file(self.path, codec=copies,
+                                              lazy=True), expected)
+        try:
+            memoryview(mmap.mmap(-1, 1))
+        except TypeError:
+            # Python 2 maps are copied
+            self.assertEqual(received, [bytes, bytes])
+        else:
+            self.assertEqual(received, [memoryview, bytes])
+
+    def test_invalid(self):
+        for data in (b'', b'{}', b'[1]', b'{"collection": 1}',
+                     b'{"collection": {"href": "href"}} x'):
+            with self.assertRaises(ValueError):
+                Collection.from_file(self.write(data))
+
+    def test_strict(self):
+        expected = Collection.from_json(self.data)
+        for kwargs in ({}, {'lazy': True}, {'compact': True}):
+            self.assertEqual(
+                Collection.from_file(self.path, strict=True, **kwargs),
+                expected)
+        self.document['collection']['items'][5]['data'][0]['value'] = []
+        path = self.write(json.dumps(self.document).encode('utf-8'))
+        for kwargs in ({}, {'lazy': True}, {'compact': True}):
+            with self.assertRaises(ValidationError) as context:
+                Collection.from_file(path, strict=True, **kwargs)
+            self.assertEqual(context.exception.errors, [
+                ('$.collection.items[5].data[0].value',
+                 'must be a string, number, boolean or null')])
+
+
+class StrictParsingTestCase(TestCase):
+
+    def setUp(self):
+        self.document = {
+            'collection': {
+                'version': '1.0',
+                'href': 'http://example.org',
+                'links': [{'href': 'next', 'rel': 'next', 'render': 'link'}],
+                'items': [
+                    {
+                        'href': 'item%d' % i,
+                        'data': [{'name': 'name', 'value': i,
+                                  'prompt': 'Name'},
+                                 {'name': 'flag', 'value': True},
+                                 {'name': 'empty'}],
+                        'links': [{'href': 'avatar', 'rel': 'avatar',
+                                   'render': 'image'}],
+                    } for i in range(3)
+                ],
+                'queries': [{'href': 'search', 'rel': 'search',
+                             'name': 'search', 'prompt': 'Search',
+                             'data': [{'name': 'q', 'value': ''}]}],
+                'template': {'data': [{'name': 'name', 'prompt': 'Name'}]},
+                'error': {'code': '500', 'message': 'Failed',
+                          'title': 'Error'},
+            }
+        }
+
+    def errors(self, **kwargs):
+        data = json.dumps(self.document)
+        with self.assertRaises(ValidationError) as context:
+            Collection.from_json(data, strict=True, **kwargs)
+        return context.exception.errors
+
+    def test_valid(self):
+        data = json.dumps(self.document)
+        expected = Collection.from_json(data)
+        for kwargs in ({}, {'lazy': True}, {'compact': True}):
+            collection = Collection.from_json(data, strict=True, **kwargs)
+            self.assertEqual(collection, expected)
+            self.assertEqual(collection.to_dict(), self.document)
+        self.assertIsNotNone(kept(
+            Collection.from_json(data, strict=True, lazy=True), 'source'))
+        self.assertIsNotNone(Collection.from_json(
+            data, strict=True, compact=True).items[0]._values)
+
+    def test_built_objects(self):
+        collection = Collection.from_json(json.dumps(self.document),
+                                          strict=True)
+        item = collection.items[1]
+        digest = fingerprint(collection)
+        self.assertEqual(item.name.value, 1)
+        item.name.value = 5
+        self.assertNotEqual(fingerprint(collection), digest)
+        self.assertEqual(collection.to_dict()['collection']['items'][1][
+            'data'][0]['value'], 5)
+
+    def test_minimal(self):
+        self.document = {'collection': {'href': 'http://example.org'}}
+        collection = Collection.from_json(json.dumps(self.document),
+                                          strict=True)
+        self.assertEqual(collection.version, '1.0')
+        self.assertEqual(collection, Collection('http://example.org'))
+
+    def test_errors(self):
+        collection = self.document['collection']
+        collection['extension'] = True
+        del collection['href']
+        del collection['links'][0]['rel']
+        collection['links'][0]['render'] = 'button'
+        item = collection['items'][1]
+        item['href'] = 5
+        item['data'][0]['value'] = {'nested': 1}
+        del item['data'][1]['name']
+        item['data'][2] = 'empty'
+        item['links'] = {'href': 'avatar'}
+        collection['queries'][0]['href'] = None
+        collection['template']['data'][0]['type'] = 'text'
+        collection['error']['code'] = 500
+        expected = [
+            ('$.collection.extension', 'is not a member of this object'),
+            ('$.collection.href', 'is required'),
+            ('$.collection.links[0].rel', 'is required'),
+            ('$.collection.links[0].render', "must be 'image' or 'link'"),
+            ('$.collection.items[1].href', 'must be a string'),
+            ('$.collection.items[1].data[0].value',
+             'must be a string, number, boolean or null'),
+            ('$.collection.items[1].data[1].name', 'is required'),
+            ('$.collection.items[1].data[2]', 'must be an object'),
+            ('$.collection.items[1].links', 'must be an array'),
+            ('$.collection.queries[0].href', 'is required'),
+            ('$.collection.template.data[0].type',
+             'is not a member of this object'),
+            ('$.collection.error.code', 'must be a string'),
+        ]
+        for kwargs in ({}, {'lazy': True}, {'compact': True}):
+            self.assertEqual(self.errors(**kwargs), expected)
+
+    def test_not_objects(self):
+        collection = self.document['collection']
+        collection['items'] = [1, None]
+        collection['template'] = []
+        collection['queries'] = 'search'
+        self.assertEqual(self.errors(), [
+            ('$.collection.items[0]', 'must be an object'),
+            ('$.collection.items[1]', 'must be an object'),
+            ('$.collection.queries', 'must be an array'),
+            ('$.collection.template', 'must be an object'),
+        ])
+
+    def test_top_level(self):
+        cases = [
+            ([], [('$', 'must be an object')]),
+            ('x', [('$', 'must be an object')]),
+            ({}, [('$.collection', 'is required')]),
+            ({'collection': []}, [('$.collection', 'must be an object')]),
+            ({'collection': {}}, [('$.collection.href', 'is required')]),
+        ]
+        for document, errors in cases:
+            for kwargs in ({}, {'lazy': True}, {'compact': True}):
+                with self.assertRaises(ValidationError) as context:
+                    Collection.from_json(json.dumps(document), strict=True,
+                                         **kwargs)
+                self.assertEqual(context.exception.errors, errors)
+            with self.assertRaises(ValueError) as context:
+                Collection.from_json(json.dumps(document))
+            self.assertNotIsInstance(context.exception, ValidationError)
+
+    def test_message(self):
+        self.document['collection']['items'] = [{'data': [{}]}] * 25
+        with self.assertRaises(ValidationError) as context:
+            Collection.from_json(json.dumps(self.document), strict=True)
+        self.assertEqual(len(context.exception.errors), 25)
+        message = str(context.exception)
+        self.assertIn('$.collection.items[0].data[0].name: is required',
+                      message)
+        self.assertIn('... and 5 more', message)
+        self.assertIsInstance(ValidationError([]), ValueError)
+
+    def test_not_strict(self):
+        self.document['collection']['extension'] = True
+        collection = Collection.from_json(json.dumps(self.document),
+                                          lazy=True)
+        self.assertEqual(collection.to_dict(), self.document)
+
+
+class NDJSONTestCase(TestCase):
+
+    def setUp(self):
+        self.collection = Collection('http://example.org', items=[
+            Item(href='href%d' % i,
+                 data=[Data('name', value='value \xe9\n%d' % i)],
+                 links=[Link('href', 'rel')])
+            for i in range(5)])
+        self.lines = [json.dumps(item.to_dict()) + '\n'
+                      for item in self.collection.items]
+
+    def test_iter_ndjson(self):
+        self.assertEqual(list(self.collection.items.iter_ndjson()),
+                         self.lines)
+        codec = JSONCodec('compact', json.loads, lambda obj: json.dumps(
+            obj, separators=(',', ':')))
+        lines = list(self.collection.items.iter_ndjson(codec=codec))
+        self.assertEqual([json.loads(line) for line in lines],
+                         [json.loads(line) for line in self.lines])
+        self.assertNotIn(': ', lines[0])
+
+    def test_data_named_ndjson_methods(self):
+        item = Item(data=[Data('iter_ndjson', 1), Data('write_ndjson', 2)])
+        self.assertEqual(item.iter_ndjson.value, 1)
+        self.assertEqual(item.write_ndjson.value, 2)
+        items = Array(Item, 'items', [item])
+        self.assertEqual([json.loads(line) for line in items.iter_ndjson()],
+                         [item.to_dict()])
+
+    def test_write_ndjson(self):
+        text = io.StringIO()
+        self.assertEqual(self.collection.items.write_ndjson(
+            text, chunk_size=100), 5)
+        self.assertEqual(text.getvalue(), ''.join(self.lines))
+        binary = io.BytesIO()
+        self.collection.items.write_ndjson(binary)
+        self.assertEqual(binary.getvalue(),
+                         ''.join(self.lines).encode('utf-8'))
+        self.assertEqual(Array(Item, 'items', []).write_ndjson(text), 0)
+
+    def test_from_ndjson(self):
+        source = io.BytesIO(''.join(self.lines).encode('utf-8') + b'\n')
+        collection = Collection.from_ndjson(source, href='http://example.org')
+        self.assertEqual(collection, self.collection)
+        collection = Collection.from_ndjson(
+            iter(self.lines), href='href', links=[Link('next', 'next')])
+        self.assertEqual(collection.links[0].rel, 'next')
+        self.assertEqual(collection.items, self.collection.items)
+
+    def test_lazy_and_compact(self):
+        lazy = Collection.from_ndjson(self.lines, lazy=True)
+        self.assertIsNotNone(kept(lazy.items[0], 'source'))
+        self.assertEqual(list(lazy.items.iter_ndjson()), self.lines)
+        compact = Collection.from_ndjson(self.lines, compact=True)
+        self.assertIsNotNone(compact.items[0]._values)
+        self.assertEqual(list(compact.items.iter_ndjson()), self.lines)
+        with self.assertRaises(ValueError):
+            Collection.from_ndjson(self.lines, lazy=True, compact=True)
+
+    def test_iter_ndjson_items(self):
+        items = list(iter_ndjson_items(io.StringIO(''.join(self.lines))))
+        self.assertEqual(items, list(self.collection.items))
+
+    def test_invalid(self):
+        for line in ('{"href": \n', '[1]\n'):
+            with self.assertRaises(ValueError) as context:
+                Collection.from_ndjson(self.lines[:2] + [line])
+            self.assertIn('Line 3', str(context.exception))
+
+    def test_invalid_item(self):
+        for line in ('{"other": 1}\n', '{"data": [{"value": 1}]}\n',
+                     '{"data": [1]}\n', '{"links": [{"href": "h"}]}\n'):
+            lines = self.lines[:2] + [line]
+            for parse in [
+                    Collection.from_ndjson,
+                    lambda lines: Collection.from_ndjson(lines,
+                                                         compact=True),
+                    lambda lines: list(iter_ndjson_items(lines))]:
+                with self.assertRaises(ValueError) as context:
+                    parse(lines)
+                self.assertIn('Line 3', str(context.exception))
+
+
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.events = []
+        previous = set_metrics_sink(
+            lambda phase, measurements: self.events.append(
+                (phase, measurements)))
+        self.addCleanup(set_metrics_sink, previous)
+        self.document = {
+            'collection': {
+                'version': '1.0',
+                'href': 'http://example.org',
+                'links': [{'href': 'next', 'rel': 'next'}],
+                'items': [
+                    {
+                        'href': 'item%d' % i,
+                        'data': [{'name': 'name', 'value': i},
+                                 {'name': 'other'}],
+                        'links': [{'href': 'avatar', 'rel': 'avatar'}],
+                    } for i in range(3)
+                ],
+                'template': {'data': [{'name': 'name'}]},
+            }
+        }
+        self.data = json.dumps(self.document)
+
+    def test_parse_and_build(self):
+        collection = Collection.from_json(self.data)
+        self.assertEqual([phase for phase, _ in self.events],
+                         ['parse', 'build'])
+        parse, build = [measurements for _, measurements in self.events]
+        self.assertEqual(parse['size'], len(self.data))
+        self.assertEqual(parse['codec'], 'json')
+        self.assertGreaterEqual(parse['seconds'], 0)
+        self.assertEqual(build['items'], 3)
+        # collection, link, template with a data, and items with 2 data
+        # and a link each
+        self.assertEqual(build['objects'], 1 + 1 + 2 + 3 * 4)
+        self.assertEqual(collection.to_dict(), self.document)
+
+    def test_build_modes(self):
+        Collection.from_json(self.data, lazy=True)
+        Collection.from_json(self.data, compact=True)
+        Collection.from_json(self.data, strict=True)
+        builds = [measurements for phase, measurements in self.events
+                  if phase == 'build']
+        self.assertEqual([build['items'] for build in builds], [3, 3, 3])
+        self.assertEqual([build['objects'] for build in builds],
+                         [1, 1 + 1 + 2 + 3 * 2, 1 + 1 + 2 + 3 * 4])
+
+    def test_from_file(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'wb') as fileobj:
+            fileobj.write(self.data.encode('utf-8'))
+        self.addCleanup(os.remove, path)
+        for kwargs in ({}, {'strict': True}):
+            del self.events[:]
+            Collection.from_file(path, **kwargs)
+            self.assertEqual([phase for phase, _ in self.events],
+                             ['parse', 'build'])
+            self.assertEqual(self.events[0][1]['size'], len(self.data))
+            self.assertEqual(self.events[1][1]['items'], 3)
+
+    def test_serialize(self):
+        collection = Collection.from_json(self.data)
+        del self.events[:]
+        text = collection.to_json()
+        self.assertEqual([phase for phase, _ in self.events],
+                         ['to_dict', 'encode'])
+        self.assertEqual(self.events[0][1]['items'], 3)
+        self.assertEqual(self.events[1][1]['size'], len(text))
+        del self.events[:]
+        data = collection.to_json_bytes(cache=True)
+        self.assertEqual(comparable_json(data),
+                         comparable_json(text.encode('utf-8')))
+        self.assertEqual([phase for phase, _ in self.events], ['encode'])
+        self.assertEqual(self.events[0][1]['size'], len(data))
+
+    def test_scan(self):
+        collection = Collection.from_json(self.data)
+        del self.events[:]
+        items = collection.items
+        self.assertEqual(items.get(href='item1').href, 'item1')
+        self.assertEqual(len(items.find(href='item2')), 1)
+        self.assertEqual(self.events, [
+            ('scan', {'array': 'items', 'size': 3, 'elements': 2}),
+            ('scan', {'array': 'items', 'size': 3, 'elements': 3}),
+        ])
+
+    def test_no_sink(self):
+        set_metrics_sink(None)
+        collection = Collection.from_json(self.data)
+        collection.to_json()
+        collection.items.find(href='item1')
+        self.assertEqual(self.events, [])
+
+    def test_recorder(self):
+        with MetricsRecorder() as metrics:
+            for _ in range(2):
+                Collection.from_json(self.data).to_json()
+        self.assertEqual(self.events, [])
+        self.assertEqual(sorted(metrics.totals),
+                         ['build', 'encode', 'parse', 'to_dict'])
+        self.assertEqual(metrics.totals['parse']['calls'], 2)
+        self.assertEqual(metrics.totals['parse']['size'], 2 * len(self.data))
+        self.assertEqual(metrics.totals['build']['items'], 6)
+        self.assertNotIn('codec', metrics.totals['parse'])
+        Collection.from_json(self.data)
+        self.assertEqual(len(self.events), 2)
+        metrics.reset()
+        self.assertEqual(metrics.totals, {})
+
+
+class PageServer(ThreadingMixIn, HTTPServer):
+
+    """Local HTTP server serving a paginated collection.
+
+    Page n is served at /pages/n and links to the next page, up to the number
+    of pages. Other documents can be added to `documents`, by path. Requested
+    paths are recorded in `requests`, and accepted connections are counted
+    in `connections`. Responses have an ETag, and conditional requests for
+    unchanged documents get a 304 response. Documents are served with the
+    status in `statuses` for their path, if any, and 200 otherwise.
+
+    """
+
+    daemon_threads = True
+
+    class Handler(BaseHTTPRequestHandler):
+
+        protocol_version = 'HTTP/1.1'
+        # headers and body are sent separately, don't delay the body
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            BaseHTTPRequestHandler.setup(self)
+            self.server.connections.append(self.client_address)
+
+        def do_GET(self):
+            self.server.requests.append(self.path)
+            body = self.server.documents.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = json.dumps(body).encode('utf-8')
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(self.server.statuses.get(self.path, 200))
+            self.send_header('ETag', etag)
+            self.send_header('Content-Type', collection_json.MEDIA_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    def __init__(self, pages):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), self.Handler)
+        self.requests = []
+        self.connections = []
+        self.documents = {}
+        self.statuses = {}
+        for n in range(1, pages + 1):
+            links = []
+            if n < pages:
+                # relative link, resolved against the page href
+                links.append({'href': str(n + 1), 'rel': 'next'})
+            self.documents['/pages/%d' % n] = {'collection': {
+                'href': self.url('/pages/%d' % n),
+                'links': links,
+                'items': [{'href': self.url('/items/%d' % n)}],
+            }}
+        self.thread = threading.Thread(target=self.serve_forever,
+                                       kwargs={'poll_interval': 0.01})
+        self.thread.daemon = True
+        self.thread.start()
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d%s' % (self.server_address[1], path)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+
+class IterPagesTestCase(TestCase):
+
+    def setUp(self):
+        self.server = PageServer(5)
+        self.addCleanup(self.server.stop)
+        self.fetched = []
+
+    def fetch(self, href):
+        self.fetched.append(href)
+        path = href[href.index('/pages'):]
+        return json.dumps(self.server.documents[path])
+
+    def test_follows_next_links(self):
+        pages = list(iter_pages(self.server.url('/pages/1')))
+        self.assertEqual([page.items[0].href for page in pages],
+                         [self.server.url('/items/%d' % n)
+                          for n in range(1, 6)])
+        self.assertEqual(self.server.requests,
+                         ['/pages/%d' % n for n in range(1, 6)])
+
+    def test_prefetches_pages(self):
+        pages = iter_pages(self.server.url('/pages/1'), self.fetch,
+                           prefetch=2)
+        next(pages)
+        deadline = time.time() + 5
+        while len(self.fetched) < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        # the page being processed and two queued ones, the fourth page
+        # waits for room in the queue
+        self.assertEqual(len(self.fetched), 4)
+        self.assertEqual(len(list(pages)), 4)
+
+    def test_close_stops_fetching(self):
+        self.server.documents['/pages/5']['collection']['links'] = [
+            {'href': '1', 'rel': 'next'}]
+        pages = iter_pages(self.server.url('/pages/1'), self.fetch,
+                           prefetch=1)
+        next(pages)
+        pages.close()
+        time.sleep(0.2)
+        self.assertLessEqual(len(self.fetched), 3)
+
+    def test_stops_at_seen_page(self):
+        self.server.documents['/pages/5']['collection']['links'] = [
+            {'href': self.server.url('/pages/2'), 'rel': 'next'}]
+        pages = list(iter_pages(self.server.url('/pages/1')))
+        self.assertEqual(len(pages), 5)
+
+    def test_stops_at_error(self):
+        document = self.server.documents['/pages/3']['collection']
+        document['error'] = {'code': '500', 'message': 'failed'}
+        pages = list(iter_pages(self.server.url('/pages/1')))
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(pages[-1].error.code, '500')
+
+    def test_fetch_error(self):
+        del self.server.documents['/pages/3']
+        pages = list(iter_pages(self.server.url('/pages/1')))
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(pages[-1].href, self.server.url('/pages/3'))
+        self.assertEqual(pages[-1].error, Error('404', title='Not Found'))
+
+    def test_fetch_error_document(self):
+        self.server.statuses['/pages/2'] = 503
+        self.server.documents['/pages/2'] = {'collection': {
+            'href': self.server.url('/pages/2'),
+            'error': {'code': 'busy', 'message': 'Try again later'}}}
+        pages = list(iter_pages(self.server.url('/pages/1')))
+        self.assertEqual(len(pages), 2)
+        self.assertEqual(pages[-1].error.message, 'Try again later')
+
+    def test_fetch_error_raised(self):
+        def fetch(href):
+            raise HTTPError(href, 500, 'Server Error', {}, io.BytesIO(
+                b'<html>failed</html>'))
+
+        pages = list(iter_pages(self.server.url('/pages/1'), fetch))
+        self.assertEqual(len(pages), 1)
+        self.assertEqual(pages[0].error, Error('500', title='Server Error'))
+
+    def test_invalid_page(self):
+        self.server.documents['/pages/2'] = {}
+        pages = iter_pages(self.server.url('/pages/1'), prefetch=0)
+        next(pages)
+        with self.assertRaises(ValueError):
+            next(pages)
+
+    def test_other_rel(self):
+        document = self.server.documents['/pages/1']['collection']
+        document['links'] = [{'href': '4', 'rel': 'last'}]
+        pages = list(iter_pages(self.server.url('/pages/1'), rel='last'))
+        self.assertEqual(len(pages), 2)
+
+
+class FakeTransport(object):
+
+    """Transport serving documents by href after a delay.
+
+    Records the fetched hrefs and the most requests in flight per host.
+
+    """
+
+    def __init__(self, documents, delay=0.01):
+        self.documents = documents
+        self.delay = delay
+        self.fetched = []
+        self.active = {}
+        self.most_active = {}
+
+    def fetch(self, href):
+        self.fetched.append(href)
+        host = href.split('/')[2]
+        self.active[host] = self.active.get(host, 0) + 1
+        self.most_active[host] = max(self.most_active.get(host, 0),
+                                     self.active[host])
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        def finish():
+            self.active[host] -= 1
+            if future.cancelled():
+                return
+            document = self.documents.get(href)
+            if document is None:
+                future.set_exception(IOError('HTTP 404 for %s' % href))
+            else:
+                future.set_result(json.dumps(document))
+        loop.call_later(self.delay, finish)
+        return future
+
+
+def crawl(crawler, *hrefs):
+    """Return the collections crawled from hrefs, run in a new event loop."""
+    loop = asyncio.new_event_loop()
+    results = crawler.crawl(*hrefs)
+    collections = []
+    try:
+        while True:
+            try:
+                collections.append(
+                    loop.run_until_complete(results.__anext__()))
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.close()
+    return collections
+
+
+@skipUnless(collection_json_aio is not None, 'asyncio is not available')
+class CrawlerTestCase(TestCase):
+
+    def setUp(self):
+        self.server = PageServer(3)
+        self.addCleanup(self.server.stop)
+        url = self.server.url
+        self.server.documents['/'] = {'collection': {
+            'href': url('/'),
+            'links': [
+                {'href': '/pages/1', 'rel': 'pages'},
+                {'href': url('/pages/1').replace('http', 'HTTP') + '#top',
+                 'rel': 'pages'},
+                {'href': 'http://example.org/', 'rel': 'external'},
+            ],
+        }}
+        for n in (1, 2):
+            self.server.documents['/items/%d' % n] = {'collection': {
+                'href': url('/items/%d' % n),
+                'items': [{'href': url('/items/%d' % n)}],
+            }}
+
+    def test_crawl(self):
+        crawler = collection_json_aio.Crawler()
+        collections = crawl(crawler, self.server.url('/'))
+        self.assertEqual(
+            sorted(collection.href for collection in collections),
+            sorted(self.server.url(path) for path in [
+                '/', '/pages/1', '/pages/2', '/pages/3', '/items/1',
+                '/items/2']))
+        self.assertEqual(list(crawler.failures),
+                         [self.server.url('/items/3')])
+        self.assertIsInstance(crawler.failures[self.server.url('/items/3')],
+                              IOError)
+        requests = self.server.requests
+        self.assertEqual(len(requests), 7)
+        self.assertEqual(len(set(requests)), 7)
+        # connections are kept alive and reused
+        self.assertLess(len(self.server.connections), len(requests))
+
+    def test_rels(self):
+        transport = FakeTransport(self._documents())
+        crawler = collection_json_aio.Crawler(transport, rels=['next'],
+                                              follow_items=False)
+        collections = crawl(crawler, self.server.url('/pages/1'))
+        self.assertEqual(len(collections), 3)
+        self.assertEqual(transport.fetched,
+                         [self.server.url('/pages/%d' % n)
+                          for n in (1, 2, 3)])
+
+    def test_max_per_host(self):
+        documents = {'http://a/': {'collection': {
+            'href': 'http://a/',
+            'items': [{'href': 'http://%s/%d' % (host, n)}
+                      for n in range(20) for host in 'ab'],
+        }}}
+        for n in range(20):
+            for host in 'ab':
+                href = 'http://%s/%d' % (host, n)
+                documents[href] = {'collection': {'href': href}}
+        transport = FakeTransport(documents)
+        crawler = collection_json_aio.Crawler(transport, hosts=['a', 'b'],
+                                              max_per_host=3)
+        collections = crawl(crawler, 'http://a/')
+        self.assertEqual(len(collections), 41)
+        self.assertEqual(transport.most_active, {'a': 3, 'b': 3})
+
+    def test_max_documents(self):
+        transport = FakeTransport(self._documents())
+        crawler = collection_json_aio.Crawler(transport, max_documents=2)
+        self.assertEqual(len(crawl(crawler, self.server.url('/'))), 2)
+        self.assertEqual(len(transport.fetched), 2)
+
+    def test_close(self):
+        transport = FakeTransport(self._documents(), delay=0.1)
+        crawler = collection_json_aio.Crawler(transport)
+        loop = asyncio.new_event_loop()
+        results = crawler.crawl(self.server.url('/'))
+        try:
+            loop.run_until_complete(results.__anext__())
+            loop.run_until_complete(results.aclose())
+        finally:
+            loop.close()
+        # the root and the page it links to, which never completes
+        self.assertLessEqual(len(transport.fetched), 2)
+
+    def _documents(self):
+        return dict((self.server.url(path), document) for path, document
+                    in self.server.documents.items())
+
+
+def read_response(data, **limits):
+    """Return the response read from data, run in a new event loop."""
+    loop = asyncio.new_event_loop()
+    reader = asyncio.StreamReader(loop=loop)
+    reader.feed_data(data)
+    reader.feed_eof()
+    try:
+        return loop.run_until_complete(
+            collection_json_aio._read_response(reader, **limits))
+    finally:
+        loop.close()
+
+
+class RedirectTransport(object if collection_json_aio is None else
+                        collection_json_aio.HTTPTransport):
+
+    """HTTPTransport answering every request with a redirect to location."""
+
+    def __init__(self, location, **kwargs):
+        super(RedirectTransport, self).__init__(**kwargs)
+        self.location = location
+        self.requested = []
+
+    def _request(self, href):
+        self.requested.append(href)
+        future = asyncio.get_event_loop().create_future()
+        future.set_result((302, {'location': self.location}, b''))
+        return future
+
+
+def fetch(transport, href):
+    """Return the document fetched by transport, run in a new event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(transport.fetch(href))
+    finally:
+        loop.run_until_complete(transport.close())
+        loop.close()
+
+
+@skipUnless(collection_json_aio is not None, 'asyncio is not available')
+class HTTPTransportTestCase(TestCase):
+
+    def test_read_response(self):
+        status, headers, body, keep_alive = read_response(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}')
+        self.assertEqual((status, body, keep_alive), (200, b'{}', True))
+        self.assertEqual(headers, {'content-length': '2'})
+        status, headers, body, keep_alive = read_response(
+            b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+            b'1\r\n{\r\n1;ext=1\r\n}\r\n0\r\nX-Trailer: 1\r\n\r\n')
+        self.assertEqual(body, b'{}')
+        status, headers, body, keep_alive = read_response(
+            b'HTTP/1.0 200 OK\r\n\r\n{}')
+        self.assertEqual((body, keep_alive), (b'{}', False))
+
+    def test_malformed_response(self):
+        for data in [
+                b'garbage\r\n\r\n',
+                b'HTTP/1.1 OK\r\n\r\n',
+                b'HTTP/1.1 200 OK\r\nno colon\r\n\r\n',
+                b'HTTP/1.1 200 OK\r\nContent-Length: 2',
+                b'HTTP/1.1 200 OK\r\nContent-Length: -1\r\n\r\n',
+                b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'zz\r\n',
+                b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'1\r\n{}\r\n0\r\n\r\n']:
+            with self.assertRaises(collection_json_aio.ProtocolError):
+                read_response(data)
+        with self.assertRaises(EOFError):
+            read_response(b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\n{}')
+
+    def test_header_limit(self):
+        data = b'HTTP/1.1 200 OK\r\nX-Long: ' + b'a' * 100 + b'\r\n\r\n'
+        read_response(data, max_header_size=200)
+        with self.assertRaises(collection_json_aio.ProtocolError):
+            read_response(data, max_header_size=100)
+        with self.assertRaises(collection_json_aio.ProtocolError):
+            read_response(b'HTTP/1.1 200 OK\r\nX-Long: ' + b'a' * 2 ** 17 +
+                          b'\r\n\r\n', max_header_size=2 ** 18)
+
+    def test_body_limit(self):
+        for data in [
+                b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\n12345',
+                b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'3\r\n123\r\n2\r\n45\r\n0\r\n\r\n',
+                b'HTTP/1.0 200 OK\r\n\r\n12345']:
+            self.assertEqual(read_response(data, max_body_size=5)[2],
+                             b'12345')
+            with self.assertRaises(collection_json_aio.ProtocolError):
+                read_response(data, max_body_size=4)
+
+    def test_body_limit_server(self):
+        server = PageServer(1)
+        self.addCleanup(server.stop)
+        transport = collection_json_aio.HTTPTransport(max_body_size=10)
+        with self.assertRaises(collection_json_aio.ProtocolError):
+            fetch(transport, server.url('/pages/1'))
+
+    def test_redirect_limit(self):
+        transport = RedirectTransport('/other', max_redirects=3)
+        with self.assertRaises(IOError):
+            fetch(transport, 'http://example.org/')
+        self.assertEqual(len(transport.requested), 4)
+
+    def test_redirect_across_schemes(self):
+        transport = RedirectTransport('https://example.org/')
+        with self.assertRaises(IOError):
+            fetch(transport, 'http://example.org/')
+        # the limit counts the redirects of every scheme
+        self.assertEqual(len(transport.requested), 6)
+        for location in ['http://example.org/', 'ftp://example.org/']:
+            transport = RedirectTransport(location)
+            with self.assertRaises(IOError):
+                fetch(transport, 'https://example.org/')
+            self.assertEqual(transport.requested, ['https://example.org/'])
+
+
+@skipUnless(aiohttp is not None, 'aiohttp is not installed')
+class AiohttpTransportTestCase(TestCase):
+
+    def test_fetch(self):
+        server = PageServer(1)
+        self.addCleanup(server.stop)
+        transport = collection_json_aio.AiohttpTransport()
+        body = fetch(transport, server.url('/pages/1'))
+        self.assertEqual(json.loads(body.decode('utf-8')),
+                         server.documents['/pages/1'])
+        with self.assertRaises(IOError):
+            fetch(collection_json_aio.AiohttpTransport(),
+                  server.url('/missing'))
+
+    def test_body_limit_server(self):
+        server = PageServer(1)
+        self.addCleanup(server.stop)
+        transport = collection_json_aio.AiohttpTransport(max_body_size=10)
+        with self.assertRaises(collection_json_aio.ProtocolError):
+            fetch(transport, server.url('/pages/1'))
+
+
+class HydrateTestCase(TestCase):
+
+    def setUp(self):
+        self.server = PageServer(0)
+        self.addCleanup(self.server.stop)
+        url = self.server.url
+        for n in range(5):
+            self.server.documents['/items/%d' % n] = {'collection': {
+                'href': url('/items/'),
+                'items': [
+                    {'href': url('/items/%d' % n),
+                     'data': [{'name': 'id', 'value': n}]},
+                ],
+            }}
+        self.items = Array(Item, 'items', [
+            {'href': url('/items/%d' % n)} for n in range(6)] + [{}])
+
+    def test_hydrate(self):
+        failures = hydrate(self.items, max_workers=3)
+        self.assertEqual([item.id.value for item in self.items[:5]],
+                         list(range(5)))
+        self.assertEqual(list(failures), [5])
+        # the 404 response parsed as a collection with an error
+        self.assertIsInstance(failures[5], ValueError)
+        self.assertIn('404', str(failures[5]))
+        self.assertEqual(self.items[5].href, self.server.url('/items/5'))
+        self.assertEqual(self.items[6], Item())
+        self.assertEqual(len(self.server.requests), 6)
+
+    def test_max_workers(self):
+        for max_workers in (0, -1):
+            with self.assertRaises(ValueError):
+                hydrate(self.items, max_workers=max_workers)
+        self.assertEqual(len(self.server.requests), 0)
+
+    def test_data_named_hydrate(self):
+        item = Item(data=[Data('hydrate', 'value')])
+        self.assertEqual(item.hydrate.value, 'value')
+        self.assertEqual(hydrate(Array(Item, 'items', [item])), {})
+
+    def test_hydrate_concurrently(self):
+        lock = threading.Lock()
+        active = []
+        most_active = []
+
+        def fetch(href):
+            with lock:
+                active.append(href)
+                most_active.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.remove(href)
+            return json.dumps({'collection': {
+                'href': href, 'items': [{'href': href}]}})
+
+        failures = hydrate(self.items, fetch, max_workers=2)
+        self.assertEqual(failures, {})
+        self.assertEqual(max(most_active), 2)
+
+    def test_hydrate_picks_item_by_href(self):
+        document = self.server.documents['/items/1']['collection']
+        document['items'].insert(0, {'href': self.server.url('/items/0')})
+        document['items'].append({'href': self.server.url('/other')})
+        hydrate(self.items)
+        self.assertEqual(self.items[1].id.value, 1)
+
+    def test_hydrate_error_document(self):
+        document = self.server.documents['/items/2']['collection']
+        document['error'] = {'code': '500', 'message': 'failed'}
+        document['items'] = []
+        failures = hydrate(self.items)
+        self.assertEqual(sorted(failures), [2, 5])
+        self.assertIsInstance(failures[2], ValueError)
+
+    def test_hydrate_returned_collection(self):
+        url = self.server.url
+        shared = Collection(url('/items/'), items=[
+            {'href': url('/items/%d' % n)} for n in range(2)])
+
+        def fetch(href):
+            return shared
+        items = Array(Item, 'items', [{'href': url('/items/1')}])
+        self.assertEqual(hydrate(items, fetch), {})
+        self.assertEqual(items[0], shared.items[1])
+        self.assertIsNot(items[0], shared.items[1])
+        items[0].href = 'changed'
+        self.assertEqual(shared.items[1].href, url('/items/1'))
+
+    def test_hydrate_lazy_collection(self):
+        collection = Collection('href', items=self.items[:2])
+        collection = Collection.from_json(str(collection), lazy=True)
+        hydrate(collection.items)
+        self.assertEqual(collection.to_dict()['collection']['items'][1], {
+            'href': self.server.url('/items/1'),
+            'data': [{'name': 'id', 'value': 1}],
+        })
+
+
+class CollectionCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.server = PageServer(3)
+        self.addCleanup(self.server.stop)
+        self.loads = []
+
+        def loads(data):
+            self.loads.append(data)
+            return json.loads(data)
+        register_codec(JSONCodec('counting', loads, json.dumps))
+        self.addCleanup(collection_json._codecs.pop, 'counting')
+
+    def test_not_modified(self):
+        cache = CollectionCache(codec='counting')
+        href = self.server.url('/pages/1')
+        collection = cache.get(href)
+        self.assertEqual(cache.get(href), collection)
+        self.assertEqual(cache.get(href + '#fragment'), collection)
+        self.assertEqual(len(self.loads), 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertIn(href, cache)
+
+    def test_modified(self):
+        cache = CollectionCache(codec='counting')
+        href = self.server.url('/pages/1')
+        collection = cache.get(href)
+        self.server.documents['/pages/1']['collection']['items'] = []
+        changed = cache.get(href)
+        self.assertIsNot(changed, collection)
+        self.assertEqual(changed.items, Array(Item, 'items', []))
+        self.assertEqual(cache.get(href), changed)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertEqual(len(cache), 1)
+
+    def test_last_modified(self):
+        requests = []
+
+        def fetch(href, headers):
+            requests.append(headers)
+            if headers.get('If-Modified-Since') == 'yesterday':
+                return 304, {}, b''
+            return 200, {'last-modified': 'yesterday'}, json.dumps(
+                {'collection': {'href': href}})
+        cache = CollectionCache(fetch)
+        collection = cache.get('http://example.org/')
+        self.assertEqual(cache.get('http://example.org/'), collection)
+        self.assertEqual(requests, [{}, {'If-Modified-Since': 'yesterday'}])
+
+    def test_copies(self):
+        cache = CollectionCache()
+        href = self.server.url('/pages/1')
+        first = cache.get(href)
+        second = cache.get(href)
+        self.assertIsNot(second, first)
+        first.items[0].href = 'changed'
+        first.items.append(Item('other'))
+        first.to_dict(cache=True)['collection']['links'].append({})
+        for collection in (second, cache.get(href)):
+            self.assertEqual(collection.to_dict(),
+                             self.server.documents['/pages/1'])
+
+    def test_without_validators(self):
+        def fetch(href, headers):
+            return 200, {}, json.dumps({'collection': {'href': href}})
+        cache = CollectionCache(fetch)
+        cache.get('http://example.org/')
+        self.assertEqual(len(cache), 0)
+
+    def test_max_entries(self):
+        cache = CollectionCache(max_entries=2)
+        first, second, third = [self.server.url('/pages/%d' % n)
+                                for n in (1, 2, 3)]
+        cache.get(first)
+        cache.get(second)
+        # first becomes the most recently used one
+        cache.get(first)
+        cache.get(third)
+        self.assertIn(first, cache)
+        self.assertNotIn(second, cache)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_max_size(self):
+        cache = CollectionCache()
+        cache.get(self.server.url('/pages/1'))
+        size = cache.size
+        cache = CollectionCache(max_size=size)
+        for n in (1, 2, 3):
+            cache.get(self.server.url('/pages/%d' % n))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.evictions, 2)
+        self.assertLessEqual(cache.size, size)
+        cache = CollectionCache(max_size=size - 1)
+        cache.get(self.server.url('/pages/1'))
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+    def test_error_status(self):
+        cache = CollectionCache()
+        with self.assertRaises(IOError):
+            cache.get(self.server.url('/missing'))
+
+    def test_discard_and_clear(self):
+        cache = CollectionCache()
+        for n in (1, 2):
+            cache.get(self.server.url('/pages/%d' % n))
+        cache.discard(self.server.url('/pages/1'))
+        self.assertEqual(len(cache), 1)
+        cache.clear()
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+    def test_as_fetch(self):
+        cache = CollectionCache()
+        pages = list(iter_pages(self.server.url('/pages/1'), cache.get))
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(
+            [page.href for page in iter_pages(self.server.url('/pages/1'),
+                                              cache.get)],
+            [page.href for page in pages])
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+        items = Array(Item, 'items', [
+            {'href': self.server.url('/pages/%d' % n)} for n in (1, 2)])
+        self.assertEqual(hydrate(items, cache.get), {})
+        self.assertEqual(items[0], pages[0].items[0])
+        self.assertIsNot(items[0], pages[0].items[0])